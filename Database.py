@@ -1,49 +1,362 @@
+import base64
+import json
+import os
+import queue
+import re
 import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from operator import itemgetter
 
-# Database configuration
-DATABASE = "hdb_flats.db"
+from metrics import metrics
+from queryTrace import TracingConnection, query_tracer
+from scoreCalculator import score_calculator
+
+# Database configuration; point HDB_DATABASE elsewhere to serve another file
+DATABASE = os.environ.get("HDB_DATABASE", "hdb_flats.db")
+
+# Maximum number of idle connections kept open for reuse
+POOL_SIZE = 8
+
+# Pragmas applied to every pooled connection when it is opened
+CONNECTION_PRAGMAS = {
+    "journal_mode": "WAL",  # readers no longer block on the writer
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+    "cache_size": -32768,  # 32 MB page cache
+    "mmap_size": 268435456,  # 256 MB memory-mapped I/O
+}
+
+# Columns written by the ingest path, in insert order
+FLAT_COLUMNS = (
+    "town",
+    "flat_type",
+    "block",
+    "street_name",
+    "storey_range",
+    "floor_area_sqm",
+    "flat_model",
+    "lease_commence_date",
+    "resale_price",
+    "room_count",
+    "storey_mid",
+    "model_category",
+)
+
+# Columns derived from the text fields at ingest (see
+# ScoreCalculator.derive_columns), with their SQL types
+DERIVED_COLUMNS = {
+    "room_count": "INTEGER",
+    "storey_mid": "REAL",
+    "model_category": "TEXT",
+}
+
+# Bookkeeping columns written by the ingest path so a refresh can tell new
+# source rows from ones already loaded (see Database.sync_flats)
+SYNC_COLUMNS = {
+    "source_key": "TEXT",  # hash identifying the source record
+    "row_hash": "TEXT",  # hash of the source record's contents
+}
+
+# Known values of the categorical columns. Filters on these are matched
+# exactly so SQLite can answer them from an index instead of a LIKE scan.
+TOWNS = (
+    "ANG MO KIO",
+    "BEDOK",
+    "BISHAN",
+    "BUKIT BATOK",
+    "BUKIT MERAH",
+    "BUKIT PANJANG",
+    "BUKIT TIMAH",
+    "CENTRAL AREA",
+    "CHOA CHU KANG",
+    "CLEMENTI",
+    "GEYLANG",
+    "HOUGANG",
+    "JURONG EAST",
+    "JURONG WEST",
+    "KALLANG/WHAMPOA",
+    "MARINE PARADE",
+    "PASIR RIS",
+    "PUNGGOL",
+    "QUEENSTOWN",
+    "SEMBAWANG",
+    "SENGKANG",
+    "SERANGOON",
+    "TAMPINES",
+    "TOA PAYOH",
+    "WOODLANDS",
+    "YISHUN",
+)
+FLAT_TYPES = (
+    "1 ROOM",
+    "2 ROOM",
+    "3 ROOM",
+    "4 ROOM",
+    "5 ROOM",
+    "EXECUTIVE",
+    "MULTI-GENERATION",
+)
+
+# Secondary indexes on hdb_flats, shaped for the price-ordered search filters
+INDEXES = {
+    "idx_hdb_flats_town_type_price": "town, flat_type, resale_price DESC",
+    # Town-only searches, the most common filter, read this in price order
+    "idx_hdb_flats_town_price": "town, resale_price DESC",
+    "idx_hdb_flats_type_price": "flat_type, resale_price DESC",
+    "idx_hdb_flats_price": "resale_price DESC",
+    # Covers the sync lookup, so it never reads the table pages
+    "idx_hdb_flats_source_key": "source_key, row_hash",
+}
+
+# Full-text index over the columns matched by the free-text search. It is an
+# external-content table, so it stores only the index, not a copy of the rows.
+FTS_TABLE = "hdb_flats_fts"
+FTS_COLUMNS = ("town", "street_name", "block")
+
+# Host parameters per statement, kept at SQLite's most conservative limit
+MAX_VARIABLES = 999
+
+# Key/value table holding dataset bookkeeping such as the data version
+METADATA_TABLE = "hdb_metadata"
+
+# Maximum number of cached search result counts
+COUNT_CACHE_SIZE = 1024
+
+# Pragmas applied for the duration of a bulk load. The data can always be
+# re-downloaded, so durability is traded for speed until the load commits.
+BULK_LOAD_PRAGMAS = {
+    "synchronous": "OFF",
+    "temp_store": "MEMORY",
+    "cache_size": -65536,  # 64 MB
+}
 
 
 class Database:
-    """Database connection handler"""
+    """Database connection handler backed by a pool of long-lived connections"""
 
-    def __init__(self, db_path=DATABASE):
+    def __init__(self, db_path=DATABASE, pool_size=POOL_SIZE):
         self.db_path = db_path
-        self.connection = None
+        self.pool_size = pool_size
+        self._pool = queue.LifoQueue()
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._count_cache = OrderedDict()
+        self._count_cache_lock = threading.Lock()
+        self._score_values = None
+
+    def _open_connection(self):
+        """Open a new connection with the pool pragmas and query tracing"""
+        connection = sqlite3.connect(
+            self.db_path, check_same_thread=False, factory=TracingConnection
+        )
+        connection.row_factory = sqlite3.Row
+        for name, value in CONNECTION_PRAGMAS.items():
+            connection.execute(f"PRAGMA {name} = {value}")
+        return connection
 
-    def connect(self):
-        """Establish a database connection"""
-        if self.connection is None:
-            self.connection = sqlite3.connect(self.db_path)
-            self.connection.row_factory = sqlite3.Row
+    def _check_pid(self):
+        """Drop connections inherited from a parent process after a fork"""
+        if os.getpid() != self._pid:
+            self._pool = queue.LifoQueue()
+            self._local = threading.local()
+            self._pid = os.getpid()
+
+    @contextmanager
+    def checkout(self):
+        """
+        Borrow a connection from the pool for the current thread.
+
+        Nested checkouts on the same thread reuse the connection that is
+        already held, so callers can compose Database methods freely. The
+        connection is returned to the pool (or closed if the pool is full)
+        when the outermost block exits.
+        """
+        self._check_pid()
+        held = getattr(self._local, "connection", None)
+        if held is not None:
+            yield held
+            return
+
+        try:
+            connection = self._pool.get_nowait()
+        except queue.Empty:
+            connection = self._open_connection()
+
+        self._local.connection = connection
+        try:
+            with metrics.timed("database"):
+                yield connection
+        finally:
+            self._local.connection = None
+            if connection.in_transaction:
+                connection.rollback()
+            if self._pool.qsize() < self.pool_size:
+                self._pool.put(connection)
+            else:
+                connection.close()
 
     def close(self):
-        """Close the database connection"""
-        if self.connection:
-            self.connection.close()
-            self.connection = None
+        """Close every idle pooled connection"""
+        while True:
+            try:
+                connection = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            connection.close()
 
     def initdb(self):
         """Initialize the database with HDB flats table"""
-        self.connect()
-        self.connection.execute(
+        with self.checkout() as connection, query_tracer.quiet():
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS hdb_flats (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    town TEXT NOT NULL,
+                    flat_type TEXT NOT NULL,
+                    block TEXT NOT NULL,
+                    street_name TEXT NOT NULL,
+                    storey_range TEXT NOT NULL,
+                    floor_area_sqm REAL,
+                    flat_model TEXT,
+                    lease_commence_date INTEGER,
+                    resale_price REAL,
+                    room_count INTEGER,
+                    storey_mid REAL,
+                    model_category TEXT,
+                    source_key TEXT,
+                    row_hash TEXT
+                    )
+            """
+            )
+            self._add_derived_columns(connection)
+            self._add_sync_columns(connection)
+            self._create_indexes(connection)
+
+            fts_exists = connection.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name=?",
+                (FTS_TABLE,),
+            ).fetchone()
+            connection.execute(
+                f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+                    {", ".join(FTS_COLUMNS)},
+                    content='hdb_flats',
+                    content_rowid='id'
+                    )
             """
-            CREATE TABLE IF NOT EXISTS hdb_flats (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                town TEXT NOT NULL,
-                flat_type TEXT NOT NULL,
-                block TEXT NOT NULL,
-                street_name TEXT NOT NULL,
-                storey_range TEXT NOT NULL,
-                floor_area_sqm REAL,
-                flat_model TEXT,
-                lease_commence_date INTEGER,
-                resale_price REAL
+            )
+            # Index rows loaded before the full-text table existed
+            if fts_exists is None:
+                connection.execute(
+                    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
                 )
+
+            connection.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {METADATA_TABLE} (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                    )
+            """
+            )
+            connection.commit()
+
+    def data_version(self):
+        """Return the dataset version, which every write to hdb_flats bumps"""
+        with self.checkout() as connection:
+            row = connection.execute(
+                f"SELECT value FROM {METADATA_TABLE} WHERE key = 'data_version'"
+            ).fetchone()
+        return int(row["value"]) if row else 0
+
+    def _bump_data_version(self, connection):
+        """Increment the dataset version inside the caller's transaction"""
+        connection.execute(
+            f"""
+            INSERT INTO {METADATA_TABLE} (key, value) VALUES ('data_version', 1)
+            ON CONFLICT(key) DO UPDATE SET value = value + 1
         """
         )
-        self.connection.commit()
-        self.close()
+
+    def _add_derived_columns(self, connection):
+        """Add and backfill derived columns missing from an older database"""
+        existing = {
+            row["name"] for row in connection.execute("PRAGMA table_info(hdb_flats)")
+        }
+        for column, sql_type in DERIVED_COLUMNS.items():
+            if column in existing:
+                continue
+            connection.execute(f"ALTER TABLE hdb_flats ADD COLUMN {column} {sql_type}")
+
+            # Derived values depend on one text column, so derive each
+            # distinct value once and update all of its rows together
+            source, derive = score_calculator.derived_columns[column]
+            values = [
+                row[0]
+                for row in connection.execute(
+                    f"SELECT DISTINCT {source} FROM hdb_flats WHERE {source} != ''"
+                )
+            ]
+            connection.executemany(
+                f"UPDATE hdb_flats SET {column} = ? WHERE {source} = ?",
+                [(derive(value), value) for value in values],
+            )
+
+    def _add_sync_columns(self, connection):
+        """Add sync bookkeeping columns missing from an older database"""
+        existing = {
+            row["name"] for row in connection.execute("PRAGMA table_info(hdb_flats)")
+        }
+        for column, sql_type in SYNC_COLUMNS.items():
+            if column not in existing:
+                connection.execute(
+                    f"ALTER TABLE hdb_flats ADD COLUMN {column} {sql_type}"
+                )
+
+    def get_metadata(self, key, default=None):
+        """Return a value from the metadata table, or default if unset"""
+        with self.checkout() as connection:
+            row = connection.execute(
+                f"SELECT value FROM {METADATA_TABLE} WHERE key = ?", (key,)
+            ).fetchone()
+        return row["value"] if row else default
+
+    def set_metadata(self, values):
+        """Store key/value pairs in the metadata table"""
+        with self.checkout() as connection:
+            self._set_metadata(connection, values)
+            connection.commit()
+
+    def _set_metadata(self, connection, values):
+        """Store key/value pairs inside the caller's transaction"""
+        connection.executemany(
+            f"""
+            INSERT INTO {METADATA_TABLE} (key, value) VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        """,
+            [
+                (key, None if value is None else str(value))
+                for key, value in values.items()
+            ],
+        )
+
+    def _index_text(self, connection, after_id=0):
+        """Add flats with an id greater than after_id to the full-text index"""
+        columns = ", ".join(FTS_COLUMNS)
+        connection.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, {columns}) "
+            f"SELECT id, {columns} FROM hdb_flats WHERE id > ?",
+            (after_id,),
+        )
+
+    def _create_indexes(self, connection):
+        """Create any missing secondary indexes on hdb_flats"""
+        for name, columns in INDEXES.items():
+            connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {name} ON hdb_flats ({columns})"
+            )
 
     def insert_flat(
         self,
@@ -58,104 +371,650 @@ class Database:
         resale_price,
     ):
         """Insert a new flat record into the database"""
-        self.connect()
-        self.connection.execute(
-            """
-            INSERT INTO hdb_flats (town, flat_type, block, street_name, storey_range,
-                                   floor_area_sqm, flat_model, lease_commence_date,
-                                   resale_price)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-            (
-                town,
-                flat_type,
-                block,
-                street_name,
-                storey_range,
-                floor_area_sqm,
-                flat_model,
-                lease_commence_date,
-                resale_price,
-            ),
+        derived = score_calculator.derive_columns(
+            {
+                "flat_type": flat_type,
+                "storey_range": storey_range,
+                "flat_model": flat_model,
+            }
+        )
+        with self.checkout() as connection:
+            cursor = connection.execute(
+                """
+                INSERT INTO hdb_flats (town, flat_type, block, street_name, storey_range,
+                                       floor_area_sqm, flat_model, lease_commence_date,
+                                       resale_price, room_count, storey_mid,
+                                       model_category)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+                (
+                    town,
+                    flat_type,
+                    block,
+                    street_name,
+                    storey_range,
+                    floor_area_sqm,
+                    flat_model,
+                    lease_commence_date,
+                    resale_price,
+                    derived["room_count"],
+                    derived["storey_mid"],
+                    derived["model_category"],
+                ),
+            )
+            self._index_text(connection, cursor.lastrowid - 1)
+            self._bump_data_version(connection)
+            connection.commit()
+
+    def bulk_insert_flats(
+        self,
+        flats,
+        batch_size=10000,
+        progress=None,
+        columns=FLAT_COLUMNS,
+        replace=False,
+        metadata=None,
+    ):
+        """
+        Insert many flat records in a single transaction.
+
+        If the load fails, everything is rolled back: the rows, the dropped
+        indexes and, with replace, the deleted flats.
+
+        Args:
+            flats: Iterable of dicts keyed by columns
+            batch_size: Number of rows handed to each executemany call
+            progress: Optional callable receiving the row count of each batch
+            columns: Columns to insert; FLAT_COLUMNS includes the derived
+                columns from ScoreCalculator.derive_columns, and the sync
+                columns may be added to them
+            replace: Delete every existing flat first, in the same
+                transaction, so a failed reload keeps the old data
+            metadata: Optional key/value pairs recorded in the same
+                transaction, read once every flat has been consumed
+
+        Returns:
+            int: Total number of rows inserted
+        """
+        sql_query = "INSERT INTO hdb_flats ({}) VALUES ({})".format(
+            ", ".join(columns), ", ".join("?" * len(columns))
+        )
+
+        row_values = itemgetter(*columns)
+
+        with self.checkout() as connection, query_tracer.quiet():
+            previous = {
+                name: connection.execute(f"PRAGMA {name}").fetchone()[0]
+                for name in BULK_LOAD_PRAGMAS
+            }
+            for name, value in BULK_LOAD_PRAGMAS.items():
+                connection.execute(f"PRAGMA {name} = {value}")
+
+            total = 0
+            batch = []
+            try:
+                # sqlite3 runs DDL outside a transaction unless one is open,
+                # and the dropped indexes must come back on rollback
+                connection.execute("BEGIN")
+                if replace:
+                    self._delete_all(connection)
+                # Building the indexes once after the load is much cheaper
+                # than maintaining them row by row
+                for name in INDEXES:
+                    connection.execute(f"DROP INDEX IF EXISTS {name}")
+                last_id = connection.execute(
+                    "SELECT COALESCE(MAX(id), 0) FROM hdb_flats"
+                ).fetchone()[0]
+                for flat in flats:
+                    batch.append(row_values(flat))
+                    if len(batch) >= batch_size:
+                        connection.executemany(sql_query, batch)
+                        total += len(batch)
+                        if progress:
+                            progress(len(batch))
+                        batch = []
+                if batch:
+                    connection.executemany(sql_query, batch)
+                    total += len(batch)
+                    if progress:
+                        progress(len(batch))
+                self._create_indexes(connection)
+                self._index_text(connection, last_id)
+                self._bump_data_version(connection)
+                if metadata:
+                    self._set_metadata(connection, metadata)
+                connection.commit()
+                # Refresh planner statistics so the search indexes get picked
+                connection.execute("ANALYZE hdb_flats")
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                for name, value in previous.items():
+                    connection.execute(f"PRAGMA {name} = {value}")
+
+        return total
+
+    def source_hashes(self):
+        """
+        Return the row_hash of every synced flat keyed by its source_key.
+
+        Answered from the covering source_key index, without reading the
+        table pages.
+        """
+        with self.checkout() as connection, query_tracer.quiet():
+            cursor = connection.execute(
+                "SELECT source_key, row_hash FROM hdb_flats"
+                " WHERE source_key IS NOT NULL"
+            )
+            cursor.row_factory = None
+            return dict(cursor.fetchall())
+
+    def sync_flats(self, flats, metadata=None, batch_size=10000):
+        """
+        Apply source records to hdb_flats without reloading the table.
+
+        Each flat carries a source_key identifying its source record and a
+        row_hash of its contents. Flats whose key is new are appended, flats
+        whose key is known but whose hash differs are updated in place, and
+        the rest are skipped. Only the new and changed rows are written, so
+        pages holding untouched flats stay as they are.
+
+        Args:
+            flats: Iterable of dicts keyed by FLAT_COLUMNS and SYNC_COLUMNS
+            metadata: Optional key/value pairs recorded in the same
+                transaction, such as the dataset version and high-water mark;
+                read once every flat has been consumed, so a pipeline may
+                complete it while the flats stream in
+            batch_size: Number of rows handed to each executemany call
+
+        Returns:
+            dict: Counts of added, changed and skipped flats
+        """
+        columns = FLAT_COLUMNS + tuple(SYNC_COLUMNS)
+        insert_query = "INSERT INTO hdb_flats ({}) VALUES ({})".format(
+            ", ".join(columns), ", ".join("?" * len(columns))
         )
-        self.connection.commit()
-        self.close()
+        update_query = "UPDATE hdb_flats SET {} WHERE id = ?".format(
+            ", ".join(f"{column} = ?" for column in columns)
+        )
+        text_columns = ", ".join(FTS_COLUMNS)
+        row_values = itemgetter(*columns)
+        counts = {"added": 0, "changed": 0, "skipped": 0}
+
+        with self.checkout() as connection, query_tracer.quiet():
+            try:
+                last_id = connection.execute(
+                    "SELECT COALESCE(MAX(id), 0) FROM hdb_flats"
+                ).fetchone()[0]
+                added = []
+                changed = []
+                for flat in flats:
+                    existing = connection.execute(
+                        "SELECT id, row_hash FROM hdb_flats WHERE source_key = ?",
+                        (flat["source_key"],),
+                    ).fetchone()
+                    if existing is None:
+                        added.append(row_values(flat))
+                    elif existing["row_hash"] != flat["row_hash"]:
+                        changed.append(row_values(flat) + (existing["id"],))
+                    else:
+                        counts["skipped"] += 1
+                    if len(added) >= batch_size:
+                        connection.executemany(insert_query, added)
+                        counts["added"] += len(added)
+                        added = []
+                if added:
+                    connection.executemany(insert_query, added)
+                    counts["added"] += len(added)
+
+                # Changed rows leave and re-enter the full-text index, which
+                # needs their old values to remove them
+                changed_ids = [(row[-1],) for row in changed]
+                connection.executemany(
+                    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {text_columns}) "
+                    f"SELECT 'delete', id, {text_columns} FROM hdb_flats WHERE id = ?",
+                    changed_ids,
+                )
+                connection.executemany(update_query, changed)
+                connection.executemany(
+                    f"INSERT INTO {FTS_TABLE}(rowid, {text_columns}) "
+                    f"SELECT id, {text_columns} FROM hdb_flats WHERE id = ?",
+                    changed_ids,
+                )
+                counts["changed"] = len(changed)
+                self._index_text(connection, last_id)
+
+                if counts["added"] or counts["changed"]:
+                    self._bump_data_version(connection)
+                if metadata:
+                    self._set_metadata(connection, metadata)
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+
+        return counts
+
+    def _match_expression(self, query):
+        """Turn free text into an FTS5 expression that prefix-matches every word"""
+        return " ".join(f'"{word}"*' for word in re.findall(r"\w+", query))
+
+    def _build_filters(self, query, town, flat_type, price_range=None):
+        """
+        Build the WHERE clause and parameters shared by the search queries.
 
-    def search_flats(self, query, town, flat_type, limit=None, offset=0):
-        """Search for HDB flats with given filters, sorting, and pagination"""
-        self.connect()
-        sql_query = "SELECT * FROM hdb_flats WHERE 1=1"
+        price_range is an optional (minimum, maximum) resale price, either
+        bound of which may be None.
+        """
+        sql_query = " WHERE 1=1"
         params = []
 
-        if query:
-            sql_query += " AND (town LIKE ? OR street_name LIKE ? OR block LIKE ?)"
-            params.extend([f"%{query}%", f"%{query}%", f"%{query}%"])
+        match = self._match_expression(query) if query else ""
+        if match:
+            sql_query += (
+                f" AND hdb_flats.id IN"
+                f" (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ?)"
+            )
+            params.append(match)
+        elif query and query.strip():
+            # Only words are indexed, so text without any, such as "!!!",
+            # matches no flat rather than dropping the filter
+            sql_query += " AND 0"
 
-        if town:
-            sql_query += " AND town LIKE ?"
-            params.append(f"%{town}%")
+        for column, value, vocabulary in (
+            ("town", town, TOWNS),
+            ("flat_type", flat_type, FLAT_TYPES),
+        ):
+            if not value:
+                continue
+            # Dropdown values are matched exactly; free text keeps LIKE semantics
+            if value.strip().upper() in vocabulary:
+                sql_query += f" AND hdb_flats.{column} = ?"
+                params.append(value.strip().upper())
+            else:
+                sql_query += f" AND hdb_flats.{column} LIKE ?"
+                params.append(f"%{value}%")
 
-        if flat_type:
-            sql_query += " AND flat_type LIKE ?"
-            params.append(f"%{flat_type}%")
+        minimum, maximum = price_range or (None, None)
+        if minimum is not None:
+            sql_query += " AND hdb_flats.resale_price >= ?"
+            params.append(minimum)
+        if maximum is not None:
+            sql_query += " AND hdb_flats.resale_price <= ?"
+            params.append(maximum)
 
-        sql_query += " ORDER BY resale_price DESC"
+        return sql_query, params
+
+    def _search_query(
+        self,
+        query,
+        town,
+        flat_type,
+        order_by,
+        after,
+        before,
+        with_count=False,
+        limit=None,
+        offset=0,
+        preferences=None,
+        price_range=None,
+    ):
+        """Build the SELECT used by search_flats and search_page"""
+        select = "hdb_flats.*"
+        count_params = []
+        # The count is an uncorrelated subquery, so SQLite evaluates it once
+        # with its own index plan instead of materializing every match
+        if with_count:
+            count_where, count_params = self._build_filters(
+                query, town, flat_type, price_range
+            )
+            select += f", (SELECT COUNT(*) FROM hdb_flats{count_where}) AS total_count"
 
         # Only add LIMIT and OFFSET if limit is specified
-        if limit is not None:
-            sql_query += " LIMIT ? OFFSET ?"
-            params.extend([limit, offset])
+        limit_clause = " LIMIT ? OFFSET ?" if limit is not None else ""
+        limit_params = [limit, offset] if limit is not None else []
+
+        score = None
+        if order_by == "score" and preferences:
+            if after is not None or before is not None:
+                raise ValueError("Keyset pagination requires price ordering")
+            score = score_calculator.score_sql(preferences, self._categorical_values())
+
+        match = self._match_expression(query) if query else ""
+        if score is not None:
+            # Score every match once into a temporary table, pick the page
+            # from it, then join back for the full rows of that page only.
+            # Price order breaks score ties, matching ScoreCalculator.rank_flats.
+            expression, score_params = score
+            where, params = self._build_filters(query, town, flat_type, price_range)
+            rounded = score_calculator.round_sql("raw_score")
+            sql_query = (
+                "WITH scored AS MATERIALIZED ("
+                f"SELECT hdb_flats.id, hdb_flats.resale_price, {expression} AS raw_score"
+                f" FROM hdb_flats{where}),"
+                f" ranked AS (SELECT id, resale_price, {rounded} AS compatibility_score"
+                " FROM scored"
+                f" ORDER BY compatibility_score DESC, resale_price DESC, id ASC"
+                f"{limit_clause})"
+                f" SELECT {select}, ranked.compatibility_score FROM ranked"
+                " JOIN hdb_flats ON hdb_flats.id = ranked.id"
+                " ORDER BY ranked.compatibility_score DESC,"
+                " ranked.resale_price DESC, ranked.id ASC"
+            )
+            return sql_query, score_params + params + limit_params + count_params
+
+        if order_by == "relevance" and match:
+            # bm25 is computed once per match; lower is more relevant and id
+            # breaks ties so every row has a unique keyset position
+            where, params = self._build_filters("", town, flat_type, price_range)
+            order = "matches.relevance ASC, hdb_flats.id ASC"
+            if after is not None:
+                where += (
+                    " AND (matches.relevance > ?"
+                    " OR (matches.relevance = ? AND hdb_flats.id > ?))"
+                )
+                params.extend([after[0], after[0], after[1]])
+            elif before is not None:
+                where += (
+                    " AND (matches.relevance < ?"
+                    " OR (matches.relevance = ? AND hdb_flats.id < ?))"
+                )
+                params.extend([before[0], before[0], before[1]])
+                order = "matches.relevance DESC, hdb_flats.id DESC"
+            sql_query = (
+                "WITH matches AS MATERIALIZED ("
+                f"SELECT rowid AS id, rank AS relevance FROM {FTS_TABLE}"
+                f" WHERE {FTS_TABLE} MATCH ?)"
+                f" SELECT {select}, matches.relevance FROM matches"
+                f" JOIN hdb_flats ON hdb_flats.id = matches.id{where}"
+                f" ORDER BY {order}"
+            )
+            return sql_query + limit_clause, (
+                [match] + count_params + params + limit_params
+            )
+
+        if order_by == "price_asc":
+            if after is not None or before is not None:
+                raise ValueError("Keyset pagination requires price ordering")
+            where, params = self._build_filters(query, town, flat_type, price_range)
+            # Ties run id DESC so the price indexes can be read backwards
+            sql_query = (
+                f"SELECT {select} FROM hdb_flats{where}"
+                " ORDER BY resale_price ASC, id DESC"
+            )
+        else:
+            where, params = self._build_filters(query, town, flat_type, price_range)
+            # id breaks price ties so every row has a unique keyset position
+            order = "resale_price DESC, id ASC"
+            if after is not None:
+                where += " AND resale_price <= ? AND (resale_price < ? OR id > ?)"
+                params.extend([after[0], after[0], after[1]])
+            elif before is not None:
+                where += " AND resale_price >= ? AND (resale_price > ? OR id < ?)"
+                params.extend([before[0], before[0], before[1]])
+                order = "resale_price ASC, id DESC"
+            sql_query = f"SELECT {select} FROM hdb_flats" + where + " ORDER BY " + order
+
+        return sql_query + limit_clause, count_params + params + limit_params
 
-        flats = self.connection.execute(sql_query, params).fetchall()
-        self.close()
+    def search_flats(
+        self,
+        query,
+        town,
+        flat_type,
+        limit=None,
+        offset=0,
+        order_by="price",
+        after=None,
+        before=None,
+        preferences=None,
+        price_range=None,
+    ):
+        """
+        Search for HDB flats with given filters, sorting, and pagination.
+
+        order_by is "price" (most expensive first), "price_asc" (cheapest
+        first), "relevance", which ranks free-text matches by bm25, best
+        first, and falls back to price when there is no free-text term, or
+        "score", which ranks by compatibility with preferences and falls back
+        to price when none are set. Scoring, sorting and the page cut all run
+        inside SQLite, and each returned row carries its compatibility_score;
+        relevance-ranked rows also carry their bm25 relevance.
+
+        Price- and relevance-ordered results can also be paged by keyset:
+        pass the (resale_price, id) or (relevance, id) of the last row seen
+        as after, or of the first row seen as before, instead of an offset.
+        The cost of a keyset page does not grow with its depth.
+
+        price_range optionally bounds the resale price as (minimum, maximum),
+        with None for an open end.
+        """
+        sql_query, params = self._search_query(
+            query,
+            town,
+            flat_type,
+            order_by,
+            after,
+            before,
+            limit=limit,
+            offset=offset,
+            preferences=preferences,
+            price_range=price_range,
+        )
+
+        with self.checkout() as connection:
+            flats = connection.execute(sql_query, params).fetchall()
+
+        # Pages read backwards from a before cursor are returned in display order
+        if before is not None:
+            flats.reverse()
         return flats
 
-    def count_search_results(self, query, town, flat_type):
-        """Count total number of flats matching the search criteria"""
-        self.connect()
-        sql_query = "SELECT COUNT(*) as count FROM hdb_flats WHERE 1=1"
-        params = []
+    def search_page(
+        self,
+        query,
+        town,
+        flat_type,
+        limit,
+        offset=0,
+        order_by="price",
+        after=None,
+        before=None,
+        preferences=None,
+    ):
+        """
+        Fetch one page of search results together with the total match count.
+
+        The count comes from the count cache when possible. On a miss the page
+        and the count are read in a single statement.
+
+        Returns:
+            tuple: (list of flat rows, total number of matching flats)
+        """
+        with self.checkout() as connection:
+            key = self._count_cache_key(query, town, flat_type)
+            total_count = self._cached_count(key)
+            if total_count is not None:
+                flats = self.search_flats(
+                    query,
+                    town,
+                    flat_type,
+                    limit,
+                    offset,
+                    order_by,
+                    after,
+                    before,
+                    preferences,
+                )
+                return flats, total_count
+
+            sql_query, params = self._search_query(
+                query,
+                town,
+                flat_type,
+                order_by,
+                after,
+                before,
+                with_count=True,
+                limit=limit,
+                offset=offset,
+                preferences=preferences,
+            )
+            flats = connection.execute(sql_query, params).fetchall()
+
+        # A page past the end carries no count, so ask for it directly
+        if not flats:
+            return flats, self.count_search_results(query, town, flat_type)
+
+        if before is not None:
+            flats.reverse()
+        total_count = flats[0]["total_count"]
+        self._store_count(key, total_count)
+        return flats, total_count
+
+    def _categorical_values(self):
+        """
+        Return every stored value of the categorical score columns.
+
+        The values are what a compiled score expression needs to cover, and
+        are read again only when the data version changes.
+        """
+        with self.checkout() as connection:
+            version = self.data_version()
+            cached = self._score_values
+            if cached is not None and cached[0] == version:
+                return cached[1]
+
+            values = {}
+            for criterion in score_calculator.categorical_criteria:
+                column = score_calculator.criterion_fields[criterion]
+                values[column] = [
+                    row[0]
+                    for row in connection.execute(
+                        f"SELECT DISTINCT {column} FROM hdb_flats"
+                    )
+                ]
+
+        self._score_values = (version, values)
+        return values
+
+    def _count_cache_key(self, query, town, flat_type):
+        """Normalize search filters into a count cache key for this data version"""
+        return (
+            self.data_version(),
+            (self._match_expression(query).lower() or query.strip()) if query else "",
+            town.strip().upper() if town else "",
+            flat_type.strip().upper() if flat_type else "",
+        )
+
+    def _cached_count(self, key):
+        """Return a cached count, or None on a miss"""
+        with self._count_cache_lock:
+            if key not in self._count_cache:
+                return None
+            self._count_cache.move_to_end(key)
+            return self._count_cache[key]
+
+    def _store_count(self, key, count):
+        """Cache a count, evicting the least recently used entry when full"""
+        with self._count_cache_lock:
+            self._count_cache[key] = count
+            self._count_cache.move_to_end(key)
+            while len(self._count_cache) > COUNT_CACHE_SIZE:
+                self._count_cache.popitem(last=False)
 
-        if query:
-            sql_query += " AND (town LIKE ? OR street_name LIKE ? OR block LIKE ?)"
-            params.extend([f"%{query}%", f"%{query}%", f"%{query}%"])
+    def clear_count_cache(self):
+        """Forget every cached search result count"""
+        with self._count_cache_lock:
+            self._count_cache.clear()
 
-        if town:
-            sql_query += " AND town LIKE ?"
-            params.append(f"%{town}%")
+    def count_search_results(self, query, town, flat_type):
+        """Count total number of flats matching the search criteria"""
+        with self.checkout() as connection:
+            key = self._count_cache_key(query, town, flat_type)
+            count = self._cached_count(key)
+            if count is not None:
+                return count
 
-        if flat_type:
-            sql_query += " AND flat_type LIKE ?"
-            params.append(f"%{flat_type}%")
+            where, params = self._build_filters(query, town, flat_type)
+            sql_query = "SELECT COUNT(*) as count FROM hdb_flats" + where
+            result = connection.execute(sql_query, params).fetchone()
 
-        result = self.connection.execute(sql_query, params).fetchone()
-        self.close()
-        return result["count"] if result else 0
+        count = result["count"] if result else 0
+        self._store_count(key, count)
+        return count
 
     def query_id(self, id):
         """Query a flat by its ID"""
-        self.connect()
-        flat = self.connection.execute(
-            "SELECT * FROM hdb_flats WHERE id = ?", (id,)
-        ).fetchone()
-        self.close()
-        return flat
+        with self.checkout() as connection:
+            return connection.execute(
+                "SELECT * FROM hdb_flats WHERE id = ?", (id,)
+            ).fetchone()
+
+    def query_ids(self, ids):
+        """
+        Query several flats by ID in as few round trips as possible.
+
+        Args:
+            ids: Sequence of flat IDs
+
+        Returns:
+            list: Flat rows in the order of ids, skipping IDs that do not exist
+        """
+        ids = list(ids)
+        flats = {}
+        with self.checkout() as connection:
+            for start in range(0, len(ids), MAX_VARIABLES):
+                chunk = ids[start : start + MAX_VARIABLES]
+                placeholders = ", ".join("?" * len(chunk))
+                for flat in connection.execute(
+                    f"SELECT * FROM hdb_flats WHERE id IN ({placeholders})", chunk
+                ):
+                    flats[flat["id"]] = flat
+        return [flats[flat_id] for flat_id in ids if flat_id in flats]
 
     def clear_data(self):
         """Clear all data from the hdb_flats table"""
-        self.connect()
+        with self.checkout() as connection, query_tracer.quiet():
+            # Check if hdb_flats table exists
+            cursor = connection.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name='hdb_flats'"
+            )
+            if cursor.fetchone() is None:
+                return
+
+            self._delete_all(connection)
+            self._bump_data_version(connection)
+            connection.commit()
+
+    def _delete_all(self, connection):
+        """Delete every flat and its full-text entries in the caller's transaction"""
+        connection.execute("DELETE FROM hdb_flats")
+        fts_exists = connection.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name=?",
+            (FTS_TABLE,),
+        ).fetchone()
+        if fts_exists is not None:
+            connection.execute(
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')"
+            )
+
+
+def encode_cursor(flat, key="resale_price"):
+    """Encode the keyset position of a flat as an opaque URL-safe token"""
+    position = json.dumps([flat[key], flat["id"]])
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip("=")
 
-        # Check if hdb_flats table exists
-        cursor = self.connection.execute(
-            "SELECT name FROM sqlite_master WHERE type='table' AND name='hdb_flats'"
-        )
-        if cursor.fetchone() is None:
-            self.close()
-            return
 
-        self.connection.execute("DELETE FROM hdb_flats")
-        self.connection.commit()
-        self.close()
+def decode_cursor(token):
+    """Decode a token from encode_cursor into a (sort key, id) tuple"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        price, flat_id = json.loads(base64.urlsafe_b64decode(padded))
+        return float(price), int(flat_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid pagination cursor")
 
 
 database = Database()
@@ -3,31 +3,164 @@ AI Assistant with RAG (Retrieval-Augmented Generation) using Gemini API
 Retrieves data from HDB database and provides intelligent responses
 """
 
+import hashlib
 import os
+import re
+import unicodedata
 import google.generativeai as genai
-from Database import database
+from chatIntent import parse_intent
+from Database import FLAT_TYPES, TOWNS, database
+from metrics import metrics
+from persistentCache import PersistentCache
+from sqlSandbox import sql_sandbox
+
+
+# Database schema described to the model when it writes SQL
+SCHEMA_INFO = f"""
+Database Schema:
+Table: hdb_flats
+Columns:
+- id (INTEGER PRIMARY KEY): Unique identifier for each flat
+- town (TEXT): Location/town in Singapore (e.g., 'TAMPINES', 'BEDOK', 'BISHAN')
+- flat_type (TEXT): Type of flat (e.g., '2 ROOM', '3 ROOM', '4 ROOM', '5 ROOM', 'EXECUTIVE')
+- block (TEXT): Block number
+- street_name (TEXT): Street name
+- storey_range (TEXT): Storey range (e.g., '01 TO 03', '04 TO 06')
+- floor_area_sqm (REAL): Floor area in square meters
+- flat_model (TEXT): Flat model (e.g., 'Improved', 'Model A', 'Premium Apartment')
+- lease_commence_date (INTEGER): Year the lease started
+- resale_price (REAL): Resale price in Singapore Dollars
+
+Available towns: {', '.join(TOWNS)}
+
+Available flat types: {', '.join(FLAT_TYPES[1:6])}
+"""
+
+# Generated SQL is cached per normalized question; entries expire so
+# queries are regenerated now and then
+SQL_CACHE_TABLE = "llm_sql_cache"
+SQL_CACHE_SIZE = 1000
+SQL_CACHE_TTL = 7 * 24 * 3600  # seconds
+
+# Keys include the prompt's hash, so editing it retires the old queries
+SQL_PROMPT_VERSION = hashlib.sha1(SCHEMA_INFO.encode()).hexdigest()[:12]
+
+sql_cache = PersistentCache(SQL_CACHE_TABLE, SQL_CACHE_SIZE, SQL_CACHE_TTL)
+
+# Prompt asking for an analysis of one flat, filled with the flat's columns
+FLAT_ANALYSIS_PROMPT = """{system_prompt}
+
+SPECIFIC PROPERTY:
+
+Property Details:
+- Location: {flat[town]}, Block {flat[block]}, {flat[street_name]}
+- Type: {flat[flat_type]}
+- Storey: {flat[storey_range]}
+- Floor Area: {flat[floor_area_sqm]} sqm
+- Model: {flat[flat_model]}
+- Lease Commenced: {flat[lease_commence_date]}
+- Resale Price: SGD ${flat[resale_price]:,.2f}
+
+
+Please provide a comprehensive analysis of this property including:
+1. Location advantages
+2. Value assessment (is the price reasonable?)
+3. Remaining lease considerations
+4. Size and layout suitability
+5. Overall recommendation
+
+Be specific and data-driven in your analysis.
+"""
+
+# Prompt asking for a comparison of two flats. The answer is shared by both
+# orders of the pair, so the flats are referred to by address, not position.
+FLAT_COMPARISON_PROMPT = """{system_prompt}
+
+COMPARISON REQUEST:
+
+PROPERTY AT BLOCK {flat1[block]}, {flat1[street_name]}:
+- Location: {flat1[town]}, Block {flat1[block]}, {flat1[street_name]}
+- Type: {flat1[flat_type]}
+- Floor Area: {flat1[floor_area_sqm]} sqm
+- Storey: {flat1[storey_range]}
+- Model: {flat1[flat_model]}
+- Lease Started: {flat1[lease_commence_date]}
+- Price: SGD ${flat1[resale_price]:,.2f}
+
+PROPERTY AT BLOCK {flat2[block]}, {flat2[street_name]}:
+- Location: {flat2[town]}, Block {flat2[block]}, {flat2[street_name]}
+- Type: {flat2[flat_type]}
+- Floor Area: {flat2[floor_area_sqm]} sqm
+- Storey: {flat2[storey_range]}
+- Model: {flat2[flat_model]}
+- Lease Started: {flat2[lease_commence_date]}
+- Price: SGD ${flat2[resale_price]:,.2f}
+
+
+Please provide a detailed comparison of these two properties covering:
+1. Price comparison and value for money
+2. Location advantages/disadvantages
+3. Size and layout differences
+4. Remaining lease comparison
+5. Overall recommendation - which is better and why?
+
+Refer to each property by its block and street, not as "Property 1" or "Property 2".
+Be objective and consider different buyer profiles (e.g., families, singles, investors).
+"""
+
+# Flat analyses and comparisons are cached per flat, prompt, model and
+# dataset version, so popular listings are only sent to the model once
+RESPONSE_CACHE_TABLE = "llm_response_cache"
+RESPONSE_CACHE_SIZE = 5000
+RESPONSE_CACHE_TTL = 30 * 24 * 3600  # seconds
+
+response_cache = PersistentCache(
+    RESPONSE_CACHE_TABLE, RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL
+)
+
+
+def normalize_query(query):
+    """Fold case, punctuation and spacing so rephrasings share a cache entry"""
+    text = unicodedata.normalize("NFKC", query).lower()
+    text = re.sub(r"[^\w$%/.-]+", " ", text)
+    text = re.sub(r"\.(?!\d)", " ", text)  # keep decimal points only
+    return " ".join(text.split())
+
+
+def sql_cache_key(query):
+    """Cache key of the SQL generated for a question"""
+    return f"{SQL_PROMPT_VERSION}:{normalize_query(query)}"
 
 
 class AIAssistant:
     """AI Assistant with RAG capabilities using Gemini API"""
 
-    def __init__(self, api_key=None, model_name=None):
-        """Initialize the AI Assistant with Gemini API"""
-        self.api_key = api_key or os.environ.get("GEMINI_API_KEY")
-        if not self.api_key:
-            raise ValueError(
-                "GEMINI_API_KEY not found. Please set it in environment variables."
-            )
-
-        # Configure Gemini API
-        genai.configure(api_key=self.api_key)
+    def __init__(self, api_key=None, model_name=None, model=None):
+        """
+        Initialize the AI Assistant with Gemini API
 
-        # Initialize the model
+        Args:
+            api_key: Gemini API key (defaults to GEMINI_API_KEY)
+            model_name: Gemini model to use (defaults to GEMINI_MODEL)
+            model: Optional object with a generate_content(prompt) method used
+                instead of Gemini, e.g. a local stand-in for load tests
+        """
         # Supported models: "gemini-1.5-flash-latest", "gemini-1.5-pro-latest", "gemini-pro"
         self.model_name = model_name or os.environ.get(
             "GEMINI_MODEL", "gemini-2.5-flash"
         )
-        self.model = genai.GenerativeModel(self.model_name)
+
+        if model is None:
+            self.api_key = api_key or os.environ.get("GEMINI_API_KEY")
+            if not self.api_key:
+                raise ValueError(
+                    "GEMINI_API_KEY not found. Please set it in environment variables."
+                )
+
+            # Configure Gemini API and initialize the model
+            genai.configure(api_key=self.api_key)
+            model = genai.GenerativeModel(self.model_name)
+        self.model = model
 
         # System prompt for the AI assistant
         self.system_prompt = """You are an intelligent HDB (Housing Development Board) property assistant in Singapore. 
@@ -55,6 +188,93 @@ Always format prices with commas and currency (SGD $).
 Always mention specific locations (town, street) when discussing properties.
 """
 
+    def _response_cache_key(self, template, flat_ids):
+        """
+        Cache key of a flat analysis or comparison.
+
+        Args:
+            template: Prompt template the response is generated from
+            flat_ids: IDs of the flats involved, in canonical (sorted) order
+
+        Returns:
+            str: Key covering the flats, the prompt, the model and the data
+        """
+        prompt_hash = hashlib.sha1(
+            (self.system_prompt + template).encode()
+        ).hexdigest()[:12]
+        ids = ",".join(str(flat_id) for flat_id in flat_ids)
+        return f"{ids}:{prompt_hash}:{self.model_name}:{database.data_version()}"
+
+    def _generate(self, prompt):
+        """Generate a model response, timed as a Gemini call"""
+        with metrics.timed("gemini"):
+            return self.model.generate_content(prompt)
+
+    def _generate_stream(self, prompt):
+        """Generate a model response, yielding its text as the chunks arrive"""
+        with metrics.timed("gemini"):
+            for chunk in self.model.generate_content(prompt, stream=True):
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # A chunk carrying only a finish reason has no text part
+                    continue
+                if text:
+                    yield text
+
+    def _cached_stream(self, cache_key, prompt):
+        """
+        Yield a cached response whole, or stream a new one and cache it.
+
+        A response is only cached once the model has finished it, so a
+        stream abandoned by the client leaves no partial entry.
+        """
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+        chunks = []
+        for chunk in self._generate_stream(prompt):
+            chunks.append(chunk)
+            yield chunk
+        response_cache.set(cache_key, "".join(chunks))
+
+    def _format_context(self, flats):
+        """Describe the retrieved flats and their prices for the prompt"""
+        context = []
+        if flats:
+            context.append(f"Found {len(flats)} relevant properties:\n")
+            for i, flat in enumerate(flats, 1):
+                flat_dict = dict(flat)
+                context.append(
+                    f"\n{i}. Property in {flat_dict['town']}"
+                    f"\n   - Type: {flat_dict['flat_type']}"
+                    f"\n   - Address: Block {flat_dict['block']}, {flat_dict['street_name']}"
+                    f"\n   - Storey: {flat_dict['storey_range']}"
+                    f"\n   - Floor Area: {flat_dict['floor_area_sqm']} sqm"
+                    f"\n   - Model: {flat_dict['flat_model']}"
+                    f"\n   - Lease Started: {flat_dict['lease_commence_date']}"
+                    f"\n   - Resale Price: SGD ${flat_dict['resale_price']:,.2f}"
+                )
+
+            # Add statistics if available
+            prices = [dict(flat)["resale_price"] for flat in flats]
+            if prices:
+                avg_price = sum(prices) / len(prices)
+                min_price = min(prices)
+                max_price = max(prices)
+                context.append(
+                    f"\n\nPrice Statistics:"
+                    f"\n- Average: SGD ${avg_price:,.2f}"
+                    f"\n- Range: SGD ${min_price:,.2f} - SGD ${max_price:,.2f}"
+                )
+        else:
+            context.append(
+                "No specific properties found matching the exact criteria. "
+                "I'll provide general information based on your query."
+            )
+        return context
+
     def retrieve_context(self, query):
         """
         Retrieve relevant data from the database based on the query
@@ -62,27 +282,38 @@ Always mention specific locations (town, street) when discussing properties.
         """
         context = []
         max_attempts = 5
-        
-        # Database schema information for LLM
-        schema_info = """
-Database Schema:
-Table: hdb_flats
-Columns:
-- id (INTEGER PRIMARY KEY): Unique identifier for each flat
-- town (TEXT): Location/town in Singapore (e.g., 'TAMPINES', 'BEDOK', 'BISHAN')
-- flat_type (TEXT): Type of flat (e.g., '2 ROOM', '3 ROOM', '4 ROOM', '5 ROOM', 'EXECUTIVE')
-- block (TEXT): Block number
-- street_name (TEXT): Street name
-- storey_range (TEXT): Storey range (e.g., '01 TO 03', '04 TO 06')
-- floor_area_sqm (REAL): Floor area in square meters
-- flat_model (TEXT): Flat model (e.g., 'Improved', 'Model A', 'Premium Apartment')
-- lease_commence_date (INTEGER): Year the lease started
-- resale_price (REAL): Resale price in Singapore Dollars
-
-Available towns: ANG MO KIO, BEDOK, BISHAN, BUKIT BATOK, BUKIT MERAH, BUKIT PANJANG, BUKIT TIMAH, CENTRAL AREA, CHOA CHU KANG, CLEMENTI, GEYLANG, HOUGANG, JURONG EAST, JURONG WEST, KALLANG/WHAMPOA, MARINE PARADE, PASIR RIS, PUNGGOL, QUEENSTOWN, SEMBAWANG, SENGKANG, SERANGOON, TAMPINES, TOA PAYOH, WOODLANDS, YISHUN
 
-Available flat types: 2 ROOM, 3 ROOM, 4 ROOM, 5 ROOM, EXECUTIVE
-"""
+        schema_info = SCHEMA_INFO
+
+        # Plain town / flat type / budget questions are searched directly,
+        # without asking the model for SQL
+        intent = parse_intent(query)
+        if intent is not None:
+            flats = database.search_flats(
+                "",
+                intent["town"],
+                intent["flat_type"],
+                limit=10,
+                order_by=intent["order_by"],
+                price_range=intent["price_range"],
+            )
+            metrics.chat_context.inc(("fast_path",))
+            print(f"Using parsed intent: {intent}")
+            return "\n".join(self._format_context(flats))
+
+        # A question asked before reuses the SQL that answered it
+        cache_key = sql_cache_key(query)
+        cached_sql = sql_cache.get(cache_key)
+        if cached_sql is not None:
+            try:
+                flats = sql_sandbox.execute(cached_sql)
+                print(f"Using cached SQL: {cached_sql}")
+                metrics.chat_context.inc(("sql_cache",))
+                return "\n".join(self._format_context(flats))
+            except Exception as e:
+                # The data or schema changed under it; generate a new query
+                print(f"Cached SQL failed with error: {e}")
+                sql_cache.delete(cache_key)
 
         # Initial SQL generation prompt
         sql_generation_prompt = f"""{schema_info}
@@ -108,72 +339,37 @@ Now generate the SQL query:"""
         for attempt in range(1, max_attempts + 1):
             try:
                 # Generate SQL query using LLM
-                sql_response = self.model.generate_content(sql_generation_prompt)
+                sql_response = self._generate(sql_generation_prompt)
                 sql_query = sql_response.text.strip()
-                
+
                 # Clean up the SQL query (remove markdown formatting if present)
                 if sql_query.startswith("```sql"):
-                    sql_query = sql_query.replace("```sql", "").replace("```", "").strip()
+                    sql_query = (
+                        sql_query.replace("```sql", "").replace("```", "").strip()
+                    )
                 elif sql_query.startswith("```"):
                     sql_query = sql_query.replace("```", "").strip()
-                
+
                 # Remove any trailing semicolons
                 sql_query = sql_query.rstrip(";").strip()
-                
+
                 print(f"Attempt {attempt}: Generated SQL: {sql_query}")
-                
-                # Execute the SQL query
-                database.connect()
-                cursor = database.connection.execute(sql_query)
-                flats = cursor.fetchall()
-                database.close()
-                
-                # Successfully executed the query
-                if flats:
-                    context.append(f"Found {len(flats)} relevant properties:\n")
-                    for i, flat in enumerate(flats, 1):
-                        flat_dict = dict(flat)
-                        context.append(
-                            f"\n{i}. Property in {flat_dict['town']}"
-                            f"\n   - Type: {flat_dict['flat_type']}"
-                            f"\n   - Address: Block {flat_dict['block']}, {flat_dict['street_name']}"
-                            f"\n   - Storey: {flat_dict['storey_range']}"
-                            f"\n   - Floor Area: {flat_dict['floor_area_sqm']} sqm"
-                            f"\n   - Model: {flat_dict['flat_model']}"
-                            f"\n   - Lease Started: {flat_dict['lease_commence_date']}"
-                            f"\n   - Resale Price: SGD ${flat_dict['resale_price']:,.2f}"
-                        )
-
-                    # Add statistics if available
-                    prices = [dict(flat)["resale_price"] for flat in flats]
-                    if prices:
-                        avg_price = sum(prices) / len(prices)
-                        min_price = min(prices)
-                        max_price = max(prices)
-                        context.append(
-                            f"\n\nPrice Statistics:"
-                            f"\n- Average: SGD ${avg_price:,.2f}"
-                            f"\n- Range: SGD ${min_price:,.2f} - SGD ${max_price:,.2f}"
-                        )
-                else:
-                    context.append(
-                        "No specific properties found matching the exact criteria. "
-                        "I'll provide general information based on your query."
-                    )
-                
+
+                # Execute the SQL query read-only, within the sandbox's budget
+                flats = sql_sandbox.execute(sql_query)
+
+                # Successfully executed the query; remember it for next time
+                context.extend(self._format_context(flats))
+                sql_cache.set(cache_key, sql_query)
+                metrics.chat_context.inc(("generated",))
+
                 # Success - break out of retry loop
                 break
-                
+
             except Exception as e:
                 error_message = str(e)
                 print(f"Attempt {attempt} failed with error: {error_message}")
-                
-                # Close database connection if it's still open
-                try:
-                    database.close()
-                except:
-                    pass
-                
+
                 if attempt < max_attempts:
                     # Prepare retry prompt with error information
                     sql_generation_prompt = f"""{schema_info}
@@ -204,17 +400,8 @@ Generate the corrected SQL query:"""
 
         return "\n".join(context)
 
-    def chat(self, user_query, conversation_history=None):
-        """
-        Main chat function with RAG
-
-        Args:
-            user_query: The user's question
-            conversation_history: Optional list of previous messages
-
-        Returns:
-            AI response as a string
-        """
+    def _chat_prompt(self, user_query, conversation_history=None):
+        """Retrieve the database context for a question and build the chat prompt"""
         # Retrieve relevant context from database
         retrieved_context = self.retrieve_context(user_query)
 
@@ -240,14 +427,88 @@ Please provide a helpful response based on the database context above and your k
             full_prompt = (
                 f"PREVIOUS CONVERSATION:\n{conversation_text}\n\n" + full_prompt
             )
+        return full_prompt
+
+    def chat(self, user_query, conversation_history=None):
+        """
+        Main chat function with RAG
+
+        Args:
+            user_query: The user's question
+            conversation_history: Optional list of previous messages
+
+        Returns:
+            AI response as a string
+        """
+        full_prompt = self._chat_prompt(user_query, conversation_history)
 
         try:
             # Generate response using Gemini
-            response = self.model.generate_content(full_prompt)
+            response = self._generate(full_prompt)
             return response.text
         except Exception as e:
             return f"Error generating response: {str(e)}"
 
+    def chat_stream(self, user_query, conversation_history=None):
+        """
+        Chat like chat(), yielding the response text as it is generated
+
+        Errors are raised to the caller rather than returned as text.
+        """
+        full_prompt = self._chat_prompt(user_query, conversation_history)
+        yield from self._generate_stream(full_prompt)
+
+    def _flat_analysis(self, flat_id):
+        """
+        Build the analysis prompt for a flat
+
+        Returns:
+            tuple: (cache key, prompt), or None if the flat does not exist
+        """
+        flat = database.query_id(flat_id)
+        if not flat:
+            return None
+
+        # The same flat, prompt, model and data give the same analysis
+        cache_key = self._response_cache_key(FLAT_ANALYSIS_PROMPT, [flat["id"]])
+        prompt = FLAT_ANALYSIS_PROMPT.format(
+            system_prompt=self.system_prompt, flat=dict(flat)
+        )
+        return cache_key, prompt
+
+    def _flat_comparison(self, flat_id1, flat_id2):
+        """
+        Build the comparison prompt for two flats
+
+        Returns:
+            tuple: (cache key, prompt), or None if either flat does not exist
+        """
+        # Either order of a pair shares one comparison, built from the
+        # flats in ID order
+        flats = database.query_ids(sorted([flat_id1, flat_id2]))
+
+        if len(flats) != 2:
+            return None
+
+        cache_key = self._response_cache_key(
+            FLAT_COMPARISON_PROMPT, [flat["id"] for flat in flats]
+        )
+        flat1_dict, flat2_dict = (dict(flat) for flat in flats)
+        prompt = FLAT_COMPARISON_PROMPT.format(
+            system_prompt=self.system_prompt, flat1=flat1_dict, flat2=flat2_dict
+        )
+        return cache_key, prompt
+
+    def _cached_generate(self, cache_key, prompt):
+        """Return the cached response for cache_key, or generate and cache it"""
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        response = self._generate(prompt)
+        response_cache.set(cache_key, response.text)
+        return response.text
+
     def ask_about_flat(self, flat_id):
         """
         Get AI insights about a specific flat
@@ -259,45 +520,27 @@ Please provide a helpful response based on the database context above and your k
             AI analysis of the flat
         """
         try:
-            flat = database.query_id(flat_id)
-            if not flat:
+            analysis = self._flat_analysis(flat_id)
+            if analysis is None:
                 return "Flat not found in database."
 
-            flat_dict = dict(flat)
-
-            # Create detailed context about the flat
-            context = f"""
-Property Details:
-- Location: {flat_dict['town']}, Block {flat_dict['block']}, {flat_dict['street_name']}
-- Type: {flat_dict['flat_type']}
-- Storey: {flat_dict['storey_range']}
-- Floor Area: {flat_dict['floor_area_sqm']} sqm
-- Model: {flat_dict['flat_model']}
-- Lease Commenced: {flat_dict['lease_commence_date']}
-- Resale Price: SGD ${flat_dict['resale_price']:,.2f}
-"""
-
-            prompt = f"""{self.system_prompt}
-
-SPECIFIC PROPERTY:
-{context}
-
-Please provide a comprehensive analysis of this property including:
-1. Location advantages
-2. Value assessment (is the price reasonable?)
-3. Remaining lease considerations
-4. Size and layout suitability
-5. Overall recommendation
-
-Be specific and data-driven in your analysis.
-"""
-
-            response = self.model.generate_content(prompt)
-            return response.text
+            return self._cached_generate(*analysis)
 
         except Exception as e:
             return f"Error analyzing flat: {str(e)}"
 
+    def ask_about_flat_stream(self, flat_id):
+        """
+        Analyze a flat like ask_about_flat(), yielding the text as it is generated
+
+        Errors are raised to the caller rather than returned as text.
+        """
+        analysis = self._flat_analysis(flat_id)
+        if analysis is None:
+            yield "Flat not found in database."
+            return
+        yield from self._cached_stream(*analysis)
+
     def compare_flats(self, flat_id1, flat_id2):
         """
         Compare two flats and provide AI insights
@@ -310,56 +553,27 @@ Be specific and data-driven in your analysis.
             Comparative analysis
         """
         try:
-            flat1 = database.query_id(flat_id1)
-            flat2 = database.query_id(flat_id2)
-
-            if not flat1 or not flat2:
+            comparison = self._flat_comparison(flat_id1, flat_id2)
+            if comparison is None:
                 return "One or both flats not found in database."
 
-            flat1_dict = dict(flat1)
-            flat2_dict = dict(flat2)
-
-            context = f"""
-PROPERTY 1:
-- Location: {flat1_dict['town']}, Block {flat1_dict['block']}, {flat1_dict['street_name']}
-- Type: {flat1_dict['flat_type']}
-- Floor Area: {flat1_dict['floor_area_sqm']} sqm
-- Storey: {flat1_dict['storey_range']}
-- Model: {flat1_dict['flat_model']}
-- Lease Started: {flat1_dict['lease_commence_date']}
-- Price: SGD ${flat1_dict['resale_price']:,.2f}
-
-PROPERTY 2:
-- Location: {flat2_dict['town']}, Block {flat2_dict['block']}, {flat2_dict['street_name']}
-- Type: {flat2_dict['flat_type']}
-- Floor Area: {flat2_dict['floor_area_sqm']} sqm
-- Storey: {flat2_dict['storey_range']}
-- Model: {flat2_dict['flat_model']}
-- Lease Started: {flat2_dict['lease_commence_date']}
-- Price: SGD ${flat2_dict['resale_price']:,.2f}
-"""
-
-            prompt = f"""{self.system_prompt}
-
-COMPARISON REQUEST:
-{context}
-
-Please provide a detailed comparison of these two properties covering:
-1. Price comparison and value for money
-2. Location advantages/disadvantages
-3. Size and layout differences
-4. Remaining lease comparison
-5. Overall recommendation - which is better and why?
-
-Be objective and consider different buyer profiles (e.g., families, singles, investors).
-"""
-
-            response = self.model.generate_content(prompt)
-            return response.text
+            return self._cached_generate(*comparison)
 
         except Exception as e:
             return f"Error comparing flats: {str(e)}"
 
+    def compare_flats_stream(self, flat_id1, flat_id2):
+        """
+        Compare two flats like compare_flats(), yielding the text as it is generated
+
+        Errors are raised to the caller rather than returned as text.
+        """
+        comparison = self._flat_comparison(flat_id1, flat_id2)
+        if comparison is None:
+            yield "One or both flats not found in database."
+            return
+        yield from self._cached_stream(*comparison)
+
 
 # Create a singleton instance
 ai_assistant = None
@@ -1,13 +1,96 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
-from Database import database
+import flask
+from flask import Flask, Response, request, jsonify, redirect, url_for, flash
+from Database import database, encode_cursor, decode_cursor
 from Userpreferences import user_preferences
 from scoreCalculator import score_calculator
+from flatStore import flat_store
 from ai_assistant import get_ai_assistant
+from metrics import metrics
+from queryTrace import query_tracer
+import json
 import os
+import time
 
 app = Flask(__name__)
 app.config["SECRET_KEY"] = "your-secret-key-here"
 app.config["GOOGLE_MAPS_API_KEY"] = os.environ.get("GOOGLE_MAPS_API_KEY", "")
+# Serve /debug/queries outside debug mode; it shows query parameters
+app.config["DEBUG_QUERIES"] = os.environ.get("HDB_DEBUG_QUERIES") == "1"
+
+# Bring existing databases up to the current schema (indexes, full-text table)
+database.initdb()
+
+
+@app.before_request
+def start_request_timing():
+    """Start timing the request and its components"""
+    metrics.start_request()
+
+
+@app.after_request
+def remember_response_status(response):
+    """
+    Keep the status code for record_request_timing.
+
+    A streamed body runs after teardown, so its request is recorded when the
+    body finishes instead, with the time spent producing it.
+    """
+    flask.g.response_status = response.status_code
+    if response.is_streamed and not response.direct_passthrough:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        response.response = metrics.stream(
+            response.response, route, request.method, response.status_code
+        )
+    return response
+
+
+@app.teardown_request
+def record_request_timing(exception=None):
+    """
+    Record the request's latency under its route pattern.
+
+    Teardown runs even when the view raised, which is recorded as a 500.
+    """
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    status = flask.g.get("response_status", 500) if exception is None else 500
+    metrics.finish_request(route, request.method, status)
+
+
+def render_template(template_name, **context):
+    """Render a template, timing it as part of the request"""
+    with metrics.timed("template"):
+        return flask.render_template(template_name, **context)
+
+
+def sse_event(data, event=None):
+    """Format one Server-Sent Event carrying data as JSON"""
+    header = f"event: {event}\n" if event else ""
+    return f"{header}data: {json.dumps(data)}\n\n"
+
+
+def event_stream(chunks):
+    """
+    Stream text chunks to the browser as Server-Sent Events.
+
+    Each chunk is sent as a message event with {"text": ...}. The stream ends
+    with a done event, or with an error event if producing the chunks failed.
+    """
+
+    def generate():
+        try:
+            for chunk in chunks:
+                yield sse_event({"text": chunk})
+        except Exception as e:
+            yield sse_event({"error": f"An error occurred: {str(e)}"}, "error")
+            return
+        yield sse_event({}, "done")
+
+    # Tell proxies not to buffer the stream, or chunks arrive all at once
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.route("/")
@@ -20,13 +103,11 @@ def index():
     favorite_flats = []
 
     # Get up to 3 favorite flats for preview on home page
-    for flat_id in favorite_ids[:3]:
-        flat = database.query_id(flat_id)
-        if flat:
-            flat_dict = dict(flat)
-            score = score_calculator.calculate_score(flat_dict, preferences)
-            flat_dict["compatibility_score"] = score
-            favorite_flats.append(flat_dict)
+    for flat in database.query_ids(favorite_ids[:3]):
+        flat_dict = dict(flat)
+        score = score_calculator.calculate_score(flat_dict, preferences)
+        flat_dict["compatibility_score"] = score
+        favorite_flats.append(flat_dict)
 
     return render_template(
         "index.html",
@@ -44,33 +125,97 @@ def search():
     town = request.args.get("town", "").strip()
     flat_type = request.args.get("flat_type", "").strip()
     page = request.args.get("page", 1, type=int)
+    after = request.args.get("after", "")
+    before = request.args.get("before", "")
 
     # Pagination settings
     per_page = 20  # Show 20 results per page
+    page = max(page, 1)
     offset = (page - 1) * per_page
 
-    # Get total count for pagination
-    total_count = database.count_search_results(query, town, flat_type)
-    total_pages = (total_count + per_page - 1) // per_page  # Ceiling division
+    preferences = user_preferences.get_preferences()
+    rank_time_ms = None
+    prev_cursor = next_cursor = None
+
+    if user_preferences.has_preferences():
+        # Rank every matching flat by compatibility and page over that order
+        started = time.perf_counter()
+        snapshot = None if query else flat_store.current()
+        if snapshot is not None:
+            # The columnar snapshot covers town and flat type filters; only
+            # the page rows are read back from SQLite
+            rows = flat_store.sort(
+                snapshot, flat_store.filter(snapshot, town, flat_type)
+            )
+            ranked = flat_store.rank(snapshot, preferences, rows, offset + per_page)
+            ranked = ranked[offset:]
+            total_count = len(rows)
+            flats = database.query_ids([flat_id for _, flat_id in ranked])
+            scores = [score for score, _ in ranked]
+        else:
+            flats, total_count = database.search_page(
+                query,
+                town,
+                flat_type,
+                limit=per_page,
+                offset=offset,
+                order_by="score",
+                preferences=preferences,
+            )
+            scores = [flat["compatibility_score"] for flat in flats]
+        rank_time_ms = (time.perf_counter() - started) * 1000
+        app.logger.info(
+            "Ranked %d flats for page %d in %.1f ms", total_count, page, rank_time_ms
+        )
+    else:
+        # Free-text searches list the best matches first. Previous/next links
+        # carry a keyset cursor so deep pages stay cheap; numbered page links
+        # fall back to offset paging for direct jumps
+        order_by, cursor_key = "price", "resale_price"
+        if query:
+            order_by, cursor_key = "relevance", "relevance"
+        try:
+            after_key = decode_cursor(after) if after else None
+            before_key = decode_cursor(before) if before else None
+        except ValueError:
+            after_key = before_key = None
+
+        # Get flats for current page and total count for pagination
+        if after_key or before_key:
+            flats, total_count = database.search_page(
+                query,
+                town,
+                flat_type,
+                limit=per_page,
+                order_by=order_by,
+                after=after_key,
+                before=before_key,
+            )
+        else:
+            flats, total_count = database.search_page(
+                query,
+                town,
+                flat_type,
+                limit=per_page,
+                offset=offset,
+                order_by=order_by,
+            )
+        scores = [0] * len(flats)
+
+        if flats and page > 1:
+            prev_cursor = encode_cursor(flats[0], cursor_key)
+        if flats and offset + per_page < total_count:
+            next_cursor = encode_cursor(flats[-1], cursor_key)
 
-    # Get flats for current page
-    flats = database.search_flats(query, town, flat_type, limit=per_page, offset=offset)
+    total_pages = (total_count + per_page - 1) // per_page  # Ceiling division
 
-    # Calculate scores for each flat based on user preferences
-    preferences = user_preferences.get_preferences()
     flats_with_scores = []
-
-    for flat in flats:
+    for flat, score in zip(flats, scores):
         # Convert sqlite Row to dict for easier handling
         flat_dict = dict(flat)
-        score = score_calculator.calculate_score(flat_dict, preferences)
         flat_dict["compatibility_score"] = score
         flats_with_scores.append(flat_dict)
 
-    # Sort by score if preferences are set, otherwise keep original order (price desc)
-    if user_preferences.has_preferences():
-        flats_with_scores.sort(key=lambda x: x["compatibility_score"], reverse=True)
-
     return render_template(
         "search_results.html",
         flats=flats_with_scores,
@@ -82,6 +227,9 @@ def search():
         total_pages=total_pages,
         total_count=total_count,
         per_page=per_page,
+        prev_cursor=prev_cursor,
+        next_cursor=next_cursor,
+        rank_time_ms=rank_time_ms,
     )
 
 
@@ -172,16 +320,14 @@ def favorites():
     """View all favorite flats"""
     favorite_ids = user_preferences.get_favorites()
     favorite_flats = []
+    preferences = user_preferences.get_preferences()
 
-    for flat_id in favorite_ids:
-        flat = database.query_id(flat_id)
-        if flat:
-            # Convert to dict and add score
-            flat_dict = dict(flat)
-            preferences = user_preferences.get_preferences()
-            score = score_calculator.calculate_score(flat_dict, preferences)
-            flat_dict["compatibility_score"] = score
-            favorite_flats.append(flat_dict)
+    for flat in database.query_ids(favorite_ids):
+        # Convert to dict and add score
+        flat_dict = dict(flat)
+        score = score_calculator.calculate_score(flat_dict, preferences)
+        flat_dict["compatibility_score"] = score
+        favorite_flats.append(flat_dict)
 
     return render_template(
         "favorites.html",
@@ -195,16 +341,14 @@ def comparison():
     """Show comparison page for selecting flats"""
     favorite_ids = user_preferences.get_favorites()
     favorite_flats = []
+    preferences = user_preferences.get_preferences()
 
     # Get all favorite flats for selection
-    for flat_id in favorite_ids:
-        flat = database.query_id(flat_id)
-        if flat:
-            flat_dict = dict(flat)
-            preferences = user_preferences.get_preferences()
-            score = score_calculator.calculate_score(flat_dict, preferences)
-            flat_dict["compatibility_score"] = score
-            favorite_flats.append(flat_dict)
+    for flat in database.query_ids(favorite_ids):
+        flat_dict = dict(flat)
+        score = score_calculator.calculate_score(flat_dict, preferences)
+        flat_dict["compatibility_score"] = score
+        favorite_flats.append(flat_dict)
 
     return render_template(
         "comparison.html",
@@ -225,12 +369,12 @@ def compare_flats(flat_id1, flat_id2):
         return redirect(url_for("favorites"))
 
     # Get both flats
-    flat1 = database.query_id(flat_id1)
-    flat2 = database.query_id(flat_id2)
+    flats = database.query_ids([flat_id1, flat_id2])
 
-    if not flat1 or not flat2:
+    if len(flats) != 2:
         flash("One or both flats could not be found.", "error")
         return redirect(url_for("favorites"))
+    flat1, flat2 = flats
 
     # Calculate scores and breakdowns for both flats
     preferences = user_preferences.get_preferences()
@@ -286,11 +430,34 @@ def api_ai_chat():
         return jsonify({"error": f"An error occurred: {str(e)}", "success": False}), 500
 
 
+@app.route("/api/ai/chat/stream", methods=["POST"])
+def api_ai_chat_stream():
+    """API endpoint for AI chat, streaming the response as Server-Sent Events"""
+    try:
+        data = request.get_json()
+        user_message = data.get("message", "").strip()
+        conversation_history = data.get("history", [])
+
+        if not user_message:
+            return jsonify({"error": "Message is required"}), 400
+
+        assistant = get_ai_assistant()
+
+    except ValueError as e:
+        return jsonify({"error": str(e), "success": False}), 400
+    except Exception as e:
+        return jsonify({"error": f"An error occurred: {str(e)}", "success": False}), 500
+
+    return event_stream(assistant.chat_stream(user_message, conversation_history))
+
+
 @app.route("/api/ai/analyze_flat/<int:flat_id>", methods=["GET"])
 def api_analyze_flat(flat_id):
-    """API endpoint for AI flat analysis"""
+    """API endpoint for AI flat analysis (?stream=1 for Server-Sent Events)"""
     try:
         assistant = get_ai_assistant()
+        if request.args.get("stream") == "1":
+            return event_stream(assistant.ask_about_flat_stream(flat_id))
         analysis = assistant.ask_about_flat(flat_id)
         return jsonify({"analysis": analysis, "success": True})
     except ValueError as e:
@@ -301,9 +468,11 @@ def api_analyze_flat(flat_id):
 
 @app.route("/api/ai/compare/<int:flat_id1>/<int:flat_id2>", methods=["GET"])
 def api_compare_flats(flat_id1, flat_id2):
-    """API endpoint for AI flat comparison"""
+    """API endpoint for AI flat comparison (?stream=1 for Server-Sent Events)"""
     try:
         assistant = get_ai_assistant()
+        if request.args.get("stream") == "1":
+            return event_stream(assistant.compare_flats_stream(flat_id1, flat_id2))
         comparison = assistant.compare_flats(flat_id1, flat_id2)
         return jsonify({"comparison": comparison, "success": True})
     except ValueError as e:
@@ -312,5 +481,21 @@ def api_compare_flats(flat_id1, flat_id2):
         return jsonify({"error": f"An error occurred: {str(e)}", "success": False}), 500
 
 
+@app.route("/metrics")
+def metrics_endpoint():
+    """Request timing metrics in the Prometheus text format"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/debug/queries")
+def debug_queries():
+    """Per-statement-shape timings and the recent slow queries with their plans"""
+    if not (app.debug or app.config["DEBUG_QUERIES"]):
+        return jsonify({"error": "Not found"}), 404
+    if request.args.get("reset"):
+        query_tracer.reset()
+    return jsonify(query_tracer.stats())
+
+
 if __name__ == "__main__":
     app.run(debug=True)
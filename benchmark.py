@@ -0,0 +1,307 @@
+"""
+Benchmark the search, lookup, scoring and ingest hot paths.
+
+Each dataset size gets a synthetic database (see syntheticData), loaded
+through the real ingest pipeline. Results are written as JSON and compared
+against a stored baseline, flagging anything that got slower than
+REGRESSION_THRESHOLD.
+
+    python benchmark.py --sizes 100k 1M
+    python benchmark.py --sizes 100k --save-baseline
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+from Database import FLAT_TYPES, TOWNS, Database
+from scoreCalculator import AREA_RANGES, PRICE_RANGES, score_calculator
+from syntheticData import STOREY_RANGES, build_database, write_csv
+
+# Named dataset sizes
+SIZES = {"100k": 100000, "1M": 1000000, "10M": 10000000}
+
+# Where generated CSVs and databases are kept between runs
+BENCHMARK_DIR = "benchmark_data"
+
+RESULTS_FILE = "benchmark_results.json"
+BASELINE_FILE = "benchmark_baseline.json"
+
+# Timed samples per benchmark
+REPEAT = 20
+
+# Calls per sample for operations too fast to time one at a time
+SCORE_CALLS = 1000
+
+# Median slowdown against the baseline reported as a regression
+REGRESSION_THRESHOLD = 1.25
+
+# Preference values offered on the preferences page
+PREFERENCE_OPTIONS = {
+    "flat_type": FLAT_TYPES[:6],
+    "storey_range": STOREY_RANGES[:10],
+    "floor_area_sqm": tuple(AREA_RANGES),
+    "flat_model": (
+        "Standard",
+        "Improved",
+        "New Generation",
+        "DBSS",
+        "Model A",
+        "Model A2",
+        "Premium Apartment",
+        "Maisonette",
+        "Apartment",
+        "Simplified",
+    ),
+    "price_range": tuple(PRICE_RANGES),
+}
+
+# Free-text searches, as typed into the search box
+TEXT_QUERIES = ("TAMPINES ST", "BEDOK", "WOODLANDS DR 5", "ANG MO KIO AVE")
+
+
+def random_preferences(rng):
+    """Pick a random, non-empty set of preferences"""
+    preferences = {criterion: "" for criterion in PREFERENCE_OPTIONS}
+    chosen = [c for c in PREFERENCE_OPTIONS if rng.random() < 0.6]
+    for criterion in chosen or [rng.choice(list(PREFERENCE_OPTIONS))]:
+        preferences[criterion] = rng.choice(PREFERENCE_OPTIONS[criterion])
+    return preferences
+
+
+def dataset_paths(label):
+    """Return the (CSV, database) paths of the synthetic dataset for a size"""
+    return (
+        os.path.join(BENCHMARK_DIR, f"hdb_resale_{label}.csv"),
+        os.path.join(BENCHMARK_DIR, f"hdb_flats_{label}.db"),
+    )
+
+
+def measure(run, repeat=REPEAT, number=1, setup=None):
+    """
+    Time a benchmark.
+
+    Args:
+        run: Callable taking the sample number
+        repeat: Number of timed samples
+        number: Calls of run per sample; times are reported per call
+        setup: Optional untimed callable run before each sample
+
+    Returns:
+        dict: runs and the min, median, p95 and mean time per call in ms
+    """
+    times = []
+    for sample in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        for call in range(number):
+            run(sample * number + call)
+        times.append((time.perf_counter() - started) * 1000 / number)
+    times.sort()
+    return {
+        "runs": repeat,
+        "min_ms": times[0],
+        "median_ms": statistics.median(times),
+        "p95_ms": times[min(len(times) - 1, int(len(times) * 0.95))],
+        "mean_ms": statistics.fmean(times),
+    }
+
+
+def benchmark_size(label, rows, repeat=REPEAT, reuse=False, workers=None, seed=0):
+    """
+    Build (or reuse) the dataset for one size and time every benchmark.
+
+    Returns:
+        dict: Benchmark name mapped to its measure() result
+    """
+    os.makedirs(BENCHMARK_DIR, exist_ok=True)
+    csv_path, db_path = dataset_paths(label)
+    results = {}
+
+    if not os.path.exists(csv_path):
+        print(f"[{label}] generating {rows} rows")
+        write_csv(csv_path, rows, seed)
+
+    if reuse and os.path.exists(db_path):
+        db = Database(db_path)
+    else:
+        print(f"[{label}] ingesting")
+        started = time.perf_counter()
+        db, _ = build_database(db_path, csv_path, workers)
+        elapsed = (time.perf_counter() - started) * 1000
+        results["ingest"] = {
+            "runs": 1,
+            "min_ms": elapsed,
+            "median_ms": elapsed,
+            "p95_ms": elapsed,
+            "mean_ms": elapsed,
+            "rows_per_second": rows / elapsed * 1000,
+        }
+
+    rng = random.Random(seed)
+    size = db.count_search_results("", "", "")
+    towns = [rng.choice(TOWNS) for _ in range(repeat)]
+    flat_types = [rng.choice(FLAT_TYPES[2:6]) for _ in range(repeat)]
+    queries = [rng.choice(TEXT_QUERIES) for _ in range(repeat)]
+    preferences = [random_preferences(rng) for _ in range(repeat * SCORE_CALLS)]
+    ids = [rng.randint(1, size) for _ in range(repeat * SCORE_CALLS)]
+    flats = [dict(flat) for flat in db.query_ids(ids[:SCORE_CALLS])]
+
+    searches = {
+        "search_flats/unfiltered": lambda i: db.search_flats("", "", "", limit=20),
+        "search_flats/town": lambda i: db.search_flats("", towns[i], "", limit=20),
+        "search_flats/town_type": lambda i: db.search_flats(
+            "", towns[i], flat_types[i], limit=20
+        ),
+        "search_flats/text": lambda i: db.search_flats(queries[i], "", "", limit=20),
+        "search_flats/deep_offset": lambda i: db.search_flats(
+            "", towns[i], "", limit=20, offset=2000
+        ),
+        "search_flats/score": lambda i: db.search_flats(
+            "",
+            towns[i],
+            "",
+            limit=20,
+            order_by="score",
+            preferences=preferences[i],
+        ),
+    }
+    for name, run in searches.items():
+        results[name] = measure(run, repeat)
+
+    # Counts are cached per data version, so time the query behind a miss
+    counts = {
+        "count_search_results/town": lambda i: db.count_search_results(
+            "", towns[i], ""
+        ),
+        "count_search_results/town_type": lambda i: db.count_search_results(
+            "", towns[i], flat_types[i]
+        ),
+        "count_search_results/text": lambda i: db.count_search_results(
+            queries[i], "", ""
+        ),
+    }
+    for name, run in counts.items():
+        results[name] = measure(run, repeat, setup=db.clear_count_cache)
+
+    results["query_id"] = measure(lambda i: db.query_id(ids[i]), repeat, SCORE_CALLS)
+    results["calculate_score"] = measure(
+        lambda i: score_calculator.calculate_score(
+            flats[i % len(flats)], preferences[i]
+        ),
+        repeat,
+        SCORE_CALLS,
+    )
+    results["get_score_breakdown"] = measure(
+        lambda i: score_calculator.get_score_breakdown(
+            flats[i % len(flats)], preferences[i]
+        ),
+        repeat,
+        SCORE_CALLS,
+    )
+
+    db.close()
+    return results
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    Print each benchmark's median against the baseline.
+
+    Returns:
+        list: (size, name, ratio) of every benchmark slower than threshold
+    """
+    regressions = []
+    print(f"{'benchmark':<40} {'median ms':>12} {'baseline':>12} {'ratio':>7}")
+    for label, size_results in results["sizes"].items():
+        baseline_results = baseline.get("sizes", {}).get(label, {}).get("results", {})
+        for name, stats in size_results["results"].items():
+            median = stats["median_ms"]
+            line = f"{label + ' ' + name:<40} {median:>12.3f}"
+            if name in baseline_results:
+                expected = baseline_results[name]["median_ms"]
+                ratio = median / expected if expected > 0 else 1.0
+                line += f" {expected:>12.3f} {ratio:>6.2f}x"
+                if ratio > threshold:
+                    regressions.append((label, name, ratio))
+                    line += "  REGRESSION"
+            print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the HDB Finder hot paths")
+    parser.add_argument(
+        "--sizes", nargs="+", choices=list(SIZES), default=["100k"], help="datasets"
+    )
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="samples each")
+    parser.add_argument(
+        "--reuse",
+        action="store_true",
+        help="reuse databases from an earlier run instead of timing ingest",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="ingest parser processes"
+    )
+    parser.add_argument("--output", default=RESULTS_FILE, help="results JSON path")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline JSON path")
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store these results as the new baseline",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=REGRESSION_THRESHOLD,
+        help="median slowdown ratio reported as a regression",
+    )
+    args = parser.parse_args()
+
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "sizes": {},
+    }
+    for label in args.sizes:
+        results["sizes"][label] = {
+            "rows": SIZES[label],
+            "results": benchmark_size(
+                label, SIZES[label], args.repeat, args.reuse, args.workers
+            ),
+        }
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    elif regressions:
+        print(f"{len(regressions)} benchmark(s) slower than the baseline.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
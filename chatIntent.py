@@ -0,0 +1,185 @@
+"""
+Rule-based parsing of the chat questions that need no generated SQL.
+
+Most questions only name a town, a flat type, a budget and whether to show
+the cheapest or the most expensive flats, which the search layer can answer
+directly. parse_intent() recognises those and declines anything else, so
+the caller can fall back to asking the model for SQL.
+"""
+
+import re
+
+from Database import TOWNS
+
+# Everyday names of towns besides the official ones
+TOWN_ALIASES = {
+    "AMK": "ANG MO KIO",
+    "BT BATOK": "BUKIT BATOK",
+    "BT MERAH": "BUKIT MERAH",
+    "BT PANJANG": "BUKIT PANJANG",
+    "BT TIMAH": "BUKIT TIMAH",
+    "CCK": "CHOA CHU KANG",
+    "KALLANG": "KALLANG/WHAMPOA",
+    "WHAMPOA": "KALLANG/WHAMPOA",
+    "TPY": "TOA PAYOH",
+}
+
+NUMBER_WORDS = {"ONE": 1, "TWO": 2, "THREE": 3, "FOUR": 4, "FIVE": 5}
+
+# Words a question may contain besides the recognised phrases; any other
+# word could change its meaning, so the question is left to the model
+FILLER_WORDS = {
+    "A", "ALL", "AN", "AND", "ANY", "APARTMENT", "APARTMENTS", "ARE", "AT",
+    "AVAILABLE", "BUY", "CAN", "FIND", "FLAT", "FLATS", "FOR", "GET", "GIVE",
+    "HDB", "HOME", "HOMES", "HOUSE", "HOUSES", "I", "IN", "IS", "LIST",
+    "LOOKING", "ME", "OF", "PLEASE", "PRICE", "PRICED", "PRICES", "RESALE",
+    "S", "SALE", "SEARCH", "SGD", "SHOW", "SOME", "THAT", "THE", "THERE", "TO",
+    "TOP", "UNIT", "UNITS", "WANT", "WHAT", "WHATS", "WHICH", "WITH", "YOU",
+}  # fmt: skip
+
+_AMOUNT = r"\$?\s*(\d+(?:[.,]\d+)*)\s*(K|M|MIL|MILLION|THOUSAND)?\b"
+_PRICE_PHRASES = (
+    (
+        "range",
+        re.compile(rf"\b(?:BETWEEN|FROM)\s+{_AMOUNT}\s*(?:AND|TO|-)\s*{_AMOUNT}"),
+    ),
+    (
+        "max",
+        re.compile(
+            r"\b(?:UNDER|BELOW|LESS THAN|CHEAPER THAN|WITHIN|UP TO|AT MOST"
+            rf"|MAX(?:IMUM)?|BUDGET(?: OF)?|NOT MORE THAN|NO MORE THAN)\s+{_AMOUNT}"
+        ),
+    ),
+    (
+        "min",
+        re.compile(
+            rf"\b(?:OVER|ABOVE|MORE THAN|AT LEAST|MIN(?:IMUM)?|FROM)\s+{_AMOUNT}"
+        ),
+    ),
+)
+_FLAT_TYPE_PHRASES = (
+    (re.compile(r"\b([1-5])\s*-?\s*(?:ROOMS?|RMS?|R)\b"), None),
+    (re.compile(rf"\b({'|'.join(NUMBER_WORDS)})\s*-?\s*ROOMS?\b"), None),
+    (re.compile(r"\bEXEC(?:UTIVE)?S?\b"), "EXECUTIVE"),
+    (re.compile(r"\bMULTI\s*-?\s*GEN(?:ERATION)?S?\b"), "MULTI-GENERATION"),
+)
+_SORT_PHRASES = (
+    (
+        re.compile(
+            r"\b(?:CHEAPEST|CHEAP|LOWEST PRICED|LOWEST|LEAST EXPENSIVE"
+            r"|MOST AFFORDABLE|AFFORDABLE|INEXPENSIVE)\b"
+        ),
+        "price_asc",
+    ),
+    (
+        re.compile(
+            r"\b(?:MOST EXPENSIVE|PRICIEST|PRICEY|EXPENSIVE|HIGHEST PRICED"
+            r"|HIGHEST|COSTLIEST|LUXURY)\b"
+        ),
+        "price",
+    ),
+)
+_TOWN_NAMES = {town: town for town in TOWNS}
+_TOWN_NAMES.update(TOWN_ALIASES)
+_TOWN_PHRASE = re.compile(
+    r"\b(?:"
+    + "|".join(
+        re.escape(name).replace(r"\ ", r"\s+")
+        for name in sorted(_TOWN_NAMES, key=len, reverse=True)
+    )
+    + r")\b"
+)
+
+
+def parse_amount(number, unit):
+    """
+    Turn a price such as ("1.2", "M") or ("450", "K") into dollars.
+
+    Returns:
+        int: The amount, or None when a bare small number leaves the unit
+        unclear (is "under 500" $500 or $500k?)
+    """
+    value = float(number.replace(",", ""))
+    if unit in ("K", "THOUSAND"):
+        value *= 1000
+    elif unit in ("M", "MIL", "MILLION"):
+        value *= 1000000
+    elif value < 10000:
+        return None
+    return int(value)
+
+
+def _take(text, pattern):
+    """Return the matches of pattern in text, and text with them blanked out"""
+    matches = list(pattern.finditer(text))
+    return matches, pattern.sub(" ", text)
+
+
+def parse_intent(message):
+    """
+    Recognise a question answerable by a plain search.
+
+    A question is only recognised when every word in it is accounted for:
+    at most one town, one flat type and one price phrase, an optional sort
+    word, and filler words. Anything else returns None.
+
+    Returns:
+        dict: town, flat_type ("" when not given), price_range as
+        (minimum, maximum) or None, and order_by for Database.search_flats;
+        or None when the question needs the model
+    """
+    text = " " + message.upper().replace("’", "'") + " "
+    intent = {"town": "", "flat_type": "", "price_range": None, "order_by": "price"}
+
+    for kind, pattern in _PRICE_PHRASES:
+        matches, text = _take(text, pattern)
+        if not matches:
+            continue
+        if len(matches) > 1 or intent["price_range"] is not None:
+            return None
+        groups = matches[0].groups()
+        amounts = [
+            parse_amount(groups[i], groups[i + 1]) for i in range(0, len(groups), 2)
+        ]
+        if None in amounts:
+            return None
+        if kind == "range":
+            intent["price_range"] = (min(amounts), max(amounts))
+        elif kind == "max":
+            intent["price_range"] = (None, amounts[0])
+        else:
+            intent["price_range"] = (amounts[0], None)
+
+    flat_types = set()
+    for pattern, flat_type in _FLAT_TYPE_PHRASES:
+        matches, text = _take(text, pattern)
+        for match in matches:
+            if flat_type is None:
+                rooms = match.group(1)
+                rooms = NUMBER_WORDS.get(rooms, rooms)
+                flat_types.add(f"{rooms} ROOM")
+            else:
+                flat_types.add(flat_type)
+
+    matches, text = _take(text, _TOWN_PHRASE)
+    towns = {_TOWN_NAMES[" ".join(match.group(0).split())] for match in matches}
+
+    orders = set()
+    for pattern, order_by in _SORT_PHRASES:
+        matches, text = _take(text, pattern)
+        if matches:
+            orders.add(order_by)
+
+    if len(flat_types) > 1 or len(towns) > 1 or len(orders) > 1:
+        return None
+    if not (flat_types or towns or intent["price_range"] or orders):
+        return None
+    # Any word left over could change the meaning, e.g. "average" or "near"
+    if any(word not in FILLER_WORDS for word in re.findall(r"[A-Z0-9]+", text)):
+        return None
+
+    intent["town"] = towns.pop() if towns else ""
+    intent["flat_type"] = flat_types.pop() if flat_types else ""
+    if orders:
+        intent["order_by"] = orders.pop()
+    return intent
@@ -1,36 +1,495 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+from itertools import islice
+
 import requests
-from Database import database
+from Database import FLAT_COLUMNS, SYNC_COLUMNS, database
+from flatStore import flat_store
+from scoreCalculator import score_calculator
 import pandas as pd
 from tqdm import tqdm
-from io import StringIO
 
+DATASET_ID = "d_2d5ff9ea31397b66239f245f57751537"
+
+# data.gov.sg API root; point it at a local stand-in to run offline
+API_BASE = os.environ.get("HDB_API_BASE", "https://api-open.data.gov.sg/v1/public/api")
+
+# Where the downloaded CSV is kept between runs. The sidecar file holds the
+# ETag/Last-Modified validators used to skip or resume downloads.
+DOWNLOAD_PATH = "hdb_resale.csv"
+DOWNLOAD_META_SUFFIX = ".meta.json"
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # bytes written per iter_content block
+DOWNLOAD_TIMEOUT = 60  # seconds to connect or wait for the next block
+
+# Rows parsed per CSV block; memory use is bounded by this, not the file
+CSV_CHUNK_SIZE = 50000
+
+# Parser processes in the ingest pipeline, leaving a core for the writer
+PIPELINE_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+# Parsed blocks allowed to wait for the writer before parsing pauses
+PIPELINE_QUEUE_SIZE = 4
+
+# Queue marker telling the writer to abandon the load
+_ABORT = object()
 
-dataset_id = "d_2d5ff9ea31397b66239f245f57751537"
-response = requests.get(
-    f"https://api-open.data.gov.sg/v1/public/api/datasets/{dataset_id}/poll-download"
+# Row hashes already in the database, set in each parser process
+_known_hashes = None
+
+# Source fields that together identify one resale transaction. Identical
+# transactions are told apart by their order of appearance in the file.
+NATURAL_KEY = (
+    "month",
+    "town",
+    "flat_type",
+    "block",
+    "street_name",
+    "storey_range",
+    "floor_area_sqm",
+    "flat_model",
+    "lease_commence_date",
 )
-# download file from response.url
-url = response.json().get("data", {}).get("url", "")
-if not url:
-    raise ValueError("Failed to get download URL from the API response.")
-response = requests.get(url)
-csv_data = StringIO(response.text)
-df = pd.read_csv(csv_data)
-
-database.clear_data()
-database.initdb()
-records_list = df.to_dict("records")
-for record in tqdm(records_list):
-    database.insert_flat(
-        town=record.get("town", ""),
-        flat_type=record.get("flat_type", ""),
-        block=record.get("block", ""),
-        street_name=record.get("street_name", ""),
-        storey_range=record.get("storey_range", ""),
-        floor_area_sqm=float(record.get("floor_area_sqm", 0)),
-        flat_model=record.get("flat_model", ""),
-        lease_commence_date=int(record.get("lease_commence_date", 0)),
-        resale_price=float(record.get("resale_price", 0)),
+
+
+def to_flat_record(record):
+    """Convert a raw CSV record into the column values stored in hdb_flats"""
+    flat = {
+        "town": record.get("town", ""),
+        "flat_type": record.get("flat_type", ""),
+        "block": record.get("block", ""),
+        "street_name": record.get("street_name", ""),
+        "storey_range": record.get("storey_range", ""),
+        "floor_area_sqm": float(record.get("floor_area_sqm", 0)),
+        "flat_model": record.get("flat_model", ""),
+        "lease_commence_date": int(record.get("lease_commence_date", 0)),
+        "resale_price": float(record.get("resale_price", 0)),
+    }
+    flat.update(score_calculator.derive_columns(flat))
+    return flat
+
+
+def _hex(hashes):
+    """Format a Series of uint64 hashes as fixed-width hex strings"""
+    return hashes.map("{:016x}".format)
+
+
+def row_hashes(df):
+    """
+    Hash every source field of each CSV row, read as text.
+
+    A corrected price changes the hash, so Database.sync_flats sees the
+    flat as changed rather than new.
+    """
+    return _hex(pd.util.hash_pandas_object(df[sorted(df.columns)], index=False))
+
+
+def source_keys(natural_key, occurrences):
+    """
+    Hash the natural key of each CSV row plus its occurrence number.
+
+    Identical keys are numbered in file order, so blocks must be passed in
+    the order they appear in the file.
+
+    Args:
+        natural_key: DataFrame of the NATURAL_KEY fields, read as text
+        occurrences: Dict of per-key row counts from earlier blocks of the
+            same file, updated in place
+
+    Returns:
+        pandas.Series: source_key of each row
+    """
+    occurrence = natural_key.groupby(
+        list(NATURAL_KEY), dropna=False, sort=False
+    ).cumcount()
+    # Continue the numbering from earlier blocks of the same file
+    key_hash = pd.util.hash_pandas_object(natural_key, index=False)
+    occurrence += key_hash.map(occurrences).fillna(0).astype("int64")
+    for key, count in key_hash.value_counts().items():
+        occurrences[key] = occurrences.get(key, 0) + count
+    return _hex(
+        pd.util.hash_pandas_object(
+            natural_key.assign(occurrence=occurrence), index=False
+        )
     )
 
-print(f"Inserted {df.shape[0]} records into the database.")
+
+def read_blocks(path, block_rows=CSV_CHUNK_SIZE):
+    """
+    Split the CSV at path into (header, text) blocks of block_rows lines.
+
+    Splitting on lines is only a file read, so the reader stays far ahead of
+    the parsers. The resale CSV has no quoted line breaks.
+    """
+    with open(path, newline="") as f:
+        header = f.readline()
+        while True:
+            lines = list(islice(f, block_rows))
+            if not lines:
+                return
+            yield header, "".join(lines)
+
+
+def _set_known_hashes(known_hashes):
+    """Pool initializer giving each parser the row hashes already stored"""
+    global _known_hashes
+    _known_hashes = known_hashes
+
+
+def parse_block(header, text):
+    """
+    Parse one CSV block into flats, in a pipeline worker process.
+
+    Coerces the field types, computes the derived columns and the row
+    hashes. Rows whose hash is already stored are most likely unchanged, so
+    they are returned as raw text rows and only converted if the caller
+    finds they are not. source_key depends on file order, so it is also
+    left to the caller.
+
+    Returns:
+        dict: natural_key and raw (DataFrames), row_hash and known (lists
+        over all rows), flats for the rows not known, and seconds spent
+    """
+    started = time.perf_counter()
+    # Read as text so the sync keys hash exactly what the file contains
+    df = pd.read_csv(StringIO(header + text), dtype=str)
+    hashes = row_hashes(df)
+    known = hashes.isin(_known_hashes) if _known_hashes else hashes.isna()
+    flats = [to_flat_record(record) for record in df[~known].to_dict("records")]
+    for flat, row_hash in zip(flats, hashes[~known]):
+        flat["row_hash"] = row_hash
+    return {
+        "natural_key": df.reindex(columns=list(NATURAL_KEY)),
+        "row_hash": hashes.tolist(),
+        "known": known.tolist(),
+        "flats": flats,
+        "raw": df[known],
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def run_pipeline(
+    path, write, stored_hashes=None, workers=PIPELINE_WORKERS, metadata=None
+):
+    """
+    Load the CSV at path through a staged ingest pipeline.
+
+    The reader splits the file into blocks, a process pool parses them, the
+    main process assigns source keys in file order, and one writer thread
+    passes the flats to write. At most two blocks per worker are in flight
+    and PIPELINE_QUEUE_SIZE batches wait for the writer, so a slow stage
+    holds back the ones before it instead of filling memory.
+
+    Args:
+        path: CSV file to load
+        write: Callable run on the writer thread with an iterable of flats,
+            such as Database.bulk_insert_flats; its result is returned
+        stored_hashes: For a sync, source_key to row_hash of the flats
+            already stored; rows whose hash matches are skipped
+        workers: Number of parser processes; 0 parses in this process
+        metadata: Optional dict that gets the sync_high_water_mark, the
+            latest month loaded, before write sees the last flat; pass it to
+            write to record it with the load
+
+    Returns:
+        tuple: (result of write, stats dict with per-stage rows and busy
+        seconds, the number of skipped rows and the latest month seen)
+    """
+    stats = {
+        "stages": {
+            stage: {"rows": 0, "seconds": 0.0}
+            for stage in ("read", "parse", "key", "write")
+        },
+        "skipped": 0,
+        "high_water_mark": "",
+    }
+    stages = stats["stages"]
+    batches = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    outcome = {}
+
+    def queued_flats():
+        while True:
+            waited = time.perf_counter()
+            batch = batches.get()
+            stages["write"]["seconds"] -= time.perf_counter() - waited
+            if batch is None:
+                return
+            if batch is _ABORT:
+                # Raised inside write, so the load is rolled back
+                raise RuntimeError("Ingest aborted by an earlier stage")
+            stages["write"]["rows"] += len(batch)
+            yield from batch
+
+    def writer():
+        started = time.perf_counter()
+        try:
+            outcome["result"] = write(queued_flats())
+        except BaseException as e:
+            outcome["error"] = e
+        stages["write"]["seconds"] += time.perf_counter() - started
+
+    def enqueue(batch):
+        # Blocks while the writer is behind; gives up if the writer died
+        while True:
+            try:
+                batches.put(batch, timeout=1)
+                return
+            except queue.Full:
+                if not writer_thread.is_alive():
+                    raise outcome.get("error") or RuntimeError("Writer stopped")
+
+    occurrences = {}
+
+    def handle(parsed):
+        natural_key = parsed["natural_key"]
+        stages["parse"]["rows"] += len(natural_key)
+        stages["parse"]["seconds"] += parsed["seconds"]
+
+        started = time.perf_counter()
+        flats = []
+        converted = iter(parsed["flats"])
+        raw_row = 0
+        for source_key, row_hash, known in zip(
+            source_keys(natural_key, occurrences), parsed["row_hash"], parsed["known"]
+        ):
+            if not known:
+                flat = next(converted)
+            else:
+                raw_row += 1
+                if stored_hashes.get(source_key) == row_hash:
+                    stats["skipped"] += 1
+                    continue
+                # Same contents as a stored flat, but a different transaction
+                flat = to_flat_record(parsed["raw"].iloc[raw_row - 1].to_dict())
+                flat["row_hash"] = row_hash
+            flat["source_key"] = source_key
+            flats.append(flat)
+        # Latest transaction month loaded; months sort as YYYY-MM text
+        if natural_key["month"].notna().any():
+            stats["high_water_mark"] = max(
+                stats["high_water_mark"], natural_key["month"].max()
+            )
+            if metadata is not None:
+                metadata["sync_high_water_mark"] = stats["high_water_mark"]
+        stages["key"]["rows"] += len(natural_key)
+        stages["key"]["seconds"] += time.perf_counter() - started
+        enqueue(flats)
+
+    def blocks():
+        started = time.perf_counter()
+        for header, text in read_blocks(path):
+            stages["read"]["rows"] += text.count("\n")
+            stages["read"]["seconds"] += time.perf_counter() - started
+            yield header, text
+            started = time.perf_counter()
+
+    writer_thread = threading.Thread(target=writer, name="ingest-writer")
+    writer_thread.start()
+    try:
+        known_hashes = set(stored_hashes.values()) if stored_hashes else None
+        if workers:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_set_known_hashes,
+                initargs=(known_hashes,),
+            ) as pool:
+                in_flight = deque()
+                for header, text in blocks():
+                    in_flight.append(pool.submit(parse_block, header, text))
+                    if len(in_flight) >= workers * 2:
+                        handle(in_flight.popleft().result())
+                while in_flight:
+                    handle(in_flight.popleft().result())
+        else:
+            _set_known_hashes(known_hashes)
+            for header, text in blocks():
+                handle(parse_block(header, text))
+    except BaseException:
+        # Make the writer roll back instead of committing a partial load
+        if writer_thread.is_alive():
+            enqueue(_ABORT)
+        writer_thread.join()
+        raise
+    enqueue(None)
+    writer_thread.join()
+
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"], stats
+
+
+def print_stage_stats(stats, elapsed):
+    """Print rows per busy second for each pipeline stage"""
+    print(f"Pipeline finished in {elapsed:.1f}s")
+    for stage, stage_stats in stats["stages"].items():
+        seconds = stage_stats["seconds"]
+        rate = stage_stats["rows"] / seconds if seconds > 0 else 0
+        print(
+            f"  {stage:<6} {stage_stats['rows']:>9} rows "
+            f"{seconds:>7.2f}s busy {rate:>10.0f} rows/s"
+        )
+
+
+def _read_download_meta(path):
+    """Return the validators saved for a download, or an empty dict"""
+    try:
+        with open(path + DOWNLOAD_META_SUFFIX) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_download_meta(path, meta):
+    """Save the validators for a download"""
+    with open(path + DOWNLOAD_META_SUFFIX, "w") as f:
+        json.dump(meta, f)
+
+
+def download_dataset(dataset_id, path=DOWNLOAD_PATH):
+    """
+    Download the resale dataset CSV to path, streaming it to disk.
+
+    A complete earlier download is revalidated with If-None-Match /
+    If-Modified-Since and kept when the server answers 304 Not Modified. An
+    interrupted download is resumed with a Range request guarded by
+    If-Range, so a file that changed in the meantime restarts from zero; a
+    range the server cannot satisfy (416) discards the partial file and
+    downloads it again in full.
+
+    Returns:
+        tuple: (dataset version from the file headers, whether the file
+        changed since the last complete download)
+    """
+    response = requests.get(
+        f"{API_BASE}/datasets/{dataset_id}/poll-download", timeout=DOWNLOAD_TIMEOUT
+    )
+    # download file from response.url
+    url = response.json().get("data", {}).get("url", "")
+    if not url:
+        raise ValueError("Failed to get download URL from the API response.")
+
+    meta = _read_download_meta(path)
+    partial = path + ".part"
+    validator = meta.get("etag") or meta.get("last_modified")
+    headers = {}
+    if os.path.exists(partial) and validator:
+        headers["Range"] = f"bytes={os.path.getsize(partial)}-"
+        headers["If-Range"] = validator
+    elif os.path.exists(path) and meta.get("complete"):
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    response = requests.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT)
+    if response.status_code == 416 and "Range" in headers:
+        # The partial file is no prefix of the file being served, e.g. it is
+        # already as long as it, so discard it and download from the start
+        response.close()
+        for stale in (partial, path + DOWNLOAD_META_SUFFIX):
+            if os.path.exists(stale):
+                os.remove(stale)
+        response = requests.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT)
+
+    with response:
+        if response.status_code == 304:
+            return validator, False
+        response.raise_for_status()
+
+        # Save the validators first so an interrupted download can resume
+        meta = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "complete": False,
+        }
+        _write_download_meta(path, meta)
+        # A 200 answer to a Range request means If-Range failed and the whole
+        # file follows, so "wb" truncates the stale partial file first
+        mode = "ab" if response.status_code == 206 else "wb"
+        with open(partial, mode) as f:
+            for block in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(block)
+
+    os.replace(partial, path)
+    meta["complete"] = True
+    _write_download_meta(path, meta)
+    return meta["etag"] or meta["last_modified"], True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load HDB resale transactions")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="clear the table and reload every record instead of syncing",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=PIPELINE_WORKERS,
+        help="parser processes in the ingest pipeline (0 parses in-process)",
+    )
+    args = parser.parse_args()
+
+    version, _ = download_dataset(DATASET_ID)
+
+    database.initdb()
+    full = args.full or database.get_metadata("sync_high_water_mark") is None
+    # Compare with the version last loaded, not the download: a file fetched
+    # by a run whose load then failed is unchanged, but still to be loaded
+    if not full and version and version == database.get_metadata("dataset_version"):
+        print("Dataset unchanged since the last load.")
+        return
+
+    # A database that was never synced has no keys to compare against
+    started = time.perf_counter()
+    # Recorded in the load's own transaction, so a failed load leaves the
+    # previous version and high-water mark in place
+    metadata = {"dataset_version": version}
+    if full:
+        # Replace every record in one transaction, fed block by block, so a
+        # failed load keeps the previous data
+        with tqdm(unit="rows") as progress_bar:
+            inserted, stats = run_pipeline(
+                DOWNLOAD_PATH,
+                lambda flats: database.bulk_insert_flats(
+                    flats,
+                    progress=progress_bar.update,
+                    columns=FLAT_COLUMNS + tuple(SYNC_COLUMNS),
+                    replace=True,
+                    metadata=metadata,
+                ),
+                workers=args.workers,
+                metadata=metadata,
+            )
+        print(f"Inserted {inserted} records into the database.")
+    else:
+        counts, stats = run_pipeline(
+            DOWNLOAD_PATH,
+            lambda flats: database.sync_flats(flats, metadata=metadata),
+            stored_hashes=database.source_hashes(),
+            workers=args.workers,
+            metadata=metadata,
+        )
+        counts["skipped"] += stats["skipped"]
+        print(
+            f"Synced {sum(counts.values())} records: {counts['added']} added, "
+            f"{counts['changed']} changed, {counts['skipped']} skipped."
+        )
+    print_stage_stats(stats, time.perf_counter() - started)
+
+    if not full and not counts["added"] and not counts["changed"]:
+        return
+
+    # Columnar snapshot used to rank searches without going through SQLite
+    flat_store.export()
+
+
+if __name__ == "__main__":
+    main()
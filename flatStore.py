@@ -0,0 +1,313 @@
+import json
+import os
+import re
+import shutil
+import threading
+
+import numpy as np
+
+from Database import FLAT_TYPES, TOWNS, database
+from queryTrace import query_tracer
+from scoreCalculator import score_calculator
+
+# Directory holding one subdirectory of .npy columns per data version
+SNAPSHOT_DIR = os.environ.get("HDB_SNAPSHOT_DIR", "hdb_snapshot")
+
+# File naming the snapshot version readers should load
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+
+# Text columns, stored as int32 codes into a per-column vocabulary
+STRING_COLUMNS = (
+    "town",
+    "flat_type",
+    "block",
+    "street_name",
+    "storey_range",
+    "flat_model",
+    "model_category",
+)
+
+# Numeric columns and the narrow type each is stored as. A column stays
+# float64 when narrowing would change any value, so scores computed from the
+# snapshot match the ones computed from SQLite.
+NUMERIC_COLUMNS = {
+    "id": np.int32,
+    "floor_area_sqm": np.float32,
+    "lease_commence_date": np.int32,
+    "resale_price": np.float32,
+    "room_count": np.float32,  # NaN where the flat type has no room count
+    "storey_mid": np.float32,
+}
+
+
+# Rows read from SQLite per fetchmany call while exporting
+EXPORT_CHUNK_SIZE = 10000
+
+
+class FlatStore:
+    """Read-only columnar snapshot of hdb_flats for ranking and analytics"""
+
+    def __init__(self, snapshot_dir=SNAPSHOT_DIR, db=database):
+        self.snapshot_dir = snapshot_dir
+        self.database = db
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def export(self):
+        """
+        Write the current contents of hdb_flats as a new snapshot version.
+
+        Columns are written to a fresh directory and published by replacing
+        the CURRENT file, so readers never see a half-written snapshot. Rows
+        are read in chunks into preallocated arrays, so the table is never
+        held in memory as Python objects.
+
+        Returns:
+            int: Number of flats exported
+        """
+        columns = STRING_COLUMNS + tuple(NUMERIC_COLUMNS)
+        with self.database.checkout() as connection, query_tracer.quiet():
+            # One read transaction, so the version, count and rows agree
+            connection.execute("BEGIN")
+            version = self.database.data_version()
+            size = connection.execute("SELECT COUNT(*) FROM hdb_flats").fetchone()[0]
+            values = {column: np.empty(size, np.int32) for column in STRING_COLUMNS}
+            values.update({column: np.empty(size) for column in NUMERIC_COLUMNS})
+            indexes = {column: {} for column in STRING_COLUMNS}
+
+            cursor = connection.execute(
+                f"SELECT {', '.join(columns)} FROM hdb_flats ORDER BY id"
+            )
+            cursor.row_factory = None
+            start = 0
+            while True:
+                rows = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+                if not rows:
+                    break
+                end = start + len(rows)
+                for column, chunk in zip(columns, zip(*rows)):
+                    if column in indexes:
+                        chunk = self._encode(chunk, indexes[column])
+                    values[column][start:end] = chunk
+                start = end
+            connection.rollback()
+
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        target = os.path.join(self.snapshot_dir, f"v{version}")
+        staging = target + ".tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+
+        vocabularies = {}
+        for column in STRING_COLUMNS:
+            vocabularies[column] = list(indexes[column])
+            np.save(os.path.join(staging, f"{column}.npy"), values[column])
+        for column, dtype in NUMERIC_COLUMNS.items():
+            array = self._narrow(values[column], dtype)
+            np.save(os.path.join(staging, f"{column}.npy"), array)
+
+        manifest = {"version": version, "size": size, "vocabularies": vocabularies}
+        with open(os.path.join(staging, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f)
+
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(staging, target)
+        previous = self._current_version()
+        self._write_current(version)
+
+        # Keep the previous version for readers still opening it
+        keep = {f"v{version}", f"v{previous}"}
+        for name in os.listdir(self.snapshot_dir):
+            path = os.path.join(self.snapshot_dir, name)
+            if os.path.isdir(path) and name not in keep:
+                shutil.rmtree(path, ignore_errors=True)
+
+        return size
+
+    def _encode(self, values, index):
+        """
+        Dictionary-encode text values into int32 codes.
+
+        index maps each value seen so far to its code and is extended in
+        place, so a column can be encoded one chunk at a time.
+        """
+        return np.fromiter(
+            (index.setdefault(value, len(index)) for value in values),
+            np.int32,
+            len(values),
+        )
+
+    def _narrow(self, values, dtype):
+        """Convert values to dtype if that loses nothing, else to float64"""
+        array = np.asarray(values, dtype=float)
+        with np.errstate(invalid="ignore"):
+            narrow = array.astype(dtype)
+        if np.array_equal(narrow.astype(float), array, equal_nan=True):
+            return narrow
+        return array
+
+    def _current_version(self):
+        """Read the published snapshot version, or None if there is none"""
+        try:
+            with open(os.path.join(self.snapshot_dir, CURRENT_FILE)) as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def _write_current(self, version):
+        """Atomically point readers at a snapshot version"""
+        path = os.path.join(self.snapshot_dir, CURRENT_FILE)
+        with open(path + ".tmp", "w") as f:
+            f.write(str(version))
+        os.replace(path + ".tmp", path)
+
+    def load(self):
+        """
+        Return the published snapshot, reloading it if the version changed.
+
+        Columns are memory-mapped read-only, so every process serving
+        requests shares the same page cache instead of holding a copy.
+
+        Returns:
+            dict: version, size, columns and vocabularies, or None if no
+            snapshot has been exported
+        """
+        version = self._current_version()
+        if version is None:
+            return None
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot["version"] == version:
+            return snapshot
+
+        with self._lock:
+            if self._snapshot is not None and self._snapshot["version"] == version:
+                return self._snapshot
+            directory = os.path.join(self.snapshot_dir, f"v{version}")
+            try:
+                with open(os.path.join(directory, MANIFEST_FILE)) as f:
+                    manifest = json.load(f)
+                columns = {
+                    column: np.load(
+                        os.path.join(directory, f"{column}.npy"), mmap_mode="r"
+                    )
+                    for column in STRING_COLUMNS + tuple(NUMERIC_COLUMNS)
+                }
+            except (OSError, ValueError):
+                return None
+            self._snapshot = {
+                "version": manifest["version"],
+                "size": manifest["size"],
+                "columns": columns,
+                "vocabularies": manifest["vocabularies"],
+            }
+            return self._snapshot
+
+    def current(self):
+        """
+        Return the published snapshot if it matches the database contents.
+
+        Pass the returned snapshot to filter, sort and rank, so a request
+        keeps using one version even if a new one is published meanwhile.
+
+        Returns:
+            dict: The snapshot, as returned by load, or None if there is no
+            snapshot or it is out of date
+        """
+        snapshot = self.load()
+        if snapshot is None or snapshot["version"] != self.database.data_version():
+            return None
+        return snapshot
+
+    def is_current(self):
+        """Check that a snapshot exists and matches the database contents"""
+        return self.current() is not None
+
+    def filter(self, snapshot, town="", flat_type=""):
+        """
+        Select the flats matching the town and flat type search filters.
+
+        Uses the same rules as the SQLite search: dropdown values match
+        exactly and anything else is a case-insensitive LIKE '%value%'.
+
+        Returns:
+            numpy.ndarray: Row positions of the matching flats
+        """
+        mask = np.ones(snapshot["size"], dtype=bool)
+        for column, value, vocabulary in (
+            ("town", town, TOWNS),
+            ("flat_type", flat_type, FLAT_TYPES),
+        ):
+            if not value:
+                continue
+            codes = self._matching_codes(
+                snapshot["vocabularies"][column], value, vocabulary
+            )
+            mask &= np.isin(snapshot["columns"][column], codes)
+        return np.flatnonzero(mask)
+
+    def _matching_codes(self, stored_values, value, vocabulary):
+        """Return the codes of the stored values a search filter matches"""
+        # Dropdown values are matched exactly; free text keeps LIKE semantics
+        if value.strip().upper() in vocabulary:
+            return [
+                code
+                for code, stored in enumerate(stored_values)
+                if stored == value.strip().upper()
+            ]
+        pattern = self._like_pattern(f"%{value}%")
+        return [
+            code
+            for code, stored in enumerate(stored_values)
+            if stored is not None and pattern.fullmatch(stored)
+        ]
+
+    def _like_pattern(self, pattern):
+        """Translate a SQL LIKE pattern into an equivalent regular expression"""
+        parts = []
+        for char in pattern:
+            if char == "%":
+                parts.append(".*")
+            elif char == "_":
+                parts.append(".")
+            else:
+                parts.append(re.escape(char))
+        return re.compile("".join(parts), re.IGNORECASE | re.DOTALL)
+
+    def sort(self, snapshot, rows, column="resale_price", descending=True):
+        """
+        Order row positions by a numeric column, breaking ties by ascending id.
+
+        The default is the price order used by the search pages.
+        """
+        columns = snapshot["columns"]
+        values = columns[column][rows]
+        ids = columns["id"][rows]
+        order = np.lexsort((ids, -values if descending else values))
+        return rows[order]
+
+    def columns(self, snapshot, names, rows):
+        """Return the named columns for the given row positions"""
+        columns = snapshot["columns"]
+        return {name: columns[name][rows] for name in names}
+
+    def rank(self, snapshot, preferences, rows, k):
+        """
+        Select the k best-matching flats among the given row positions.
+
+        Flats with equal scores keep the order of rows.
+
+        Returns:
+            list: (score, flat id) tuples, best match first
+        """
+        ranked = score_calculator.rank_flats(
+            self.columns(snapshot, score_calculator.columns, rows),
+            preferences,
+            k,
+            snapshot["vocabularies"],
+        )
+        ids = snapshot["columns"]["id"]
+        return [(score, int(ids[rows[index]])) for score, index in ranked]
+
+
+flat_store = FlatStore()
@@ -0,0 +1,525 @@
+"""
+Load test the Flask routes against a synthetic database.
+
+Starts app.py in a separate process on a synthetic dataset (see
+syntheticData), with the AI assistant backed by FakeModel so nothing goes
+over the network. A pool of virtual users then sends a weighted mix of
+requests for a fixed duration. Each reports p50/p90/p99 latency, requests
+per second and a latency histogram per route.
+
+    python loadTest.py --size 100k --concurrency 8 --duration 30
+    python loadTest.py --mix search=50,flat=30,chat=10,analyze=10
+    python loadTest.py --preferences "flat_type=4 ROOM,price_range=500k-600k"
+"""
+
+import argparse
+import bisect
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+from Database import TOWNS, Database
+from benchmark import BENCHMARK_DIR, SIZES, TEXT_QUERIES, dataset_paths
+from flatStore import FlatStore
+from syntheticData import FLAT_TYPE_PROFILES, TOWN_WEIGHTS, build_database, write_csv
+
+HOST = "127.0.0.1"
+PORT = 5055
+
+# Seconds to wait for the app process to start answering
+STARTUP_TIMEOUT = 120
+
+# Per-request timeout, so a stalled server shows up as errors
+REQUEST_TIMEOUT = 30
+
+# Routes a request mix can include; the last four are the AI endpoints
+ROUTES = (
+    "search",
+    "flat",
+    "favorites",
+    "compare",
+    "chat",
+    "chat_stream",
+    "analyze",
+    "ai_compare",
+)
+
+# Relative weight of each route in the default request mix
+DEFAULT_MIX = {"search": 60, "flat": 25, "favorites": 8, "compare": 7}
+
+# Flats added to favourites before the run, for /favorites and /compare
+FAVORITES = 10
+
+# Share of flat views going to a small set of popular listings
+HOT_FLAT_SHARE = 0.8
+HOT_FLATS = 1000
+
+# Upper bounds of the latency histogram buckets, in ms
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+HISTOGRAM_WIDTH = 40
+
+# Simulated model response time in seconds, as (mean, jitter)
+FAKE_MODEL_LATENCY = (0.8, 0.4)
+
+# Streamed responses: share of the response time spent before the first
+# chunk, and words per chunk
+FAKE_FIRST_CHUNK_SHARE = 0.2
+FAKE_CHUNK_WORDS = 8
+
+# Chat messages sent when the mix includes the chat route
+CHAT_MESSAGES = (
+    "Show me 4 room flats in Tampines",
+    "Cheapest flats in Bedok",
+    "What are the most expensive executive flats in Punggol?",
+    "3 room flats in Ang Mo Kio under 400k",
+    "Compare prices between Bishan and Toa Payoh",
+)
+
+
+class FakeResponse:
+    """Stand-in for a Gemini response, exposing only text"""
+
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """
+    Local stand-in for the Gemini model used by AIAssistant.
+
+    Sleeps for a simulated generation time, then answers SQL-generation
+    prompts with a valid query on the town named in the question and any
+    other prompt with a fixed-length answer. With stream=True the answer
+    arrives in chunks spread over the generation time.
+    """
+
+    def __init__(self, latency=FAKE_MODEL_LATENCY, seed=0):
+        self.latency = latency
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, stream=False):
+        mean, jitter = self.latency
+        with self._lock:
+            delay = max(0.0, self._rng.uniform(mean - jitter, mean + jitter))
+
+        if "SQL query" in prompt:
+            question = re.search(r"User Query: (.*)", prompt)
+            question = question.group(1).upper() if question else ""
+            town = next((town for town in TOWNS if town in question), None)
+            where = f" WHERE town = '{town}'" if town else ""
+            text = f"SELECT * FROM hdb_flats{where} ORDER BY resale_price DESC LIMIT 10"
+        else:
+            text = " ".join(["This flat looks reasonably priced."] * 40)
+
+        if stream:
+            return self._stream(text, delay)
+        time.sleep(delay)
+        return FakeResponse(text)
+
+    def _stream(self, text, delay):
+        """Yield text in chunks, the first after part of the delay"""
+        words = text.split(" ")
+        chunks = [
+            " ".join(words[start : start + FAKE_CHUNK_WORDS])
+            for start in range(0, len(words), FAKE_CHUNK_WORDS)
+        ]
+        first = delay * FAKE_FIRST_CHUNK_SHARE
+        time.sleep(first)
+        yield FakeResponse(chunks[0])
+        for chunk in chunks[1:]:
+            time.sleep((delay - first) / (len(chunks) - 1))
+            yield FakeResponse(" " + chunk)
+
+
+def serve(port, model_latency):
+    """Run app.py on a threaded server with the AI assistant faked"""
+    from werkzeug.serving import make_server
+
+    import ai_assistant
+    from app import app
+
+    # Per-request access logging would dominate the measurements
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    ai_assistant.ai_assistant = ai_assistant.AIAssistant(model=FakeModel(model_latency))
+    make_server(HOST, port, app, threaded=True).serve_forever()
+
+
+def prepare_dataset(label, workers=None):
+    """
+    Build the synthetic database and snapshot for a size, unless present.
+
+    Returns:
+        tuple: (database path, snapshot directory, number of flats)
+    """
+    os.makedirs(BENCHMARK_DIR, exist_ok=True)
+    csv_path, db_path = dataset_paths(label)
+    snapshot_dir = os.path.join(BENCHMARK_DIR, f"hdb_snapshot_{label}")
+
+    if not os.path.exists(db_path):
+        if not os.path.exists(csv_path):
+            print(f"[{label}] generating {SIZES[label]} rows")
+            write_csv(csv_path, SIZES[label])
+        print(f"[{label}] ingesting")
+        db, _ = build_database(db_path, csv_path, workers)
+    else:
+        db = Database(db_path)
+
+    store = FlatStore(snapshot_dir, db)
+    if not store.is_current():
+        print(f"[{label}] exporting snapshot")
+        store.export()
+    size = db.count_search_results("", "", "")
+    db.close()
+    return db_path, snapshot_dir, size
+
+
+def start_app(db_path, snapshot_dir, port, model_latency):
+    """Start the app process and wait until it answers"""
+    env = dict(
+        os.environ,
+        HDB_DATABASE=os.path.abspath(db_path),
+        HDB_SNAPSHOT_DIR=os.path.abspath(snapshot_dir),
+    )
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--serve",
+            "--port",
+            str(port),
+            "--model-latency",
+            ",".join(map(str, model_latency)),
+        ],
+        env=env,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        # The assistant prints every generated query; keep errors only
+        stdout=subprocess.DEVNULL,
+    )
+
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("The app process exited during startup")
+        try:
+            requests.get(f"http://{HOST}:{port}/", timeout=1)
+            return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"The app did not start within {STARTUP_TIMEOUT}s")
+
+
+class Workload:
+    """Random requests following realistic search filter and page patterns"""
+
+    def __init__(self, size, favorites, mix, seed=0):
+        self.size = size
+        self.favorites = favorites
+        self.routes = list(mix)
+        self.weights = list(mix.values())
+        self.rng = random.Random(seed)
+        self.towns = list(TOWN_WEIGHTS)
+        self.town_weights = list(TOWN_WEIGHTS.values())
+        self.flat_types = list(FLAT_TYPE_PROFILES)
+        self.type_weights = [profile[0] for profile in FLAT_TYPE_PROFILES.values()]
+        self.hot_flats = [self.rng.randint(1, size) for _ in range(HOT_FLATS)]
+        self.handlers = {
+            "search": self.search,
+            "flat": self.flat,
+            "favorites": self.favorites_page,
+            "compare": self.compare,
+            "chat": self.chat,
+            "chat_stream": self.chat_stream,
+            "analyze": self.analyze,
+            "ai_compare": self.ai_compare,
+        }
+
+    def flat_id(self, rng):
+        """Pick a flat, mostly from the popular listings"""
+        if rng.random() < HOT_FLAT_SHARE:
+            return rng.choice(self.hot_flats)
+        return rng.randint(1, self.size)
+
+    def page(self, rng):
+        """Pick a results page: mostly the first few, occasionally a deep one"""
+        if rng.random() < 0.01:
+            return rng.randint(50, 500)
+        page = 1
+        while page < 20 and rng.random() < 0.35:
+            page += 1
+        return page
+
+    def search(self, rng):
+        params = {}
+        if rng.random() < 0.7:
+            params["town"] = rng.choices(self.towns, self.town_weights)[0]
+        if rng.random() < 0.5:
+            params["flat_type"] = rng.choices(self.flat_types, self.type_weights)[0]
+        if rng.random() < 0.1:
+            params["q"] = rng.choice(TEXT_QUERIES)
+        page = self.page(rng)
+        if page > 1:
+            params["page"] = page
+        return "GET", "/search", {"params": params}
+
+    def flat(self, rng):
+        return "GET", f"/flat/{self.flat_id(rng)}", {}
+
+    def favorites_page(self, rng):
+        return "GET", "/favorites", {}
+
+    def compare(self, rng):
+        flat_id1, flat_id2 = rng.sample(self.favorites, 2)
+        return "GET", f"/compare/{flat_id1}/{flat_id2}", {}
+
+    def chat(self, rng):
+        message = rng.choice(CHAT_MESSAGES)
+        return "POST", "/api/ai/chat", {"json": {"message": message, "history": []}}
+
+    def chat_stream(self, rng):
+        method, _, kwargs = self.chat(rng)
+        return method, "/api/ai/chat/stream", kwargs
+
+    def analyze(self, rng):
+        return "GET", f"/api/ai/analyze_flat/{self.flat_id(rng)}", {}
+
+    def ai_compare(self, rng):
+        flat_id1, flat_id2 = rng.sample(self.favorites, 2)
+        return "GET", f"/api/ai/compare/{flat_id1}/{flat_id2}", {}
+
+    def next_request(self, rng):
+        """Return (route, method, path, request kwargs) for the next request"""
+        route = rng.choices(self.routes, self.weights)[0]
+        return (route,) + self.handlers[route](rng)
+
+
+def run_load(base_url, workload, concurrency, duration, warmup):
+    """
+    Drive the app with concurrent virtual users.
+
+    Each user sends its next request as soon as the previous one returns,
+    so the request rate found is the ceiling at this concurrency.
+
+    Returns:
+        tuple: (latencies in ms per route, error counts per route, seconds
+        measured)
+    """
+    latencies = {route: [] for route in workload.routes}
+    errors = {route: 0 for route in workload.routes}
+    lock = threading.Lock()
+    started = time.monotonic()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    def user(seed):
+        rng = random.Random(seed)
+        session = requests.Session()
+        while True:
+            route, method, path, kwargs = workload.next_request(rng)
+            sent = time.monotonic()
+            if sent >= stop_at:
+                return
+            try:
+                response = session.request(
+                    method,
+                    base_url + path,
+                    allow_redirects=False,
+                    timeout=REQUEST_TIMEOUT,
+                    **kwargs,
+                )
+                failed = response.status_code >= 400
+            except requests.RequestException:
+                failed = True
+            elapsed = (time.monotonic() - sent) * 1000
+            if sent < measure_from:
+                continue
+            with lock:
+                latencies[route].append(elapsed)
+                errors[route] += failed
+
+    threads = [
+        threading.Thread(target=user, args=(index,)) for index in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, duration
+
+
+def percentile(sorted_values, fraction):
+    """Return the value below which the given fraction of values fall"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * fraction))
+    return sorted_values[index]
+
+
+def histogram(values):
+    """Count values into LATENCY_BUCKETS_MS, plus one overflow bucket"""
+    counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+    for value in values:
+        counts[bisect.bisect_left(LATENCY_BUCKETS_MS, value)] += 1
+    return counts
+
+
+def summarize(latencies, errors, seconds):
+    """
+    Summarize per-route latencies.
+
+    Returns:
+        dict: Route mapped to its request count, errors, rps, latency
+        percentiles in ms and histogram bucket counts
+    """
+    summary = {}
+    for route, values in latencies.items():
+        values = sorted(values)
+        summary[route] = {
+            "requests": len(values),
+            "errors": errors[route],
+            "rps": len(values) / seconds,
+            "p50_ms": percentile(values, 0.50),
+            "p90_ms": percentile(values, 0.90),
+            "p99_ms": percentile(values, 0.99),
+            "max_ms": values[-1] if values else 0.0,
+            "mean_ms": statistics.fmean(values) if values else 0.0,
+            "histogram": histogram(values),
+        }
+    return summary
+
+
+def print_summary(summary):
+    """Print the per-route table and latency histograms"""
+    total = sum(stats["requests"] for stats in summary.values())
+    rps = sum(stats["rps"] for stats in summary.values())
+    print(f"\n{total} requests, {rps:.1f} requests/s\n")
+    print(
+        f"{'route':<12} {'requests':>9} {'errors':>7} {'rps':>8} "
+        f"{'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+    )
+    for route, stats in summary.items():
+        print(
+            f"{route:<12} {stats['requests']:>9} {stats['errors']:>7} "
+            f"{stats['rps']:>8.1f} {stats['p50_ms']:>9.1f} {stats['p90_ms']:>9.1f} "
+            f"{stats['p99_ms']:>9.1f} {stats['max_ms']:>9.1f}"
+        )
+
+    labels = [f"<= {bound} ms" for bound in LATENCY_BUCKETS_MS]
+    labels.append(f"> {LATENCY_BUCKETS_MS[-1]} ms")
+    for route, stats in summary.items():
+        counts = stats["histogram"]
+        if not stats["requests"]:
+            continue
+        print(f"\n{route}")
+        peak = max(counts)
+        for label, count in zip(labels, counts):
+            if count:
+                bar = "#" * max(1, round(count / peak * HISTOGRAM_WIDTH))
+                print(f"  {label:>12} {count:>8} {bar}")
+
+
+def parse_pairs(text):
+    """Parse "key=value,key=value" into a dict"""
+    pairs = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        key, _, value = item.partition("=")
+        pairs[key.strip()] = value.strip()
+    return pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the HDB Finder routes")
+    parser.add_argument("--size", choices=list(SIZES), default="100k")
+    parser.add_argument("--concurrency", type=int, default=8, help="virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds measured")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds discarded")
+    parser.add_argument(
+        "--mix",
+        default=",".join(f"{route}={weight}" for route, weight in DEFAULT_MIX.items()),
+        help=f"route=weight pairs; routes: {', '.join(ROUTES)}",
+    )
+    parser.add_argument(
+        "--preferences",
+        default="",
+        help='preferences set before the run, e.g. "flat_type=4 ROOM"',
+    )
+    parser.add_argument(
+        "--model-latency",
+        default=",".join(map(str, FAKE_MODEL_LATENCY)),
+        help="fake model response time in seconds, as mean,jitter",
+    )
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--output", help="write the summary as JSON to this path")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    model_latency = tuple(float(part) for part in args.model_latency.split(","))
+    if args.serve:
+        serve(args.port, model_latency)
+        return
+
+    mix = {route: float(weight) for route, weight in parse_pairs(args.mix).items()}
+    unknown = set(mix) - set(ROUTES)
+    if unknown:
+        parser.error(f"unknown routes in --mix: {', '.join(sorted(unknown))}")
+
+    db_path, snapshot_dir, size = prepare_dataset(args.size)
+    process = start_app(db_path, snapshot_dir, args.port, model_latency)
+    base_url = f"http://{HOST}:{args.port}"
+    try:
+        # The app keeps one user's preferences and favourites
+        with requests.Session() as session:
+            session.post(
+                base_url + "/preferences",
+                data=parse_pairs(args.preferences),
+                allow_redirects=False,
+            )
+            rng = random.Random(0)
+            favorites = rng.sample(range(1, size + 1), FAVORITES)
+            for flat_id in favorites:
+                session.post(
+                    f"{base_url}/add_to_favorites/{flat_id}", allow_redirects=False
+                )
+
+        workload = Workload(size, favorites, mix)
+        print(
+            f"Running {args.concurrency} users for {args.duration:.0f}s "
+            f"against {size} flats"
+        )
+        latencies, errors, seconds = run_load(
+            base_url, workload, args.concurrency, args.duration, args.warmup
+        )
+    finally:
+        process.terminate()
+        process.wait()
+
+    summary = summarize(latencies, errors, seconds)
+    print_summary(summary)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "size": args.size,
+                    "concurrency": args.concurrency,
+                    "duration": args.duration,
+                    "mix": mix,
+                    "latency_buckets_ms": LATENCY_BUCKETS_MS,
+                    "routes": summary,
+                },
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
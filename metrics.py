@@ -0,0 +1,261 @@
+"""
+Per-request timing metrics, exposed in the Prometheus text format.
+
+Each request records its total latency and the time spent in each
+component (database queries, scoring, template rendering, Gemini calls).
+Components are timed with metrics.timed() or the metrics.timer() decorator;
+outside a request, or when a component is already being timed further up
+the stack, they cost one thread-local lookup and record nothing.
+
+Chat questions are also counted by how their data was retrieved, which
+shows how often the local intent parser spares a model call.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Components a request's time is broken down into
+COMPONENTS = ("database", "score", "template", "gemini")
+
+# Prefix of every exported metric name
+NAMESPACE = "hdb"
+
+
+def _escape(value):
+    """Escape a label value for the text exposition format"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    """Format a label set, e.g. {route="/search",method="GET"}"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter with a fixed set of label names"""
+
+    def __init__(self, name, documentation, label_names):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        """Return the counter's lines in the text exposition format"""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            lines.append(
+                f"{self.name}{_labels(self.label_names, label_values)} {value}"
+            )
+        return lines
+
+
+class Histogram:
+    """Histogram of observed values with a fixed set of label names"""
+
+    def __init__(self, name, documentation, label_names, buckets=BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        # Label values -> [per-bucket counts..., overflow count, sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        """Return the histogram's lines in the text exposition format"""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            series = sorted((key, list(value)) for key, value in self._series.items())
+        for label_values, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                labels = _labels(self.label_names, label_values, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            count = cumulative + values[-2]
+            labels = _labels(self.label_names, label_values, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {values[-1]}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class RequestMetrics:
+    """Collect request latencies and their per-component breakdown"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self.requests = Counter(
+            f"{NAMESPACE}_requests_total",
+            "Requests handled, by route, method and status code.",
+            ("route", "method", "status"),
+        )
+        self.latency = Histogram(
+            f"{NAMESPACE}_request_duration_seconds",
+            "Total time to handle a request.",
+            ("route", "method"),
+        )
+        self.components = Histogram(
+            f"{NAMESPACE}_request_component_seconds",
+            "Time a request spent in each component, for requests that used it.",
+            ("route", "component"),
+        )
+        self.chat_context = Counter(
+            f"{NAMESPACE}_chat_context_total",
+            "Chat questions by how their data was retrieved: fast_path (parsed"
+            " locally), sql_cache (cached SQL) or generated (SQL from the model).",
+            ("source",),
+        )
+
+    def start_request(self):
+        """Begin timing a request on the current thread"""
+        self._local.timings = {}
+        self._local.active = set()
+        self._local.started = time.perf_counter()
+
+    def finish_request(self, route, method, status):
+        """Record the current thread's request and stop timing it"""
+        timings = getattr(self._local, "timings", None)
+        if timings is None:
+            return
+        elapsed = time.perf_counter() - self._local.started
+        # Clear the thread's state before recording, so it never outlives
+        # the request
+        self._local.timings = None
+        self._local.active = set()
+
+        self.requests.inc((route, method, str(status)))
+        self.latency.observe((route, method), elapsed)
+        for component, seconds in timings.items():
+            self.components.observe((route, component), seconds)
+
+    def stream(self, body, route, method, status):
+        """
+        Keep timing the current thread's request while body is iterated.
+
+        A streamed response body runs after the view has returned, so the
+        request is recorded when the body is exhausted or closed instead.
+        Its timing state is detached from the thread between chunks.
+
+        Returns:
+            generator: The chunks of body
+        """
+        timings = getattr(self._local, "timings", None)
+        if timings is None:
+            return body
+        state = (timings, self._local.active, self._local.started)
+        self._local.timings = None
+        self._local.active = set()
+        return self._stream(body, state, route, method, status)
+
+    def _stream(self, body, state, route, method, status):
+        """Yield the chunks of body with the request's timing state attached"""
+        chunks = iter(body)
+        try:
+            while True:
+                self._local.timings, self._local.active, self._local.started = state
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    break
+                finally:
+                    self._local.timings = None
+                yield chunk
+        finally:
+            if hasattr(body, "close"):
+                body.close()
+            self._local.timings, self._local.active, self._local.started = state
+            self.finish_request(route, method, status)
+
+    def _begin(self, component):
+        """Start timing a component, or return None if there is nothing to do"""
+        timings = getattr(self._local, "timings", None)
+        # Nested calls are already covered by the outermost one
+        if timings is None or component in self._local.active:
+            return None
+        self._local.active.add(component)
+        return timings, time.perf_counter()
+
+    def _end(self, component, token):
+        """Add the time since _begin to the request's component"""
+        timings, started = token
+        self._local.active.discard(component)
+        timings[component] = timings.get(component, 0.0) + time.perf_counter() - started
+
+    @contextmanager
+    def timed(self, component):
+        """Add the time spent in the block to the current request's component"""
+        token = self._begin(component)
+        if token is None:
+            yield
+            return
+        try:
+            yield
+        finally:
+            self._end(component, token)
+
+    def timer(self, component):
+        """Decorator timing every call of a function as the given component"""
+
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                token = self._begin(component)
+                if token is None:
+                    return function(*args, **kwargs)
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self._end(component, token)
+
+            return wrapper
+
+        return decorator
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        lines = []
+        for metric in (
+            self.requests,
+            self.latency,
+            self.components,
+            self.chat_context,
+        ):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = RequestMetrics()
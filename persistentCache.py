@@ -0,0 +1,139 @@
+"""
+Key/value caches persisted in a SQLite table, so they survive restarts.
+
+Entries expire a fixed time after they are stored (TTL), and once a cache
+holds more than max_entries the least recently used ones are evicted.
+Recency is only as fine as TOUCH_INTERVAL, so a busy entry costs a write
+at most once a minute rather than on every hit.
+"""
+
+import threading
+import time
+
+from Database import database
+
+# Seconds between writes of an entry's last-used time; hits within the
+# interval leave it as is
+TOUCH_INTERVAL = 60
+
+
+class PersistentCache:
+    """LRU + TTL cache of text values stored in its own SQLite table"""
+
+    def __init__(
+        self, table, max_entries, ttl, db=database, touch_interval=TOUCH_INTERVAL
+    ):
+        """
+        Args:
+            table: Name of the table holding the entries
+            max_entries: Number of entries kept before evicting the least
+                recently used
+            ttl: Seconds an entry stays valid after it is stored
+            db: Database whose file holds the table
+            touch_interval: Seconds between writes of an entry's last-used
+                time
+        """
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.database = db
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def _ensure_table(self, connection):
+        """Create the cache table on first use"""
+        if self._ready:
+            return
+        with self._lock:
+            connection.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """
+            )
+            connection.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{self.table}_last_used "
+                f"ON {self.table} (last_used)"
+            )
+            connection.commit()
+            self._ready = True
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired"""
+        now = time.time()
+        with self.database.checkout() as connection:
+            self._ensure_table(connection)
+            row = connection.execute(
+                f"SELECT value, created, last_used FROM {self.table} WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None or now - row["created"] > self.ttl:
+                if row is not None:
+                    connection.execute(
+                        f"DELETE FROM {self.table} WHERE key = ?", (key,)
+                    )
+                    connection.commit()
+                self.misses += 1
+                return None
+            if now - row["last_used"] >= self.touch_interval:
+                connection.execute(
+                    f"UPDATE {self.table} SET last_used = ? WHERE key = ?",
+                    (now, key),
+                )
+                connection.commit()
+        self.hits += 1
+        return row["value"]
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entries if full"""
+        now = time.time()
+        with self.database.checkout() as connection:
+            self._ensure_table(connection)
+            connection.execute(
+                f"""
+                INSERT INTO {self.table} (key, value, created, last_used)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    value = excluded.value,
+                    created = excluded.created,
+                    last_used = excluded.last_used
+            """,
+                (key, value, now, now),
+            )
+            connection.execute(
+                f"""
+                DELETE FROM {self.table} WHERE key IN (
+                    SELECT key FROM {self.table} ORDER BY last_used
+                    LIMIT MAX((SELECT COUNT(*) FROM {self.table}) - ?, 0)
+                )
+            """,
+                (self.max_entries,),
+            )
+            connection.commit()
+
+    def delete(self, key):
+        """Remove an entry, e.g. one found to be invalid"""
+        with self.database.checkout() as connection:
+            self._ensure_table(connection)
+            connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            connection.commit()
+
+    def clear(self):
+        """Remove every entry"""
+        with self.database.checkout() as connection:
+            self._ensure_table(connection)
+            connection.execute(f"DELETE FROM {self.table}")
+            connection.commit()
+
+    def __len__(self):
+        with self.database.checkout() as connection:
+            self._ensure_table(connection)
+            row = connection.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        return row[0]
@@ -0,0 +1,314 @@
+"""
+Statement timing for the SQLite connections, with a slow-query log.
+
+Connections opened with factory=TracingConnection time every statement,
+from execute() through the fetch calls made on its cursor (rows read by
+iterating over the cursor are not timed). Timings are aggregated per
+statement shape, the SQL with its literals replaced by ?. Statements
+slower than the threshold are logged with their parameters and their
+EXPLAIN QUERY PLAN, flagged SCAN when SQLite reads a whole table or index
+rather than SEARCHing it.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import lru_cache
+
+# Statements slower than this are logged with their query plan
+SLOW_QUERY_MS = float(os.environ.get("HDB_SLOW_QUERY_MS", 100))
+
+# Statement shapes kept in the aggregate statistics, least recently seen
+# dropped first
+MAX_SHAPES = 500
+
+# Recent slow statements kept for the debug endpoint
+SLOW_LOG_SIZE = 100
+
+# Longest SQL text and parameter list kept per slow statement
+MAX_SQL_LENGTH = 4000
+MAX_PARAMS = 50
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES = re.compile(r"\s+")
+_SCAN = re.compile(r"SCAN (?!CONSTANT ROW)(\S+)")
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1024)
+def statement_shape(sql):
+    """Normalize SQL so statements differing only in literals group together"""
+    shape = _LITERALS.sub("?", sql)
+    shape = _PLACEHOLDER_LISTS.sub("(...)", shape)
+    return _SPACES.sub(" ", shape).strip()
+
+
+def plan_scans(plan):
+    """
+    Return the steps of a query plan that read a whole table or index.
+
+    Scans of a materialized CTE or subquery, of a constant row and of a
+    virtual table's own index (such as an FTS5 MATCH) do not count.
+
+    Args:
+        plan: EXPLAIN QUERY PLAN detail lines
+
+    Returns:
+        list: Indexes into plan of the scanning steps
+    """
+    derived = {
+        detail.split()[1]
+        for detail in plan
+        if detail.startswith(("MATERIALIZE ", "CO-ROUTINE "))
+    }
+    scans = []
+    for index, detail in enumerate(plan):
+        match = _SCAN.match(detail)
+        if match and match.group(1) not in derived and "VIRTUAL TABLE" not in detail:
+            scans.append(index)
+    return scans
+
+
+def plan_access(plan):
+    """
+    Classify a query plan by how it reads its tables (see plan_scans).
+
+    Returns:
+        str: "SCAN" if any step reads a whole table or index, "SEARCH" if
+        none does, or None for an empty plan
+    """
+    if not plan:
+        return None
+    return "SCAN" if plan_scans(plan) else "SEARCH"
+
+
+class _Statement:
+    """One traced execution, updated as its rows are fetched"""
+
+    __slots__ = ("shape", "sql", "params", "seconds", "logged")
+
+    def __init__(self, shape, sql, params, seconds):
+        self.shape = shape
+        self.sql = sql
+        self.params = params
+        self.seconds = seconds
+        self.logged = False
+
+
+class QueryTracer:
+    """Aggregate statement timings and keep a log of slow statements"""
+
+    def __init__(self, threshold_ms=SLOW_QUERY_MS):
+        self.threshold_ms = threshold_ms
+        self._shapes = OrderedDict()
+        self._slow = deque(maxlen=SLOW_LOG_SIZE)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def quiet(self):
+        """
+        Keep timing statements in the block but do not log them as slow.
+
+        For bulk work such as ingest, where long statements are expected.
+        """
+        previous = getattr(self._local, "quiet", False)
+        self._local.quiet = True
+        try:
+            yield
+        finally:
+            self._local.quiet = previous
+
+    def record(self, connection, sql, params, seconds, many=False):
+        """
+        Record a statement executed on connection.
+
+        Returns:
+            _Statement: Handle for adding the time spent fetching its rows
+        """
+        statement = _Statement(statement_shape(sql), sql, params, 0.0)
+        self._add(connection, statement, seconds, calls=1, many=many)
+        return statement
+
+    def add_fetch(self, connection, statement, seconds):
+        """Add time spent fetching rows to a recorded statement"""
+        self._add(connection, statement, seconds, calls=0)
+
+    def _add(self, connection, statement, seconds, calls, many=False):
+        statement.seconds += seconds
+        slow = (
+            not statement.logged
+            and statement.seconds * 1000 >= self.threshold_ms
+            and not getattr(self._local, "quiet", False)
+        )
+        with self._lock:
+            stats = self._shapes.get(statement.shape)
+            if stats is None:
+                stats = self._shapes[statement.shape] = {
+                    "calls": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "slow_calls": 0,
+                    "access": None,
+                    "plan": None,
+                }
+                while len(self._shapes) > MAX_SHAPES:
+                    self._shapes.popitem(last=False)
+            else:
+                self._shapes.move_to_end(statement.shape)
+            stats["calls"] += calls
+            stats["total_ms"] += seconds * 1000
+            stats["max_ms"] = max(stats["max_ms"], statement.seconds * 1000)
+            stats["slow_calls"] += slow
+
+        if slow:
+            statement.logged = True
+            self._log_slow(connection, statement, many)
+
+    def _log_slow(self, connection, statement, many):
+        """Explain and log a statement that crossed the threshold"""
+        # executemany parameters are a whole batch of rows, so not explained
+        plan = [] if many else self.explain(connection, statement.sql, statement.params)
+        access = plan_access(plan)
+        params = statement.params
+        if many:
+            params = f"<{len(params)} rows>" if hasattr(params, "__len__") else "<rows>"
+        elif isinstance(params, dict):
+            params = dict(list(params.items())[:MAX_PARAMS])
+        else:
+            params = list(params)[:MAX_PARAMS]
+
+        entry = {
+            "time": datetime.now(timezone.utc).isoformat(),
+            "ms": round(statement.seconds * 1000, 3),
+            "sql": statement.sql[:MAX_SQL_LENGTH],
+            "shape": statement.shape[:MAX_SQL_LENGTH],
+            "params": params,
+            "access": access,
+            "plan": plan,
+        }
+        with self._lock:
+            self._slow.append(entry)
+            stats = self._shapes.get(statement.shape)
+            if stats is not None and plan:
+                stats["access"] = access
+                stats["plan"] = plan
+
+        logger.warning(
+            "Slow query %.1f ms [%s]: %s params=%r plan=%s",
+            entry["ms"],
+            access or "no plan",
+            _SPACES.sub(" ", entry["sql"]).strip(),
+            params,
+            " | ".join(plan),
+        )
+
+    def explain(self, connection, sql, params=()):
+        """
+        Return the EXPLAIN QUERY PLAN detail lines of a statement.
+
+        Runs on the base sqlite3 methods so the EXPLAIN itself is not traced.
+        """
+        try:
+            rows = sqlite3.Connection.execute(
+                connection, "EXPLAIN QUERY PLAN " + sql, params
+            ).fetchall()
+        except sqlite3.Error:
+            return []
+        return [row[3] for row in rows]
+
+    def stats(self):
+        """
+        Return the aggregate statistics and the recent slow statements.
+
+        Returns:
+            dict: threshold_ms, shapes (sorted by total time, slowest first)
+            and slow (most recent first)
+        """
+        with self._lock:
+            shapes = [
+                dict(stats, shape=shape, mean_ms=stats["total_ms"] / stats["calls"])
+                for shape, stats in self._shapes.items()
+                if stats["calls"]
+            ]
+            slow = list(reversed(self._slow))
+        shapes.sort(key=lambda stats: stats["total_ms"], reverse=True)
+        return {"threshold_ms": self.threshold_ms, "shapes": shapes, "slow": slow}
+
+    def reset(self):
+        """Forget all statistics and slow statements"""
+        with self._lock:
+            self._shapes.clear()
+            self._slow.clear()
+
+
+query_tracer = QueryTracer()
+
+
+class TracingCursor(sqlite3.Cursor):
+    """Cursor reporting its statements and fetches to the query tracer"""
+
+    _statement = None
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        self._statement = query_tracer.record(
+            self.connection, sql, parameters, time.perf_counter() - started
+        )
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._statement = None
+        query_tracer.record(
+            self.connection,
+            sql,
+            seq_of_parameters,
+            time.perf_counter() - started,
+            many=True,
+        )
+        return self
+
+    def _fetch(self, fetch, *args):
+        """Run a fetch method, adding its time to the current statement"""
+        statement = self._statement
+        if statement is None:
+            return fetch(*args)
+        started = time.perf_counter()
+        rows = fetch(*args)
+        query_tracer.add_fetch(
+            self.connection, statement, time.perf_counter() - started
+        )
+        return rows
+
+    def fetchone(self):
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+
+class TracingConnection(sqlite3.Connection):
+    """Connection whose statements are timed by the query tracer"""
+
+    def cursor(self, factory=TracingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -3,6 +3,58 @@ Score calculation module for HDB flats based on user preferences.
 The score is calculated on a scale of 0-100, where 100 means perfect match.
 """
 
+from functools import lru_cache
+
+import numpy as np
+
+from metrics import metrics
+
+# Number of compiled scoring plans kept, one per distinct set of preferences
+PLAN_CACHE_SIZE = 64
+
+# Map flat types to room counts
+ROOM_MAPPING = {
+    "1 ROOM": 1,
+    "2 ROOM": 2,
+    "3 ROOM": 3,
+    "4 ROOM": 4,
+    "5 ROOM": 5,
+    "EXECUTIVE": 6,  # Treat executive as 6-room equivalent
+    "MULTI-GENERATION": 6,
+}
+
+# Define model categories and their similarity
+MODEL_CATEGORIES = {
+    "premium": ["PREMIUM APARTMENT", "DBSS", "PREMIUM MAISONETTE"],
+    "improved": ["IMPROVED", "IMPROVED-MAISONETTE", "NEW GENERATION"],
+    "standard": ["STANDARD", "MODEL A", "MODEL A2", "SIMPLIFIED"],
+    "special": ["MAISONETTE", "APARTMENT", "TERRACE", "PREMIUM APARTMENT LOFT"],
+}
+
+# Floor area preference options as (min, max) sqm
+AREA_RANGES = {
+    "30-50": (30, 50),
+    "51-70": (51, 70),
+    "71-90": (71, 90),
+    "91-110": (91, 110),
+    "111-130": (111, 130),
+    "131-150": (131, 150),
+    "151+": (151, 200),  # Assume max of 200 for open-ended range
+}
+
+# Price preference options as (min, max) SGD
+PRICE_RANGES = {
+    "Under 200k": (0, 200000),
+    "200k-300k": (200000, 300000),
+    "300k-400k": (300000, 400000),
+    "400k-500k": (400000, 500000),
+    "500k-600k": (500000, 600000),
+    "600k-700k": (600000, 700000),
+    "700k-800k": (700000, 800000),
+    "800k-1M": (800000, 1000000),
+    "Over 1M": (1000000, 2000000),  # Assume max of 2M for open-ended
+}
+
 
 class ScoreCalculator:
     """Calculate compatibility scores between flats and user preferences"""
@@ -17,6 +69,55 @@ class ScoreCalculator:
             "flat_model": 0.15,  # Model is less critical
         }
 
+        # Flat fields read by the scoring criteria
+        self.columns = (
+            "flat_type",
+            "storey_range",
+            "floor_area_sqm",
+            "flat_model",
+            "resale_price",
+        )
+
+        # Flat field read by each criterion, and the criteria scored by value
+        self.criterion_fields = {
+            "flat_type": "flat_type",
+            "price_range": "resale_price",
+            "floor_area_sqm": "floor_area_sqm",
+            "storey_range": "storey_range",
+            "flat_model": "flat_model",
+        }
+        self.categorical_criteria = ("flat_type", "storey_range", "flat_model")
+
+        # Numeric and category columns derived from flat text fields. They never
+        # change for a given flat, so ingest stores them alongside the text.
+        self.derived_columns = {
+            "room_count": ("flat_type", self._extract_room_count),
+            "storey_mid": ("storey_range", self._extract_mid_floor),
+            "model_category": ("flat_model", self._model_category),
+        }
+        self._derived_cache = {}
+
+    def derive_columns(self, flat):
+        """
+        Compute the derived columns for a flat.
+
+        Args:
+            flat: Dictionary with the flat's text fields
+
+        Returns:
+            dict: Derived column name mapped to its value (None if unknown)
+        """
+        derived = {}
+        for column, (source, derive) in self.derived_columns.items():
+            value = flat.get(source)
+            key = (column, value)
+            # Only a few dozen distinct source values exist, so memoize them
+            if key not in self._derived_cache:
+                self._derived_cache[key] = derive(value) if value else None
+            derived[column] = self._derived_cache[key]
+        return derived
+
+    @metrics.timer("score")
     def calculate_score(self, flat, preferences):
         """
         Calculate the compatibility score between a flat and user preferences.
@@ -28,19 +129,18 @@ class ScoreCalculator:
         Returns:
             int: Score from 0-100 where 100 is perfect match
         """
-        if not self._has_valid_preferences(preferences):
+        plan = self._get_plan(preferences)
+        if not plan:
             return 0  # No preferences set, no meaningful score
 
         total_score = 0
         active_weights = 0
 
-        # Calculate score for each preference criterion
-        for criterion, weight in self.weights.items():
-            pref_value = preferences.get(criterion, "")
-            if pref_value:  # Only calculate if preference is set
-                score = self._calculate_criterion_score(criterion, flat, pref_value)
-                total_score += score * weight
-                active_weights += weight
+        # Calculate score for each preference criterion that is set
+        for step in plan:
+            score = self._score_step(step, flat)
+            total_score += score * step["weight"]
+            active_weights += step["weight"]
 
         # Normalize score based on active preferences only
         if active_weights > 0:
@@ -49,32 +149,413 @@ class ScoreCalculator:
 
         return 0
 
-    def _has_valid_preferences(self, preferences):
-        """Check if any meaningful preferences are set"""
-        return any(preferences.get(key, "") for key in self.weights.keys())
+    @metrics.timer("score")
+    def calculate_scores_batch(self, columns, preferences, vocabularies=None):
+        """
+        Calculate compatibility scores for many flats at once.
+
+        Produces exactly the scores calculate_score would give each flat.
+        Categorical criteria are scored once per distinct value and numeric
+        criteria are evaluated as array operations.
+
+        Args:
+            columns: Dictionary mapping the fields in self.columns to
+                equal-length sequences of flat values
+            preferences: Dictionary with user preferences
+            vocabularies: Optional dictionary of dictionary-encoded fields;
+                for those fields columns holds integer codes into the
+                given list of values
+
+        Returns:
+            numpy.ndarray: Integer scores from 0-100, one per flat
+        """
+        size = len(next(iter(columns.values()), ()))
+        plan = self._get_plan(preferences)
+        if not plan:
+            return np.zeros(size, dtype=int)
+
+        total_score = np.zeros(size)
+        active_weights = 0
+
+        for step in plan:
+            vocabulary = (vocabularies or {}).get(step["field"])
+            score = self._score_step_batch(step, columns[step["field"]], vocabulary)
+            total_score = total_score + score * step["weight"]
+            active_weights += step["weight"]
+
+        normalized_score = (total_score / active_weights) * 100
+        return np.rint(normalized_score).astype(int)
+
+    def _get_plan(self, preferences):
+        """Return the compiled scoring plan for a preferences dictionary"""
+        return self._compile_plan(
+            tuple(preferences.get(criterion, "") for criterion in self.weights)
+        )
+
+    @lru_cache(maxsize=PLAN_CACHE_SIZE)
+    def _compile_plan(self, preference_values):
+        """
+        Compile preferences into the steps needed to score a flat.
+
+        Each active criterion becomes one step. Categorical criteria carry a
+        table from flat value to score, filled the first time each distinct
+        value is seen. Numeric criteria carry their pre-parsed (min, max)
+        bounds. The plan is cached, so it is built once per distinct set of
+        preferences.
+
+        Args:
+            preference_values: Preference values in self.weights order
+
+        Returns:
+            tuple: Plan steps (dicts), empty if no preference is set
+        """
+        plan = []
+        for (criterion, weight), preference in zip(
+            self.weights.items(), preference_values
+        ):
+            if not preference:  # Only score criteria whose preference is set
+                continue
+            step = {
+                "criterion": criterion,
+                "weight": weight,
+                "field": self.criterion_fields[criterion],
+                "preference": preference,
+                "table": None,
+                "bounds": None,
+            }
+            if criterion in self.categorical_criteria:
+                step["table"] = {}
+            elif criterion == "floor_area_sqm":
+                step["bounds"] = self._parse_area_preference(preference)
+            elif criterion == "price_range":
+                step["bounds"] = self._parse_price_preference(preference)
+            plan.append(step)
+        return tuple(plan)
+
+    def _score_step(self, step, flat):
+        """Score one flat for one plan step"""
+        table = step["table"]
+        if table is not None:
+            value = flat.get(step["field"], "")
+            score = table.get(value)
+            if score is None:
+                score = self._calculate_criterion_score(
+                    step["criterion"], flat, step["preference"]
+                )
+                table[value] = score
+            return score
+
+        if step["criterion"] == "floor_area_sqm":
+            return self._score_area_bounds(
+                flat.get("floor_area_sqm", 0), step["bounds"]
+            )
+        return self._score_price_bounds(flat.get("resale_price", 0), step["bounds"])
+
+    def _score_step_batch(self, step, values, vocabulary=None):
+        """Score a column of flat values, or of codes into vocabulary"""
+        table = step["table"]
+        if table is not None and vocabulary is not None:
+            self._fill_table(step, vocabulary)
+            scores = np.fromiter(map(table.__getitem__, vocabulary), float)
+            return scores[np.asarray(values)]
+        if table is not None:
+            self._fill_table(step, values)
+            return np.fromiter(map(table.__getitem__, values), float, len(values))
+
+        if step["criterion"] == "floor_area_sqm":
+            return self._score_floor_area_batch(values, step["bounds"])
+        return self._score_price_range_batch(values, step["bounds"])
+
+    def _fill_table(self, step, values):
+        """Add the scores of values not yet seen to a categorical step table"""
+        table = step["table"]
+        for value in set(values).difference(table):
+            table[value] = self._calculate_criterion_score(
+                step["criterion"], {step["field"]: value}, step["preference"]
+            )
+
+    def _score_floor_area_batch(self, floor_areas, range_info):
+        """Vectorized form of _score_area_bounds"""
+        floor_area = np.asarray(floor_areas, dtype=float)
+        if not range_info:
+            return np.zeros(len(floor_area))
+
+        min_range, max_range = range_info
+        center = (min_range + max_range) / 2
+        range_size = max_range - min_range
+        distance = np.abs(floor_area - center)
+
+        with np.errstate(invalid="ignore"):
+            score = np.select(
+                [
+                    (min_range <= floor_area) & (floor_area <= max_range),
+                    distance <= range_size,
+                    distance <= range_size * 2,
+                    distance <= range_size * 3,
+                ],
+                [
+                    1.0 - ((distance / (range_size / 2)) * 0.1),
+                    0.7 + 0.3 * (1 - distance / range_size),
+                    0.4 + 0.3 * (1 - (distance - range_size) / range_size),
+                    0.15 + 0.25 * (1 - (distance - range_size * 2) / range_size),
+                ],
+                np.maximum(
+                    0.05, 0.15 * (1 - np.minimum(distance / (range_size * 5), 1))
+                ),
+            )
+
+        # Missing or zero areas score 0, as in the scalar version
+        return np.where(np.isnan(floor_area) | (floor_area == 0), 0.0, score)
+
+    def _score_price_range_batch(self, prices, range_info):
+        """Vectorized form of _score_price_bounds"""
+        price = np.asarray(prices, dtype=float)
+        if not range_info:
+            return np.zeros(len(price))
+
+        min_range, max_range = range_info
+        range_size = max_range - min_range
+        below = min_range - price
+        above = price - max_range
+
+        with np.errstate(invalid="ignore"):
+            position = (price - min_range) / range_size if range_size > 0 else 0
+            score = np.select(
+                [
+                    (min_range <= price) & (price <= max_range),
+                    # Below range: still good (cheaper is usually better)
+                    (price < min_range) & (below <= range_size * 0.5),
+                    (price < min_range) & (below <= range_size),
+                    (price < min_range) & (below <= range_size * 2),
+                    price < min_range,
+                    # Above range: worse (more expensive)
+                    above <= range_size * 0.3,
+                    above <= range_size * 0.8,
+                    above <= range_size * 1.5,
+                ],
+                [
+                    1.0 - (position * 0.05),
+                    0.85 + 0.15 * (1 - below / (range_size * 0.5)),
+                    0.65 + 0.20 * (1 - (below - range_size * 0.5) / (range_size * 0.5)),
+                    0.35 + 0.30 * (1 - (below - range_size) / range_size),
+                    np.maximum(
+                        0.1, 0.35 * (1 - np.minimum(below / (range_size * 4), 1))
+                    ),
+                    0.70 - (above / (range_size * 0.3)) * 0.25,
+                    0.45 - ((above - range_size * 0.3) / (range_size * 0.5)) * 0.25,
+                    0.20 - ((above - range_size * 0.8) / (range_size * 0.7)) * 0.15,
+                ],
+                np.maximum(0.01, 0.05 * (1 - np.minimum(above / (range_size * 3), 1))),
+            )
+
+        # Missing or zero prices score 0, as in the scalar version
+        return np.where(np.isnan(price) | (price == 0), 0.0, score)
+
+    @metrics.timer("score")
+    def rank_flats(self, columns, preferences, k, vocabularies=None):
+        """
+        Select the k best-matching flats from a column batch.
+
+        Flats with equal scores keep their input order.
+
+        Args:
+            columns: Column batch as accepted by calculate_scores_batch
+            preferences: Dictionary with user preferences
+            k: Number of flats to return
+            vocabularies: Encoded fields, as for calculate_scores_batch
+
+        Returns:
+            list: (score, row index) tuples, best match first
+        """
+        scores = self.calculate_scores_batch(columns, preferences, vocabularies)
+        if k <= 0 or len(scores) == 0:
+            return []
+
+        # Partition around the k-th best score, then order only the rows that
+        # can still make the cut, so the ranking costs O(n) plus a small sort
+        candidates = np.arange(len(scores))
+        if k < len(scores):
+            threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+            candidates = np.flatnonzero(scores >= threshold)
+        order = candidates[np.argsort(-scores[candidates], kind="stable")][:k]
+        return [(int(scores[index]), int(index)) for index in order]
+
+    def score_sql(self, preferences, distinct_values, table="hdb_flats"):
+        """
+        Compile preferences into a SQL expression for the compatibility score.
+
+        The expression evaluates to the score before rounding; wrap it with
+        round_sql to get the value calculate_score returns. Categorical
+        criteria become CASE lookups over their distinct values and numeric
+        criteria repeat the scalar arithmetic step for step. Every constant
+        is a bound parameter, so SQLite computes with the same doubles as
+        Python and the scores match exactly.
+
+        Args:
+            preferences: Dictionary with user preferences
+            distinct_values: Dict of every value stored for flat_type,
+                storey_range and flat_model
+            table: Table name used to qualify the flat columns
+
+        Returns:
+            tuple: (SQL expression, list of parameters), or None if no
+            preference is set
+        """
+        plan = self._get_plan(preferences)
+        if not plan:
+            return None
+
+        params = []
+
+        def bind(value):
+            params.append(value)
+            return "?"
+
+        terms = []
+        active_weights = 0
+        for step in plan:
+            column = f"{table}.{step['field']}"
+            if step["table"] is not None:
+                values = distinct_values[step["field"]]
+                self._fill_table(step, values)
+                cases = " ".join(
+                    f"WHEN {bind(value)} THEN {bind(step['table'][value])}"
+                    for value in values
+                )
+                expression = f"CASE {column} {cases} ELSE 0.0 END"
+            elif not step["bounds"]:
+                expression = "0.0"  # Unrecognised range, as in the scalar version
+            elif step["criterion"] == "floor_area_sqm":
+                expression = self._area_bounds_sql(column, step["bounds"], bind)
+            else:
+                expression = self._price_bounds_sql(column, step["bounds"], bind)
+            terms.append(f"({expression}) * {bind(step['weight'])}")
+            active_weights += step["weight"]
+
+        return f"(({' + '.join(terms)}) / {bind(active_weights)}) * 100", params
+
+    def round_sql(self, expression):
+        """
+        Round a non-negative SQL expression the way Python's round() does.
+
+        SQLite's ROUND() rounds halves away from zero, while round() rounds
+        them to the even neighbour, so the truncated value is adjusted by
+        hand. The expression is repeated, so pass a column, not a formula.
+        """
+        whole = f"CAST({expression} AS INTEGER)"
+        return (
+            f"({whole} + ({expression} - {whole} > 0.5)"
+            f" + ({expression} - {whole} = 0.5 AND {whole} % 2 = 1))"
+        )
+
+    def _area_bounds_sql(self, column, range_info, bind):
+        """SQL form of _score_area_bounds"""
+        min_range, max_range = range_info
+        center = (min_range + max_range) / 2
+        range_size = max_range - min_range
+
+        def distance():
+            return f"ABS({column} - {bind(center)})"
+
+        return (
+            f"CASE WHEN {column} IS NULL OR {column} = 0 THEN 0.0"
+            f" WHEN {bind(min_range)} <= {column} AND {column} <= {bind(max_range)}"
+            f" THEN {bind(1.0)} - (({distance()} / {bind(range_size / 2)})"
+            f" * {bind(0.1)})"
+            f" WHEN {distance()} <= {bind(range_size)}"
+            f" THEN {bind(0.7)} + {bind(0.3)}"
+            f" * (1 - {distance()} / {bind(range_size)})"
+            f" WHEN {distance()} <= {bind(range_size * 2)}"
+            f" THEN {bind(0.4)} + {bind(0.3)}"
+            f" * (1 - ({distance()} - {bind(range_size)}) / {bind(range_size)})"
+            f" WHEN {distance()} <= {bind(range_size * 3)}"
+            f" THEN {bind(0.15)} + {bind(0.25)}"
+            f" * (1 - ({distance()} - {bind(range_size * 2)}) / {bind(range_size)})"
+            f" ELSE MAX({bind(0.05)}, {bind(0.15)}"
+            f" * (1 - MIN({distance()} / {bind(range_size * 5)}, 1))) END"
+        )
+
+    def _price_bounds_sql(self, column, range_info, bind):
+        """SQL form of _score_price_bounds"""
+        min_range, max_range = range_info
+        range_size = max_range - min_range
+
+        def below():
+            return f"({bind(min_range)} - {column})"
+
+        def above():
+            return f"({column} - {bind(max_range)})"
+
+        def within():
+            if range_size <= 0:
+                return bind(1.0)
+            return (
+                f"{bind(1.0)} - ((({column} - {bind(min_range)}) / {bind(range_size)})"
+                f" * {bind(0.05)})"
+            )
+
+        return (
+            f"CASE WHEN {column} IS NULL OR {column} = 0 THEN 0.0"
+            f" WHEN {bind(min_range)} <= {column} AND {column} <= {bind(max_range)}"
+            f" THEN {within()}"
+            # Below range: still good (cheaper is usually better)
+            f" WHEN {column} < {bind(min_range)}"
+            f" AND {below()} <= {bind(range_size * 0.5)}"
+            f" THEN {bind(0.85)} + {bind(0.15)}"
+            f" * (1 - {below()} / {bind(range_size * 0.5)})"
+            f" WHEN {column} < {bind(min_range)} AND {below()} <= {bind(range_size)}"
+            f" THEN {bind(0.65)} + {bind(0.20)} * (1 - ({below()}"
+            f" - {bind(range_size * 0.5)}) / {bind(range_size * 0.5)})"
+            f" WHEN {column} < {bind(min_range)}"
+            f" AND {below()} <= {bind(range_size * 2)}"
+            f" THEN {bind(0.35)} + {bind(0.30)}"
+            f" * (1 - ({below()} - {bind(range_size)}) / {bind(range_size)})"
+            f" WHEN {column} < {bind(min_range)} THEN MAX({bind(0.1)}, {bind(0.35)}"
+            f" * (1 - MIN({below()} / {bind(range_size * 4)}, 1)))"
+            # Above range: worse (more expensive)
+            f" WHEN {above()} <= {bind(range_size * 0.3)}"
+            f" THEN {bind(0.70)} - ({above()} / {bind(range_size * 0.3)})"
+            f" * {bind(0.25)}"
+            f" WHEN {above()} <= {bind(range_size * 0.8)}"
+            f" THEN {bind(0.45)} - (({above()} - {bind(range_size * 0.3)})"
+            f" / {bind(range_size * 0.5)}) * {bind(0.25)}"
+            f" WHEN {above()} <= {bind(range_size * 1.5)}"
+            f" THEN {bind(0.20)} - (({above()} - {bind(range_size * 0.8)})"
+            f" / {bind(range_size * 0.7)}) * {bind(0.15)}"
+            f" ELSE MAX({bind(0.01)}, {bind(0.05)}"
+            f" * (1 - MIN({above()} / {bind(range_size * 3)}, 1))) END"
+        )
 
     def _calculate_criterion_score(self, criterion, flat, preference):
         """Calculate score for a specific criterion"""
+        # Derived columns stored at ingest save re-parsing the text fields
         if criterion == "flat_type":
-            return self._score_flat_type(flat.get("flat_type", ""), preference)
+            return self._score_flat_type(
+                flat.get("flat_type", ""), preference, flat.get("room_count")
+            )
         elif criterion == "storey_range":
-            return self._score_storey_range(flat.get("storey_range", ""), preference)
+            return self._score_storey_range(
+                flat.get("storey_range", ""), preference, flat.get("storey_mid")
+            )
         elif criterion == "floor_area_sqm":
             return self._score_floor_area(flat.get("floor_area_sqm", 0), preference)
         elif criterion == "flat_model":
-            return self._score_flat_model(flat.get("flat_model", ""), preference)
+            return self._score_flat_model(
+                flat.get("flat_model", ""), preference, flat.get("model_category")
+            )
         elif criterion == "price_range":
             return self._score_price_range(flat.get("resale_price", 0), preference)
 
         return 0
 
-    def _score_flat_type(self, flat_type, preference):
+    def _score_flat_type(self, flat_type, preference, flat_rooms=None):
         """Score flat type match with smooth scoring based on room count similarity"""
         if not flat_type or not preference:
             return 0
 
         # Extract room counts for comparison
-        flat_rooms = self._extract_room_count(flat_type)
+        if flat_rooms is None:
+            flat_rooms = self._extract_room_count(flat_type)
         pref_rooms = self._extract_room_count(preference)
 
         if flat_rooms is None or pref_rooms is None:
@@ -95,28 +576,16 @@ class ScoreCalculator:
 
     def _extract_room_count(self, flat_type):
         """Extract room count from flat type string"""
-        flat_type_upper = flat_type.upper().strip()
-
-        # Map flat types to room counts
-        room_mapping = {
-            "1 ROOM": 1,
-            "2 ROOM": 2,
-            "3 ROOM": 3,
-            "4 ROOM": 4,
-            "5 ROOM": 5,
-            "EXECUTIVE": 6,  # Treat executive as 6-room equivalent
-            "MULTI-GENERATION": 6,
-        }
+        return ROOM_MAPPING.get(flat_type.upper().strip())
 
-        return room_mapping.get(flat_type_upper)
-
-    def _score_storey_range(self, storey_range, preference):
+    def _score_storey_range(self, storey_range, preference, flat_mid_floor=None):
         """Score storey range match with smooth scoring based on floor proximity"""
         if not storey_range or not preference:
             return 0
 
         # Extract middle floor number from range
-        flat_mid_floor = self._extract_mid_floor(storey_range)
+        if flat_mid_floor is None:
+            flat_mid_floor = self._extract_mid_floor(storey_range)
         pref_mid_floor = self._extract_mid_floor(preference)
 
         if flat_mid_floor is None or pref_mid_floor is None:
@@ -159,7 +628,15 @@ class ScoreCalculator:
 
     def _score_floor_area(self, floor_area, preference):
         """Score floor area based on preference range with smooth Gaussian-like decay"""
-        if not floor_area or not preference:
+        if not preference:
+            return 0
+        return self._score_area_bounds(
+            floor_area, self._parse_area_preference(preference)
+        )
+
+    def _score_area_bounds(self, floor_area, range_info):
+        """Score floor area against pre-parsed (min, max) preference bounds"""
+        if not floor_area or not range_info:
             return 0
 
         try:
@@ -167,10 +644,7 @@ class ScoreCalculator:
         except (ValueError, TypeError):
             return 0
 
-        # Parse preference ranges and get center point
-        range_info = self._parse_area_preference(preference)
-        if not range_info:
-            return 0
+        # Get center point of the preferred range
 
         min_range, max_range = range_info
         center = (min_range + max_range) / 2
@@ -204,18 +678,9 @@ class ScoreCalculator:
 
     def _parse_area_preference(self, preference):
         """Parse area preference string and return (min, max) tuple"""
-        area_ranges = {
-            "30-50": (30, 50),
-            "51-70": (51, 70),
-            "71-90": (71, 90),
-            "91-110": (91, 110),
-            "111-130": (111, 130),
-            "131-150": (131, 150),
-            "151+": (151, 200),  # Assume max of 200 for open-ended range
-        }
-        return area_ranges.get(preference)
+        return AREA_RANGES.get(preference)
 
-    def _score_flat_model(self, flat_model, preference):
+    def _score_flat_model(self, flat_model, preference, flat_category=None):
         """Score flat model match with similarity scoring"""
         if not flat_model or not preference:
             return 0
@@ -227,23 +692,10 @@ class ScoreCalculator:
         if flat_model_upper == preference_upper:
             return 1.0
 
-        # Define model categories and their similarity
-        model_categories = {
-            "premium": ["PREMIUM APARTMENT", "DBSS", "PREMIUM MAISONETTE"],
-            "improved": ["IMPROVED", "IMPROVED-MAISONETTE", "NEW GENERATION"],
-            "standard": ["STANDARD", "MODEL A", "MODEL A2", "SIMPLIFIED"],
-            "special": ["MAISONETTE", "APARTMENT", "TERRACE", "PREMIUM APARTMENT LOFT"],
-        }
-
         # Find categories for both models
-        flat_category = None
-        pref_category = None
-
-        for category, models in model_categories.items():
-            if any(model in flat_model_upper for model in models):
-                flat_category = category
-            if any(model in preference_upper for model in models):
-                pref_category = category
+        if flat_category is None:
+            flat_category = self._model_category(flat_model)
+        pref_category = self._model_category(preference)
 
         # Same category: good match
         if flat_category and pref_category and flat_category == pref_category:
@@ -271,9 +723,26 @@ class ScoreCalculator:
         # No match
         return 0.1
 
+    def _model_category(self, flat_model):
+        """Find the similarity category of a flat model string"""
+        model_upper = flat_model.upper().strip()
+
+        # Later categories take precedence, e.g. IMPROVED-MAISONETTE is special
+        category = None
+        for name, models in MODEL_CATEGORIES.items():
+            if any(model in model_upper for model in models):
+                category = name
+        return category
+
     def _score_price_range(self, price, preference):
         """Score price based on preference range with smooth decay and budget sensitivity"""
-        if not price or not preference:
+        if not preference:
+            return 0
+        return self._score_price_bounds(price, self._parse_price_preference(preference))
+
+    def _score_price_bounds(self, price, range_info):
+        """Score price against pre-parsed (min, max) preference bounds"""
+        if not price or not range_info:
             return 0
 
         try:
@@ -281,11 +750,6 @@ class ScoreCalculator:
         except (ValueError, TypeError):
             return 0
 
-        # Parse preference ranges
-        range_info = self._parse_price_preference(preference)
-        if not range_info:
-            return 0
-
         min_range, max_range = range_info
         center = (min_range + max_range) / 2
         range_size = max_range - min_range
@@ -333,19 +797,9 @@ class ScoreCalculator:
 
     def _parse_price_preference(self, preference):
         """Parse price preference string and return (min, max) tuple"""
-        price_ranges = {
-            "Under 200k": (0, 200000),
-            "200k-300k": (200000, 300000),
-            "300k-400k": (300000, 400000),
-            "400k-500k": (400000, 500000),
-            "500k-600k": (500000, 600000),
-            "600k-700k": (600000, 700000),
-            "700k-800k": (700000, 800000),
-            "800k-1M": (800000, 1000000),
-            "Over 1M": (1000000, 2000000),  # Assume max of 2M for open-ended
-        }
-        return price_ranges.get(preference)
+        return PRICE_RANGES.get(preference)
 
+    @metrics.timer("score")
     def get_score_breakdown(self, flat, preferences):
         """
         Get detailed score breakdown for debugging/display purposes.
@@ -355,20 +809,20 @@ class ScoreCalculator:
         """
         breakdown = {}
 
-        for criterion, weight in self.weights.items():
-            pref_value = preferences.get(criterion, "")
-            if pref_value:
-                score = self._calculate_criterion_score(criterion, flat, pref_value)
-                flat_value = flat.get(criterion, "N/A")
-
-                breakdown[criterion] = {
-                    "score": round(score * 100),
-                    "weight": weight,
-                    "weighted_score": round(score * weight * 100),
-                    "preference": pref_value,
-                    "actual": flat_value,
-                    "match_quality": self._get_match_quality(score),
-                }
+        for step in self._get_plan(preferences):
+            criterion = step["criterion"]
+            weight = step["weight"]
+            score = self._score_step(step, flat)
+            flat_value = flat.get(criterion, "N/A")
+
+            breakdown[criterion] = {
+                "score": round(score * 100),
+                "weight": weight,
+                "weighted_score": round(score * weight * 100),
+                "preference": step["preference"],
+                "actual": flat_value,
+                "match_quality": self._get_match_quality(score),
+            }
 
         return breakdown
 
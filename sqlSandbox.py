@@ -0,0 +1,227 @@
+"""
+Guarded execution of SQL written by the language model.
+
+Generated queries run on their own read-only connections, which may only
+read the hdb_flats table. Before a query runs, its EXPLAIN QUERY PLAN is
+checked and it is rejected if it would read the whole table without a
+LIMIT, join full scans of it into a cross join, or build a temporary index
+to join on an unindexed column. While it runs, a progress handler aborts
+it once it exceeds an instruction or time budget, and at most MAX_ROWS
+rows are fetched. A bad query fails in milliseconds with a
+QueryRejected error explaining why, which can be handed back to the model.
+"""
+
+import queue
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from urllib.parse import quote
+
+from Database import database
+from metrics import metrics
+from queryTrace import TracingConnection, plan_scans
+
+# Tables generated queries may read
+ALLOWED_TABLES = ("hdb_flats",)
+
+# Virtual machine instructions a query may run before it is aborted; a
+# full scan of a million flats takes around 4 million
+INSTRUCTION_BUDGET = 10000000
+
+# Seconds a query may run before it is aborted. Sorting and index building
+# run outside the virtual machine, so they barely count as instructions.
+TIME_BUDGET = 0.5
+
+# Instructions between progress handler calls
+PROGRESS_INTERVAL = 1000
+
+# Rows fetched from a query at most; any further rows are dropped
+MAX_ROWS = 50
+
+# Longest string or blob a query may build, in bytes
+MAX_LENGTH = 1000000
+
+# Read-only connections kept open for reuse
+POOL_SIZE = 4
+
+_OUTER_LIMIT = re.compile(r"\bLIMIT\s+\d+(?:\s*(?:OFFSET|,)\s*\d+)?\s*$", re.I)
+_LEADING_COMMENTS = re.compile(r"^(?:\s+|--[^\n]*(?:\n|$)|/\*.*?\*/)*", re.S)
+# Quoted strings and identifiers are matched too, so comment markers inside
+# them are left alone
+_COMMENTS = re.compile(
+    r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\[[^\]]*\]|`(?:[^`]|``)*`)"
+    r"|--[^\n]*|/\*.*?(?:\*/|$)",
+    re.S,
+)
+
+# Authorizer actions a plain SELECT needs
+_ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION}
+
+
+def _strip_comments(sql):
+    """Replace every comment in sql with a space, keeping quoted text as is"""
+    return _COMMENTS.sub(lambda match: match.group(1) or " ", sql)
+
+
+class QueryRejected(ValueError):
+    """A generated query was refused or aborted by the sandbox"""
+
+
+def _authorize(action, arg1, arg2, database_name, trigger):
+    """Allow only reads of the allowed tables, and function calls"""
+    if action not in _ALLOWED_ACTIONS:
+        return sqlite3.SQLITE_DENY
+    if action == sqlite3.SQLITE_READ and arg1 not in ALLOWED_TABLES:
+        return sqlite3.SQLITE_DENY
+    return sqlite3.SQLITE_OK
+
+
+class SqlSandbox:
+    """Run generated SELECT statements read-only, within a budget"""
+
+    def __init__(
+        self,
+        db=database,
+        instruction_budget=INSTRUCTION_BUDGET,
+        time_budget=TIME_BUDGET,
+        max_rows=MAX_ROWS,
+        pool_size=POOL_SIZE,
+    ):
+        """
+        Args:
+            db: Database whose file the queries read
+            instruction_budget: Instructions a query may run before it is
+                aborted
+            time_budget: Seconds a query may run before it is aborted
+            max_rows: Rows returned from a query at most
+            pool_size: Connections kept open for reuse
+        """
+        self.database = db
+        self.instruction_budget = instruction_budget
+        self.time_budget = time_budget
+        self.max_rows = max_rows
+        self.pool_size = pool_size
+        self._pool = queue.LifoQueue()
+
+    def _open_connection(self):
+        """Open a read-only connection that may only read the allowed tables"""
+        uri = f"file:{quote(self.database.db_path)}?mode=ro"
+        connection = sqlite3.connect(
+            uri, uri=True, check_same_thread=False, factory=TracingConnection
+        )
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA query_only = ON")
+        connection.setlimit(sqlite3.SQLITE_LIMIT_LENGTH, MAX_LENGTH)
+        connection.set_authorizer(_authorize)
+        return connection
+
+    @contextmanager
+    def _checkout(self):
+        """Borrow a read-only connection, returning it to the pool afterwards"""
+        try:
+            connection = self._pool.get_nowait()
+        except queue.Empty:
+            connection = self._open_connection()
+        try:
+            with metrics.timed("database"):
+                yield connection
+        finally:
+            if connection.in_transaction:
+                connection.rollback()
+            if self._pool.qsize() < self.pool_size:
+                self._pool.put(connection)
+            else:
+                connection.close()
+
+    def validate(self, connection, sql):
+        """
+        Check a statement before running it.
+
+        Raises:
+            QueryRejected: If the statement is not a single SELECT on the
+                allowed tables, or its plan reads a table in full without a
+                LIMIT, scans it once per row of another scan, or builds an
+                automatic index
+        """
+        body = _LEADING_COMMENTS.sub("", sql)
+        if not re.match(r"(SELECT|WITH)\b", body, re.I):
+            raise QueryRejected("Only SELECT statements are allowed")
+
+        # Preparing the EXPLAIN runs the authorizer over the statement, so
+        # writes and reads of other tables are refused here
+        try:
+            rows = sqlite3.Connection.execute(
+                connection, "EXPLAIN QUERY PLAN " + sql
+            ).fetchall()
+        except sqlite3.DatabaseError as e:
+            if "one statement at a time" in str(e):
+                raise QueryRejected("Only a single SELECT statement is allowed") from e
+            # Reading the full-text table fails while it reads its shadow tables
+            if any(
+                reason in str(e)
+                for reason in ("not authorized", "prohibited", "vtable constructor")
+            ):
+                raise QueryRejected(
+                    "Only SELECT statements reading "
+                    f"{', '.join(ALLOWED_TABLES)} are allowed"
+                ) from e
+            raise
+
+        plan = [row["detail"] for row in rows]
+        scans = [rows[index] for index in plan_scans(plan)]
+        parents = [row["parent"] for row in scans]
+        if len(parents) != len(set(parents)):
+            raise QueryRejected(
+                "The query joins full table scans (a cross join); "
+                "join on indexed columns such as town or flat_type instead"
+            )
+        if any("AUTOMATIC" in detail for detail in plan):
+            raise QueryRejected(
+                "The query joins tables through a temporary index; "
+                "select from hdb_flats without a join instead"
+            )
+        if scans and not _OUTER_LIMIT.search(_strip_comments(sql).rstrip("; \n\t")):
+            raise QueryRejected(
+                "The query reads the whole table without a LIMIT; add a LIMIT clause"
+            )
+
+    def execute(self, sql):
+        """
+        Validate and run a generated query.
+
+        Returns:
+            list: Up to max_rows result rows
+
+        Raises:
+            QueryRejected: If the query is refused or exceeds its budget
+            sqlite3.Error: If the query is invalid SQL
+        """
+        sql = sql.strip()
+        calls = self.instruction_budget // PROGRESS_INTERVAL
+        progress = {"calls": 0, "aborted": False}
+
+        def over_budget():
+            progress["calls"] += 1
+            if progress["calls"] > calls or time.perf_counter() > deadline:
+                progress["aborted"] = True
+            return progress["aborted"]
+
+        with self._checkout() as connection:
+            self.validate(connection, sql)
+            deadline = time.perf_counter() + self.time_budget
+            connection.set_progress_handler(over_budget, PROGRESS_INTERVAL)
+            try:
+                return connection.execute(sql).fetchmany(self.max_rows)
+            except sqlite3.OperationalError as e:
+                if progress["aborted"]:
+                    raise QueryRejected(
+                        "The query was aborted for doing too much work; "
+                        "filter on town or flat_type and add a LIMIT"
+                    ) from e
+                raise
+            finally:
+                connection.set_progress_handler(None, 0)
+
+
+sql_sandbox = SqlSandbox()
@@ -329,6 +329,55 @@ function showError(message, container) {
     }
 }
 
+// Read a Server-Sent Events response with fetch, so POST requests can stream too.
+// Calls onText with each chunk of text as it arrives; resolves when the stream ends.
+async function streamEvents(url, options, onText) {
+    const response = await fetch(url, options);
+    const contentType = response.headers.get('Content-Type') || '';
+    if (!contentType.startsWith('text/event-stream')) {
+        // Errors raised before streaming starts come back as JSON
+        const data = await response.json();
+        throw new Error(data.error || `Request failed with status ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            block.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    data += line.slice(5).trim();
+                }
+            });
+            if (!data) continue;
+
+            const payload = JSON.parse(data);
+            if (event === 'error') {
+                throw new Error(payload.error);
+            }
+            if (event === 'done') {
+                return;
+            }
+            onText(payload.text);
+        }
+    }
+}
+
 // Local storage utilities for user preferences
 function saveSearchPreferences() {
     const preferences = {
@@ -0,0 +1,300 @@
+"""
+Synthetic HDB resale data for benchmarks and load tests.
+
+Rows follow the vocabularies and rough proportions of the data.gov.sg
+resale dataset: town and flat type mix, storey ranges, flat models per flat
+type, and prices that depend on flat type, town, storey, lease age and year.
+The output is a CSV in the source format, so it goes through the same ingest
+path as the real download.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from Database import FLAT_COLUMNS, SYNC_COLUMNS, Database
+
+# Columns of the resale CSV, in file order
+CSV_COLUMNS = (
+    "month",
+    "town",
+    "flat_type",
+    "block",
+    "street_name",
+    "storey_range",
+    "floor_area_sqm",
+    "flat_model",
+    "lease_commence_date",
+    "remaining_lease",
+    "resale_price",
+)
+
+# Rows generated per DataFrame chunk, keeping memory flat at any size
+GENERATE_CHUNK_SIZE = 500000
+
+# Relative number of transactions per town
+TOWN_WEIGHTS = {
+    "ANG MO KIO": 4.5,
+    "BEDOK": 5.5,
+    "BISHAN": 1.9,
+    "BUKIT BATOK": 4.0,
+    "BUKIT MERAH": 3.8,
+    "BUKIT PANJANG": 3.8,
+    "BUKIT TIMAH": 0.3,
+    "CENTRAL AREA": 0.8,
+    "CHOA CHU KANG": 4.2,
+    "CLEMENTI": 2.2,
+    "GEYLANG": 2.3,
+    "HOUGANG": 5.0,
+    "JURONG EAST": 2.2,
+    "JURONG WEST": 7.5,
+    "KALLANG/WHAMPOA": 2.9,
+    "MARINE PARADE": 0.7,
+    "PASIR RIS": 3.2,
+    "PUNGGOL": 6.2,
+    "QUEENSTOWN": 2.7,
+    "SEMBAWANG": 3.0,
+    "SENGKANG": 8.0,
+    "SERANGOON": 2.0,
+    "TAMPINES": 6.8,
+    "TOA PAYOH": 3.0,
+    "WOODLANDS": 7.4,
+    "YISHUN": 6.9,
+}
+
+# Price multiplier for towns well above or below the island-wide median
+TOWN_PRICE_FACTORS = {
+    "BISHAN": 1.30,
+    "BUKIT MERAH": 1.25,
+    "BUKIT TIMAH": 1.40,
+    "CENTRAL AREA": 1.35,
+    "CLEMENTI": 1.20,
+    "KALLANG/WHAMPOA": 1.20,
+    "MARINE PARADE": 1.25,
+    "QUEENSTOWN": 1.30,
+    "TOA PAYOH": 1.20,
+    "CHOA CHU KANG": 0.90,
+    "JURONG WEST": 0.90,
+    "SEMBAWANG": 0.88,
+    "WOODLANDS": 0.88,
+    "YISHUN": 0.90,
+}
+
+# Per flat type: share of transactions, median price in the first year,
+# mean floor area in sqm, and the flat models it is built as
+FLAT_TYPE_PROFILES = {
+    "1 ROOM": (0.001, 220000, 31, {"Improved": 1.0}),
+    "2 ROOM": (0.018, 300000, 45, {"Standard": 0.3, "Model A": 0.5, "Improved": 0.2}),
+    "3 ROOM": (
+        0.250,
+        380000,
+        68,
+        {
+            "New Generation": 0.35,
+            "Improved": 0.25,
+            "Model A": 0.25,
+            "Simplified": 0.1,
+            "Standard": 0.05,
+        },
+    ),
+    "4 ROOM": (
+        0.410,
+        520000,
+        95,
+        {
+            "Model A": 0.45,
+            "Premium Apartment": 0.15,
+            "New Generation": 0.12,
+            "Simplified": 0.1,
+            "Model A2": 0.1,
+            "DBSS": 0.05,
+            "Standard": 0.03,
+        },
+    ),
+    "5 ROOM": (
+        0.250,
+        620000,
+        118,
+        {
+            "Improved": 0.45,
+            "Premium Apartment": 0.3,
+            "Model A": 0.15,
+            "DBSS": 0.05,
+            "Standard": 0.05,
+        },
+    ),
+    "EXECUTIVE": (
+        0.070,
+        780000,
+        145,
+        {
+            "Apartment": 0.5,
+            "Maisonette": 0.35,
+            "Premium Apartment": 0.1,
+            "Premium Maisonette": 0.05,
+        },
+    ),
+    "MULTI-GENERATION": (0.001, 900000, 160, {"Multi Generation": 1.0}),
+}
+
+# Storey ranges as printed in the dataset, with most sales on low floors
+STOREY_RANGES = tuple(f"{low:02d} TO {low + 2:02d}" for low in range(1, 51, 3))
+STOREY_DECAY = 0.72  # share of sales on each band relative to the one below
+
+# Street suffixes combined with the town name to make street names
+STREET_SUFFIXES = ("AVE", "ST", "DR", "RD", "CRES", "CTRL")
+
+# Span of sale months and lease commencement years
+FIRST_YEAR = 2017
+LAST_YEAR = 2025
+FIRST_LEASE_YEAR = 1966
+
+PRICE_GROWTH = 0.05  # yearly price growth
+LEASE_DECAY = 0.006  # price discount per year of lease used
+STOREY_PREMIUM = 0.02  # price premium per storey band
+PRICE_SPREAD = 0.15  # sigma of the lognormal noise around the median
+
+
+def _weights(values):
+    """Normalize a sequence of relative weights into probabilities"""
+    weights = np.asarray(values, dtype=float)
+    return weights / weights.sum()
+
+
+def generate_chunk(rows, rng):
+    """
+    Generate one DataFrame of synthetic resale transactions.
+
+    Args:
+        rows: Number of rows to generate
+        rng: numpy Generator supplying the randomness
+
+    Returns:
+        pandas.DataFrame: Rows with the CSV_COLUMNS of the resale dataset
+    """
+    towns = rng.choice(
+        list(TOWN_WEIGHTS), rows, p=_weights(list(TOWN_WEIGHTS.values()))
+    )
+    type_names = list(FLAT_TYPE_PROFILES)
+    type_codes = rng.choice(
+        len(type_names),
+        rows,
+        p=_weights([profile[0] for profile in FLAT_TYPE_PROFILES.values()]),
+    )
+    storeys = rng.choice(
+        len(STOREY_RANGES),
+        rows,
+        p=_weights(STOREY_DECAY ** np.arange(len(STOREY_RANGES))),
+    )
+    years = rng.integers(FIRST_YEAR, LAST_YEAR + 1, rows)
+    months = rng.integers(1, 13, rows)
+    leases = np.minimum(
+        rng.triangular(FIRST_LEASE_YEAR, 1990, LAST_YEAR, rows).astype(int), years - 3
+    )
+
+    medians = np.empty(rows)
+    areas = np.empty(rows)
+    models = np.empty(rows, dtype=object)
+    for code, (_, median, area, model_weights) in enumerate(
+        FLAT_TYPE_PROFILES.values()
+    ):
+        mask = type_codes == code
+        count = int(mask.sum())
+        medians[mask] = median
+        areas[mask] = np.round(rng.normal(area, area * 0.06, count))
+        models[mask] = rng.choice(
+            list(model_weights), count, p=_weights(list(model_weights.values()))
+        )
+
+    town_factors = np.array([TOWN_PRICE_FACTORS.get(town, 1.0) for town in towns])
+    lease_used = years - leases
+    prices = (
+        medians
+        * town_factors
+        * (1 + STOREY_PREMIUM * storeys)
+        * (1 + PRICE_GROWTH) ** (years - FIRST_YEAR)
+        * (1 - LEASE_DECAY * np.clip(lease_used - 5, 0, None))
+        * rng.lognormal(0, PRICE_SPREAD, rows)
+    )
+
+    blocks = rng.integers(1, 990, rows).astype(str)
+    lettered = rng.random(rows) < 0.15
+    blocks[lettered] = np.char.add(
+        blocks[lettered], rng.choice(list("ABCD"), int(lettered.sum()))
+    )
+    streets = [
+        f"{town} {suffix} {number}"
+        for town, suffix, number in zip(
+            towns,
+            rng.choice(STREET_SUFFIXES, rows),
+            rng.integers(1, 12, rows),
+        )
+    ]
+
+    return pd.DataFrame(
+        {
+            "month": [f"{year}-{month:02d}" for year, month in zip(years, months)],
+            "town": towns,
+            "flat_type": np.array(type_names, dtype=object)[type_codes],
+            "block": blocks,
+            "street_name": streets,
+            "storey_range": np.array(STOREY_RANGES, dtype=object)[storeys],
+            "floor_area_sqm": np.clip(areas, 28, 250),
+            "flat_model": models,
+            "lease_commence_date": leases,
+            "remaining_lease": [f"{99 - used} years" for used in lease_used],
+            "resale_price": np.maximum(np.round(prices, -3), 100000).astype(int),
+        },
+        columns=list(CSV_COLUMNS),
+    )
+
+
+def write_csv(path, rows, seed=0, chunk_rows=GENERATE_CHUNK_SIZE):
+    """
+    Write a synthetic resale CSV of the given number of rows.
+
+    The same seed and row count always produce the same file.
+
+    Returns:
+        str: path
+    """
+    rng = np.random.default_rng(seed)
+    with open(path, "w", newline="") as f:
+        for start in range(0, rows, chunk_rows):
+            chunk = generate_chunk(min(chunk_rows, rows - start), rng)
+            chunk.to_csv(f, header=start == 0, index=False)
+    return path
+
+
+def build_database(db_path, csv_path, workers=None):
+    """
+    Load a synthetic CSV into a fresh database through the ingest pipeline.
+
+    Any existing database at db_path is replaced.
+
+    Args:
+        db_path: Path of the SQLite database to create
+        csv_path: CSV written by write_csv
+        workers: Parser processes for the pipeline (the ingest default if None)
+
+    Returns:
+        tuple: (Database, pipeline stats from dataPrepare.run_pipeline)
+    """
+    # Imported here so generating data does not need the download client
+    from dataPrepare import PIPELINE_WORKERS, run_pipeline
+
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    db = Database(db_path)
+    db.initdb()
+    _, stats = run_pipeline(
+        csv_path,
+        lambda flats: db.bulk_insert_flats(
+            flats, columns=FLAT_COLUMNS + tuple(SYNC_COLUMNS)
+        ),
+        workers=PIPELINE_WORKERS if workers is None else workers,
+    )
+    return db, stats
@@ -0,0 +1,64 @@
+"""Shared fixtures: small synthetic databases built with syntheticData"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The application modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Module-level singletons, such as the app's database, read their paths at
+# import time; point them at scratch files before anything imports them
+SCRATCH_DIR = tempfile.mkdtemp(prefix="hdb_tests_")
+os.environ["HDB_DATABASE"] = os.path.join(SCRATCH_DIR, "hdb_flats.db")
+os.environ["HDB_SNAPSHOT_DIR"] = os.path.join(SCRATCH_DIR, "hdb_snapshot")
+
+from Database import Database  # noqa: E402
+from syntheticData import build_database, write_csv  # noqa: E402
+
+# Rows in the shared synthetic dataset
+FLATS = 3000
+
+
+@pytest.fixture(scope="session")
+def flats_db(tmp_path_factory):
+    """Read-only database of synthetic flats, loaded through the ingest pipeline"""
+    directory = tmp_path_factory.mktemp("flats")
+    csv_path = write_csv(str(directory / "resale.csv"), FLATS, seed=0)
+    db, _ = build_database(str(directory / "hdb_flats.db"), csv_path, workers=0)
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def empty_db(tmp_path):
+    """Fresh database with the schema but no flats"""
+    db = Database(str(tmp_path / "hdb_flats.db"))
+    db.initdb()
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def sample_flats(flats_db):
+    """A few hundred flat rows as dicts, ready to insert elsewhere"""
+    return [dict(flat) for flat in flats_db.query_ids(range(1, 301))]
+
+
+@pytest.fixture(scope="session")
+def app(flats_db):
+    """The Flask app, serving a scratch copy of a few hundred synthetic flats"""
+    import app as app_module
+
+    app_module.database.bulk_insert_flats(
+        [dict(flat) for flat in flats_db.query_ids(range(1, 301))]
+    )
+    app_module.app.config["TESTING"] = True
+    return app_module.app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
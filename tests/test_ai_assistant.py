@@ -0,0 +1,54 @@
+import pytest
+
+import ai_assistant
+from ai_assistant import RESPONSE_CACHE_TABLE, AIAssistant
+from loadTest import FakeModel
+from persistentCache import PersistentCache
+
+
+@pytest.fixture
+def assistant(empty_db, sample_flats, monkeypatch):
+    """An assistant on the fake model, reading 20 flats and caching beside them"""
+    empty_db.bulk_insert_flats(sample_flats[:20])
+    monkeypatch.setattr(ai_assistant, "database", empty_db)
+    cache = PersistentCache(RESPONSE_CACHE_TABLE, 100, 3600, db=empty_db)
+    monkeypatch.setattr(ai_assistant, "response_cache", cache)
+    return AIAssistant(model_name="fake", model=FakeModel(latency=(0.0, 0.0)))
+
+
+def test_analysis_is_cached_until_the_data_changes(assistant, empty_db):
+    cache = ai_assistant.response_cache
+    analysis = assistant.ask_about_flat(1)
+    assert assistant.ask_about_flat(1) == analysis
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Any write to hdb_flats moves the data version, and with it the key
+    empty_db.bulk_insert_flats([dict(empty_db.query_id(20), id=None)])
+    assistant.ask_about_flat(1)
+    assert (cache.hits, cache.misses) == (1, 2)
+    assistant.ask_about_flat(1)
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_comparison_is_shared_by_either_order(assistant):
+    cache = ai_assistant.response_cache
+    comparison = assistant.compare_flats(2, 1)
+    assert assistant.compare_flats(1, 2) == comparison
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_key_covers_flats_prompt_model_and_data(assistant, empty_db):
+    template = ai_assistant.FLAT_ANALYSIS_PROMPT
+    key = assistant._response_cache_key(template, [1])
+    ids, prompt_hash, model_name, data_version = key.split(":")
+    assert (ids, model_name) == ("1", "fake")
+    assert data_version == str(empty_db.data_version())
+
+    assistant.system_prompt += "Answer in one paragraph.\n"
+    assert assistant._response_cache_key(template, [1]).split(":")[1] != prompt_hash
+
+
+def test_missing_flats_are_not_sent_to_the_model(assistant):
+    assert assistant.ask_about_flat(999) == "Flat not found in database."
+    assert assistant.compare_flats(1, 999) == "One or both flats not found in database."
+    assert ai_assistant.response_cache.misses == 0
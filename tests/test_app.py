@@ -0,0 +1,181 @@
+import json
+
+import pytest
+
+import ai_assistant
+import app as app_module
+from ai_assistant import RESPONSE_CACHE_TABLE, AIAssistant
+from loadTest import FakeModel
+from metrics import metrics
+from persistentCache import PersistentCache
+from queryTrace import query_tracer
+
+SEARCH_REQUESTS = 'hdb_requests_total{route="/search",method="GET",status="%s"}'
+
+
+def metric_value(client, series):
+    """Read one series from /metrics, or 0 if it has not been recorded yet"""
+    for line in client.get("/metrics").get_data(as_text=True).splitlines():
+        if line.startswith(series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_metrics_count_requests_and_time_their_components(client):
+    requests = metric_value(client, SEARCH_REQUESTS % 200)
+    response = client.get("/search?town=BEDOK")
+    assert response.status_code == 200
+
+    text = client.get("/metrics").get_data(as_text=True)
+    assert "# TYPE hdb_requests_total counter" in text
+    assert "# TYPE hdb_request_duration_seconds histogram" in text
+    assert metric_value(client, SEARCH_REQUESTS % 200) == requests + 1
+    for component in ("database", "template"):
+        series = (
+            "hdb_request_component_seconds_count"
+            f'{{route="/search",component="{component}"}}'
+        )
+        assert metric_value(client, series) >= 1, component
+    # Cumulative buckets end with +Inf, which equals the count
+    inf = metric_value(
+        client,
+        'hdb_request_duration_seconds_bucket{route="/search",method="GET",le="+Inf"}',
+    )
+    count = metric_value(
+        client, 'hdb_request_duration_seconds_count{route="/search",method="GET"}'
+    )
+    assert inf == count >= 1
+
+
+def test_unmatched_routes_share_one_label(client):
+    before = metric_value(
+        client, 'hdb_requests_total{route="unmatched",method="GET",status="404"}'
+    )
+    for path in ("/no/such/page", "/another/missing/page"):
+        response = client.get(path)
+        assert response.status_code == 404
+        # Error pages are streamed bodies, recorded once the server closes them
+        response.close()
+    after = metric_value(
+        client, 'hdb_requests_total{route="unmatched",method="GET",status="404"}'
+    )
+    assert after == before + 2
+
+
+@pytest.mark.parametrize("propagate", [True, False])
+def test_requests_that_raise_are_counted_as_500(app, client, monkeypatch, propagate):
+    def broken(*args, **kwargs):
+        raise RuntimeError("database is down")
+
+    monkeypatch.setattr(app_module.database, "search_page", broken)
+    monkeypatch.setitem(app.config, "PROPAGATE_EXCEPTIONS", propagate)
+    before = metric_value(client, SEARCH_REQUESTS % 500)
+
+    if propagate:
+        with pytest.raises(RuntimeError):
+            client.get("/search?town=BEDOK")
+    else:
+        response = client.get("/search?town=BEDOK")
+        assert response.status_code == 500
+        response.close()
+
+    assert metric_value(client, SEARCH_REQUESTS % 500) == before + 1
+    # The request's timing state does not leak into the next request
+    assert metrics._local.timings is None
+
+
+def test_slow_queries_are_logged_with_their_plans(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, "DEBUG_QUERIES", True)
+    monkeypatch.setattr(query_tracer, "threshold_ms", 0)
+    client.get("/debug/queries?reset=1")
+
+    client.get("/search?town=BEDOK&flat_type=4 ROOM")
+    stats = client.get("/debug/queries").get_json()
+
+    assert stats["threshold_ms"] == 0
+    search = [
+        entry
+        for entry in stats["slow"]
+        if entry["sql"].startswith("SELECT hdb_flats.*")
+    ]
+    assert search, stats["slow"]
+    assert search[0]["params"][:2] == ["BEDOK", "4 ROOM"]
+    assert search[0]["access"] == "SEARCH"
+    assert any("idx_hdb_flats_town_type_price" in step for step in search[0]["plan"])
+    shapes = {shape["shape"]: shape for shape in stats["shapes"]}
+    assert shapes[search[0]["shape"]]["slow_calls"] >= 1
+
+
+def test_fast_queries_are_timed_but_not_logged(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, "DEBUG_QUERIES", True)
+    monkeypatch.setattr(query_tracer, "threshold_ms", 60000)
+    client.get("/debug/queries?reset=1")
+
+    client.get("/search?town=BEDOK")
+    stats = client.get("/debug/queries").get_json()
+
+    assert stats["slow"] == []
+    assert sum(shape["calls"] for shape in stats["shapes"]) >= 1
+
+
+def test_debug_queries_is_hidden_by_default(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, "DEBUG_QUERIES", False)
+    assert client.get("/debug/queries").status_code == 404
+
+
+class FailingModel(FakeModel):
+    """Fake model whose stream breaks off after its first chunk"""
+
+    def _stream(self, text, delay):
+        yield from list(super()._stream(text, delay))[:1]
+        raise RuntimeError("connection reset")
+
+
+@pytest.fixture
+def assistant(app, empty_db, monkeypatch):
+    """Serve the AI routes from the fake model, with an empty response cache"""
+    cache = PersistentCache(RESPONSE_CACHE_TABLE, 100, 3600, db=empty_db)
+    monkeypatch.setattr(ai_assistant, "response_cache", cache)
+    assistant = AIAssistant(model_name="fake", model=FakeModel(latency=(0.0, 0.0)))
+    monkeypatch.setattr(app_module, "get_ai_assistant", lambda: assistant)
+    return assistant
+
+
+def server_sent_events(response):
+    """Split a text/event-stream body into (event, data) pairs"""
+    assert response.mimetype == "text/event-stream"
+    body = response.get_data(as_text=True)
+    # Every event, the last included, ends with a blank line
+    assert body.endswith("\n\n")
+    events = []
+    for block in body[:-2].split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        assert set(fields) <= {"event", "data"}, block
+        events.append((fields.get("event", "message"), json.loads(fields["data"])))
+    return events
+
+
+def test_analysis_streams_as_server_sent_events(client, assistant):
+    text = FakeModel(latency=(0.0, 0.0)).generate_content("analyze").text
+
+    events = server_sent_events(client.get("/api/ai/analyze_flat/1?stream=1"))
+    assert len(events) > 2
+    assert events[-1] == ("done", {})
+    assert {event for event, data in events[:-1]} == {"message"}
+    assert "".join(data["text"] for event, data in events[:-1]) == text
+
+    # A cached answer arrives whole, in one message event
+    events = server_sent_events(client.get("/api/ai/analyze_flat/1?stream=1"))
+    assert events == [("message", {"text": text}), ("done", {})]
+
+
+def test_failed_stream_ends_with_an_error_event(client, assistant):
+    assistant.model = FailingModel(latency=(0.0, 0.0))
+
+    events = server_sent_events(client.get("/api/ai/compare/1/2?stream=1"))
+    assert [event for event, data in events] == ["message", "error"]
+    assert "connection reset" in events[-1][1]["error"]
+    # The broken answer was not cached, so the next request streams afresh
+    assistant.model = FakeModel(latency=(0.0, 0.0))
+    events = server_sent_events(client.get("/api/ai/compare/2/1?stream=1"))
+    assert len(events) > 2 and events[-1] == ("done", {})
@@ -0,0 +1,67 @@
+import pytest
+
+from chatIntent import parse_amount, parse_intent
+
+
+@pytest.mark.parametrize(
+    "message, town, flat_type, price_range, order_by",
+    [
+        ("Show me 4 room flats in Tampines", "TAMPINES", "4 ROOM", None, "price"),
+        ("Cheapest flats in Bedok", "BEDOK", "", None, "price_asc"),
+        (
+            "3-room flats in AMK under $450k",
+            "ANG MO KIO",
+            "3 ROOM",
+            (None, 450000),
+            "price",
+        ),
+        (
+            "flats between 300k and 500k in Yishun",
+            "YISHUN",
+            "",
+            (300000, 500000),
+            "price",
+        ),
+        ("executive flats over 1.2m", "", "EXECUTIVE", (1200000, None), "price"),
+        (
+            "four room jurong west from 400,000 to 550,000",
+            "JURONG WEST",
+            "4 ROOM",
+            (400000, 550000),
+            "price",
+        ),
+        ("HDB in kallang", "KALLANG/WHAMPOA", "", None, "price"),
+        ("most expensive 5rm flats in Bishan", "BISHAN", "5 ROOM", None, "price"),
+    ],
+)
+def test_plain_searches_are_parsed(message, town, flat_type, price_range, order_by):
+    assert parse_intent(message) == {
+        "town": town,
+        "flat_type": flat_type,
+        "price_range": price_range,
+        "order_by": order_by,
+    }
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "Average price of executive flats",  # an aggregate
+        "Compare Bishan and Toa Payoh",  # two towns
+        "4 room flats near MRT in Bedok",  # a condition search cannot express
+        "flats under 500",  # unclear unit
+        "cheapest and most expensive flats in Bedok",  # two sort orders
+        "3 room or 4 room flats in Bedok",  # two flat types
+        "hello",
+        "flats in jurong",  # not a town on its own
+    ],
+)
+def test_other_questions_are_left_to_the_model(message):
+    assert parse_intent(message) is None
+
+
+def test_parse_amount():
+    assert parse_amount("450", "K") == 450000
+    assert parse_amount("1.2", "M") == 1200000
+    assert parse_amount("550,000", None) == 550000
+    assert parse_amount("500", None) is None
@@ -0,0 +1,172 @@
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import dataPrepare
+from Database import Database
+from flatStore import FlatStore
+from syntheticData import write_csv
+
+
+class DatasetServer:
+    """Local stand-in for the data.gov.sg download API, serving one file"""
+
+    def __init__(self):
+        self.content = b""
+        self.etag = ""
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.requests.append((self.path, dict(self.headers)))
+                if self.path.endswith("/poll-download"):
+                    url = f"http://127.0.0.1:{self.server.server_port}/file.csv"
+                    self.reply(200, json.dumps({"data": {"url": url}}).encode())
+                elif self.headers.get("If-None-Match") == server.etag:
+                    self.reply(304)
+                elif "Range" in self.headers:
+                    self.reply_range()
+                else:
+                    self.reply(200, server.content)
+
+            def reply_range(self):
+                if self.headers.get("If-Range") != server.etag:
+                    self.reply(200, server.content)
+                    return
+                start = int(self.headers["Range"].split("=")[1].rstrip("-"))
+                if start >= len(server.content):
+                    self.reply(416)
+                else:
+                    self.reply(206, server.content[start:])
+
+            def reply(self, status, body=b""):
+                self.send_response(status)
+                self.send_header("ETag", server.etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+
+    def publish(self, content, etag):
+        self.content = content
+        self.etag = etag
+
+    def file_requests(self):
+        """Headers of every request for the file itself"""
+        return [headers for path, headers in self.requests if path == "/file.csv"]
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = DatasetServer()
+    thread = threading.Thread(target=server.httpd.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(dataPrepare, "API_BASE", server.url)
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+
+@pytest.fixture
+def csv_content(tmp_path):
+    with open(write_csv(str(tmp_path / "source.csv"), 200, seed=0), "rb") as f:
+        return f.read()
+
+
+def download(path):
+    return dataPrepare.download_dataset("d_test", str(path))
+
+
+def test_partial_download_is_resumed(server, csv_content, tmp_path):
+    server.publish(csv_content, '"v1"')
+    path = tmp_path / "resale.csv"
+    (tmp_path / "resale.csv.part").write_bytes(csv_content[:1000])
+    dataPrepare._write_download_meta(str(path), {"etag": '"v1"', "complete": False})
+
+    assert download(path) == ('"v1"', True)
+    assert path.read_bytes() == csv_content
+    assert server.file_requests()[-1]["Range"] == "bytes=1000-"
+    assert not (tmp_path / "resale.csv.part").exists()
+
+
+def test_unsatisfiable_resume_downloads_again(server, csv_content, tmp_path):
+    server.publish(csv_content, '"v1"')
+    path = tmp_path / "resale.csv"
+    (tmp_path / "resale.csv.part").write_bytes(csv_content + b"stale tail")
+    dataPrepare._write_download_meta(str(path), {"etag": '"v1"', "complete": False})
+
+    assert download(path) == ('"v1"', True)
+    assert path.read_bytes() == csv_content
+    first, retry = server.file_requests()
+    assert "Range" in first and "Range" not in retry
+
+
+def test_complete_download_is_revalidated(server, csv_content, tmp_path):
+    server.publish(csv_content, '"v1"')
+    path = tmp_path / "resale.csv"
+    assert download(path) == ('"v1"', True)
+
+    assert download(path) == ('"v1"', False)
+    assert server.file_requests()[-1]["If-None-Match"] == '"v1"'
+    assert path.read_bytes() == csv_content
+
+    server.publish(csv_content[: csv_content.rindex(b"\n", 0, -1) + 1], '"v2"')
+    assert download(path) == ('"v2"', True)
+    assert path.read_bytes() == server.content
+
+
+def test_failed_load_is_retried_on_the_next_run(
+    server, csv_content, tmp_path, monkeypatch, capsys
+):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, "argv", ["dataPrepare.py", "--workers", "0"])
+    db = Database(str(tmp_path / "hdb_flats.db"))
+    monkeypatch.setattr(dataPrepare, "database", db)
+    monkeypatch.setattr(
+        dataPrepare, "flat_store", FlatStore(str(tmp_path / "snapshot"), db=db)
+    )
+
+    # The first run has nothing to sync against, so it loads every row
+    server.publish(csv_content, '"v1"')
+    dataPrepare.main()
+    assert db.count_search_results("", "", "") == 200
+    assert db.get_metadata("dataset_version") == '"v1"'
+    high_water_mark = db.get_metadata("sync_high_water_mark")
+    assert high_water_mark
+
+    # A new release whose sync fails
+    with open(write_csv(str(tmp_path / "extra.csv"), 50, seed=1), "rb") as f:
+        extra_rows = f.read().split(b"\n", 1)[1]
+    server.publish(csv_content + extra_rows, '"v2"')
+
+    def failing_sync(flats, **kwargs):
+        raise RuntimeError("load failed")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(db, "sync_flats", failing_sync)
+        with pytest.raises(RuntimeError):
+            dataPrepare.main()
+    assert db.get_metadata("dataset_version") == '"v1"'
+    assert db.get_metadata("sync_high_water_mark") == high_water_mark
+
+    # The file is now current, so the server answers 304, but the load is
+    # still outstanding
+    dataPrepare.main()
+    assert server.file_requests()[-1]["If-None-Match"] == '"v2"'
+    assert db.count_search_results("", "", "") == 250
+    assert db.get_metadata("dataset_version") == '"v2"'
+
+    # Only now is there nothing left to do
+    capsys.readouterr()
+    dataPrepare.main()
+    assert "Dataset unchanged" in capsys.readouterr().out
+    db.close()
@@ -0,0 +1,224 @@
+import pytest
+
+from Database import FLAT_COLUMNS, INDEXES
+from queryTrace import plan_access, query_tracer
+
+
+def index_names(db):
+    with db.checkout() as connection:
+        rows = connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'hdb_flats'"
+        ).fetchall()
+    return {row["name"] for row in rows}
+
+
+def failing(flats, after):
+    """Yield flats, then fail part-way through the load"""
+    for count, flat in enumerate(flats):
+        if count == after:
+            raise RuntimeError("load failed")
+        yield flat
+
+
+def test_bulk_insert_inserts_every_flat(empty_db, sample_flats):
+    assert empty_db.bulk_insert_flats(sample_flats, batch_size=64) == len(sample_flats)
+    assert empty_db.count_search_results("", "", "") == len(sample_flats)
+    assert set(INDEXES) <= index_names(empty_db)
+
+
+@pytest.mark.parametrize("replace", [False, True])
+def test_failed_bulk_insert_leaves_schema_and_data(empty_db, sample_flats, replace):
+    empty_db.bulk_insert_flats(sample_flats[:100], columns=FLAT_COLUMNS)
+    indexes = index_names(empty_db)
+    version = empty_db.data_version()
+
+    with pytest.raises(RuntimeError):
+        empty_db.bulk_insert_flats(
+            failing(sample_flats[100:], 50), batch_size=16, replace=replace
+        )
+
+    assert index_names(empty_db) == indexes
+    empty_db.clear_count_cache()
+    assert empty_db.count_search_results("", "", "") == 100
+    assert empty_db.data_version() == version
+
+
+def test_bulk_insert_replace_swaps_the_data(empty_db, sample_flats):
+    empty_db.bulk_insert_flats(sample_flats[:100])
+    empty_db.bulk_insert_flats(sample_flats[100:250], replace=True)
+
+    empty_db.clear_count_cache()
+    assert empty_db.count_search_results("", "", "") == 150
+    assert len(empty_db.search_flats("BEDOK", "", "", limit=500)) == sum(
+        "BEDOK" in (flat["town"] + " " + flat["street_name"])
+        for flat in sample_flats[100:250]
+    )
+
+
+@pytest.mark.parametrize(
+    "town, flat_type",
+    [("BEDOK", ""), ("", "4 ROOM"), ("BEDOK", "4 ROOM"), ("", "")],
+)
+@pytest.mark.parametrize("order_by", ["price", "price_asc"])
+def test_dropdown_searches_read_an_index_in_price_order(
+    flats_db, town, flat_type, order_by
+):
+    sql, params = flats_db._search_query(
+        "", town, flat_type, order_by, None, None, limit=20
+    )
+    with flats_db.checkout() as connection:
+        plan = query_tracer.explain(connection, sql, params)
+
+    assert not any("TEMP B-TREE" in detail for detail in plan), plan
+    if town or flat_type:
+        assert plan_access(plan) == "SEARCH", plan
+
+
+def test_relevance_keyset_pages_match_offset_pages(flats_db):
+    query = "bedok"
+    ranked = flats_db.search_flats(query, "", "", order_by="relevance")
+    assert len(ranked) > 40
+    relevance = [flat["relevance"] for flat in ranked]
+    assert relevance == sorted(relevance)
+
+    pages, after = [], None
+    while True:
+        page = flats_db.search_flats(
+            query, "", "", limit=20, order_by="relevance", after=after
+        )
+        if not page:
+            break
+        pages.append(page)
+        after = (page[-1]["relevance"], page[-1]["id"])
+    assert [flat["id"] for page in pages for flat in page] == [
+        flat["id"] for flat in ranked
+    ]
+
+    # Stepping back from the last page lands on the page before it
+    first = pages[-1][0]
+    previous = flats_db.search_flats(
+        query,
+        "",
+        "",
+        limit=20,
+        order_by="relevance",
+        before=(first["relevance"], first["id"]),
+    )
+    assert [flat["id"] for flat in previous] == [flat["id"] for flat in pages[-2]]
+
+
+def test_text_without_words_matches_no_flats(flats_db):
+    total = flats_db.count_search_results("", "", "")
+    assert total == flats_db.count_search_results("   ", "", "")
+
+    for order_by in ("price", "price_asc", "relevance"):
+        assert flats_db.search_flats("!!!", "", "", order_by=order_by) == []
+    # The count is not served from the cached total of the unfiltered search
+    assert flats_db.count_search_results("!!!", "", "") == 0
+    assert flats_db.search_page("-/-", "BEDOK", "", limit=20) == ([], 0)
+
+
+@pytest.mark.parametrize("town, flat_type", [("", ""), ("BEDOK", ""), ("", "4 ROOM")])
+def test_keyset_pages_match_offset_pages(flats_db, town, flat_type):
+    total = flats_db.count_search_results("", town, flat_type)
+    offset_pages = [
+        flats_db.search_flats("", town, flat_type, limit=50, offset=offset)
+        for offset in range(0, total, 50)
+    ]
+
+    keyset_pages, after = [], None
+    while True:
+        page = flats_db.search_flats("", town, flat_type, limit=50, after=after)
+        if not page:
+            break
+        keyset_pages.append(page)
+        after = (page[-1]["resale_price"], page[-1]["id"])
+
+    def ids(pages):
+        return [[flat["id"] for flat in page] for page in pages]
+
+    assert ids(keyset_pages) == ids(offset_pages)
+
+    # Walking back with before cursors retraces the same pages
+    before = keyset_pages[-1][0]
+    for expected in reversed(offset_pages[:-1]):
+        page = flats_db.search_flats(
+            "",
+            town,
+            flat_type,
+            limit=50,
+            before=(before["resale_price"], before["id"]),
+        )
+        assert [flat["id"] for flat in page] == [flat["id"] for flat in expected]
+        before = page[0]
+
+
+def keyed(flats, prefix="key"):
+    """Give flats the source_key and row_hash a sync compares"""
+    return [
+        dict(flat, source_key=f"{prefix}-{index}", row_hash=f"hash-{index}")
+        for index, flat in enumerate(flats)
+    ]
+
+
+def test_sync_adds_changes_and_skips_flats(empty_db, sample_flats):
+    flats = keyed(sample_flats[:20])
+    empty_db.sync_flats(flats)
+    version = empty_db.data_version()
+    street = flats[0]["street_name"]
+
+    renamed = dict(flats[0], street_name="ZEBRA CROSSING", row_hash="hash-new")
+    added = keyed(sample_flats[20:25], prefix="new")
+    counts = empty_db.sync_flats(
+        [renamed] + flats[1:] + added, metadata={"dataset_version": "v2"}
+    )
+
+    assert counts == {"added": 5, "changed": 1, "skipped": 19}
+    assert empty_db.count_search_results("", "", "") == 25
+    assert empty_db.data_version() != version
+    assert empty_db.get_metadata("dataset_version") == "v2"
+    # The changed flat left the full-text index under its old street name
+    # and came back under the new one
+    assert [flat["id"] for flat in empty_db.search_flats("zebra", "", "")] == [1]
+    assert 1 not in [flat["id"] for flat in empty_db.search_flats(street, "", "")]
+
+
+def test_sync_of_identical_flats_writes_nothing(empty_db, sample_flats):
+    flats = keyed(sample_flats[:20])
+    empty_db.sync_flats(flats)
+    version = empty_db.data_version()
+
+    assert empty_db.sync_flats(flats) == {"added": 0, "changed": 0, "skipped": 20}
+    assert empty_db.data_version() == version
+
+
+def test_writes_invalidate_cached_counts(empty_db, sample_flats):
+    empty_db.bulk_insert_flats(sample_flats[:100])
+    bedok = empty_db.count_search_results("", "BEDOK", "")
+    total = empty_db.count_search_results("", "", "")
+    version = empty_db.data_version()
+
+    empty_db.insert_flat(
+        "BEDOK", "4 ROOM", "1", "BEDOK NORTH AVE 1", "01 TO 03", 90.0,
+        "Model A", 1990, 400000.0,
+    )  # fmt: skip
+
+    assert empty_db.data_version() == version + 1
+    assert empty_db.count_search_results("", "BEDOK", "") == bedok + 1
+    assert empty_db.count_search_results("", "", "") == total + 1
+    # search_page reads the same cache
+    assert empty_db.search_page("", "BEDOK", "", limit=5)[1] == bedok + 1
+
+
+def test_query_ids_keeps_the_caller_order(flats_db):
+    ids = [17, 3, 2999, 3, 5, 999999, 1]
+    assert [flat["id"] for flat in flats_db.query_ids(ids)] == [
+        17, 3, 2999, 3, 5, 1
+    ]  # fmt: skip
+    assert flats_db.query_ids([]) == []
+
+
+def test_query_ids_reads_long_lists_in_chunks(flats_db):
+    # More ids than one statement may bind, spread across the chunk boundary
+    ids = list(range(2500, 0, -1)) + [999999]
+    assert [flat["id"] for flat in flats_db.query_ids(ids)] == ids[:-1]
@@ -0,0 +1,41 @@
+import numpy as np
+
+import flatStore
+from flatStore import NUMERIC_COLUMNS, STRING_COLUMNS, FlatStore
+
+
+def test_chunked_export_matches_the_table(flats_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(flatStore, "EXPORT_CHUNK_SIZE", 7)
+    store = FlatStore(str(tmp_path), db=flats_db)
+    assert store.export() == flats_db.count_search_results("", "", "")
+
+    snapshot = store.current()
+    with flats_db.checkout() as connection:
+        rows = connection.execute("SELECT * FROM hdb_flats ORDER BY id").fetchall()
+    for column in STRING_COLUMNS:
+        vocabulary = snapshot["vocabularies"][column]
+        stored = [vocabulary[code] for code in snapshot["columns"][column]]
+        assert stored == [row[column] for row in rows], column
+    for column in NUMERIC_COLUMNS:
+        expected = np.array([row[column] for row in rows], dtype=float)
+        assert np.array_equal(
+            snapshot["columns"][column].astype(float), expected, equal_nan=True
+        ), column
+
+
+def test_snapshot_outlives_a_newer_export(empty_db, sample_flats, tmp_path):
+    store = FlatStore(str(tmp_path), db=empty_db)
+    empty_db.bulk_insert_flats(sample_flats[:200])
+    store.export()
+    snapshot = store.current()
+    rows = store.sort(snapshot, store.filter(snapshot))
+    preferences = {"flat_type": "4 ROOM"}
+    ranked = store.rank(snapshot, preferences, rows, 200)
+
+    # A smaller table is published while the request still holds its rows
+    empty_db.bulk_insert_flats(sample_flats[:50], replace=True)
+    assert store.current() is None
+    store.export()
+    assert store.current()["size"] == 50
+
+    assert store.rank(snapshot, preferences, rows, 200) == ranked
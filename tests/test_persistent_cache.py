@@ -0,0 +1,75 @@
+import pytest
+
+import persistentCache
+from persistentCache import PersistentCache
+
+
+class Clock:
+    """Stand-in for time.time that only moves when told to"""
+
+    def __init__(self):
+        self.now = 1000000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(persistentCache.time, "time", clock)
+    return clock
+
+
+def last_used(cache, key):
+    with cache.database.checkout() as connection:
+        row = connection.execute(
+            f"SELECT last_used FROM {cache.table} WHERE key = ?", (key,)
+        ).fetchone()
+    return row["last_used"]
+
+
+def test_entries_expire_after_the_ttl(empty_db, clock):
+    cache = PersistentCache("test_cache", max_entries=10, ttl=60, db=empty_db)
+    cache.set("a", "1")
+
+    clock.now += 60
+    assert cache.get("a") == "1"
+    clock.now += 1
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entries_are_evicted(empty_db, clock):
+    cache = PersistentCache(
+        "test_cache", max_entries=2, ttl=3600, db=empty_db, touch_interval=0
+    )
+    cache.set("a", "1")
+    clock.now += 1
+    cache.set("b", "2")
+    clock.now += 1
+    assert cache.get("a") == "1"
+    clock.now += 1
+    cache.set("c", "3")
+
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+
+def test_hits_only_touch_entries_once_per_interval(empty_db, clock):
+    cache = PersistentCache(
+        "test_cache", max_entries=10, ttl=3600, db=empty_db, touch_interval=60
+    )
+    cache.set("a", "1")
+    stored = clock.now
+
+    clock.now += 30
+    assert cache.get("a") == "1"
+    assert last_used(cache, "a") == stored
+
+    clock.now += 30
+    assert cache.get("a") == "1"
+    assert last_used(cache, "a") == clock.now
@@ -0,0 +1,86 @@
+import sqlite3
+
+import pytest
+
+from flatStore import FlatStore
+from scoreCalculator import score_calculator
+
+PREFERENCES = [
+    {"flat_type": "4 ROOM"},
+    {"price_range": "400k-500k"},
+    {"floor_area_sqm": "91-110", "storey_range": "10 TO 12"},
+    {"flat_model": "Improved", "price_range": "Over 1M"},
+    {
+        "flat_type": "EXECUTIVE",
+        "storey_range": "01 TO 03",
+        "floor_area_sqm": "151+",
+        "flat_model": "Premium Apartment",
+        "price_range": "Under 200k",
+    },
+]
+
+
+@pytest.fixture(scope="module")
+def all_flats(flats_db):
+    return [dict(flat) for flat in flats_db.search_flats("", "", "")]
+
+
+@pytest.fixture(scope="module")
+def flat_store(flats_db, tmp_path_factory):
+    store = FlatStore(str(tmp_path_factory.mktemp("snapshot")), db=flats_db)
+    store.export()
+    return store
+
+
+def expected_scores(flats, preferences):
+    return {
+        flat["id"]: score_calculator.calculate_score(flat, preferences)
+        for flat in flats
+    }
+
+
+@pytest.mark.parametrize("preferences", PREFERENCES)
+def test_batch_scores_match_calculate_score(all_flats, preferences):
+    columns = {
+        name: [flat[name] for flat in all_flats] for name in score_calculator.columns
+    }
+    scores = score_calculator.calculate_scores_batch(columns, preferences)
+
+    assert dict(
+        zip((flat["id"] for flat in all_flats), scores.tolist())
+    ) == expected_scores(all_flats, preferences)
+
+
+@pytest.mark.parametrize("preferences", PREFERENCES)
+def test_sql_scores_match_calculate_score(flats_db, all_flats, preferences):
+    ranked = flats_db.search_flats(
+        "", "", "", order_by="score", preferences=preferences
+    )
+
+    assert {
+        flat["id"]: flat["compatibility_score"] for flat in ranked
+    } == expected_scores(all_flats, preferences)
+
+
+@pytest.mark.parametrize("preferences", PREFERENCES)
+def test_snapshot_ranking_matches_sql_ranking(flats_db, flat_store, preferences):
+    snapshot = flat_store.current()
+    rows = flat_store.sort(snapshot, flat_store.filter(snapshot))
+    ranked = flat_store.rank(snapshot, preferences, rows, len(rows))
+    in_sql = flats_db.search_flats(
+        "", "", "", order_by="score", preferences=preferences
+    )
+
+    assert ranked == [(flat["compatibility_score"], flat["id"]) for flat in in_sql]
+
+
+@pytest.mark.parametrize(
+    "value", [0.0, 0.5, 1.5, 2.5, 3.5, 2.4999999, 2.5000001, 49.5, 50.5, 99.5, 100.0]
+)
+def test_round_sql_rounds_halves_to_even(value):
+    connection = sqlite3.connect(":memory:")
+    sql = f"SELECT {score_calculator.round_sql('value')} FROM (SELECT ? AS value)"
+    (rounded,) = connection.execute(sql, (value,)).fetchone()
+    connection.close()
+
+    assert rounded == round(value)
@@ -0,0 +1,116 @@
+import pytest
+
+from sqlSandbox import QueryRejected, SqlSandbox
+
+# Joins every flat to every other flat in its town: cheap to plan, since the
+# inner side searches an index, but a few hundred thousand rows to count
+TOWN_PAIRS = (
+    "SELECT COUNT(*) FROM hdb_flats a JOIN hdb_flats b ON a.town = b.town LIMIT 1"
+)
+
+
+@pytest.fixture
+def sandbox(flats_db):
+    sandbox = SqlSandbox(db=flats_db)
+    yield sandbox
+    while not sandbox._pool.empty():
+        sandbox._pool.get_nowait().close()
+
+
+def test_bounded_select_runs(sandbox):
+    rows = sandbox.execute(
+        "SELECT town, AVG(resale_price) AS average FROM hdb_flats"
+        " WHERE flat_type = '4 ROOM' GROUP BY town LIMIT 100"
+    )
+    assert 0 < len(rows) <= sandbox.max_rows
+    assert rows[0]["average"] > 0
+
+
+def test_results_are_capped(sandbox):
+    rows = sandbox.execute("SELECT id FROM hdb_flats LIMIT 1000")
+    assert len(rows) == sandbox.max_rows
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "DELETE FROM hdb_flats",
+        "UPDATE hdb_flats SET resale_price = 0 WHERE id = 1",
+        "INSERT INTO hdb_flats (town) VALUES ('X')",
+        "DROP TABLE hdb_flats",
+        "PRAGMA query_only = OFF",
+        "SELECT 1; DELETE FROM hdb_flats",
+        "/* comment */ DELETE FROM hdb_flats",
+        "WITH gone AS (SELECT 1) DELETE FROM hdb_flats",
+    ],
+)
+def test_writes_are_refused(sandbox, flats_db, sql):
+    before = flats_db.count_search_results("", "", "")
+    with pytest.raises(QueryRejected):
+        sandbox.execute(sql)
+    flats_db.clear_count_cache()
+    assert flats_db.count_search_results("", "", "") == before
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "SELECT * FROM sqlite_master LIMIT 10",
+        "SELECT * FROM hdb_metadata LIMIT 10",
+        "SELECT * FROM hdb_flats_fts LIMIT 10",
+    ],
+)
+def test_other_tables_are_refused(sandbox, sql):
+    with pytest.raises(QueryRejected):
+        sandbox.execute(sql)
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "SELECT * FROM hdb_flats",
+        "SELECT town FROM hdb_flats UNION ALL SELECT town FROM hdb_flats",
+        "SELECT COUNT(*) FROM hdb_flats a, hdb_flats b LIMIT 1",
+        "SELECT COUNT(*) FROM hdb_flats a JOIN hdb_flats b"
+        " ON a.street_name = b.street_name LIMIT 1",
+        # A LIMIT in a trailing comment bounds nothing
+        "SELECT COUNT(*) FROM hdb_flats a JOIN hdb_flats b"
+        " ON a.town = b.town -- LIMIT 10",
+        "SELECT * FROM hdb_flats /* LIMIT 10 */",
+        "SELECT * FROM hdb_flats; /* LIMIT 10",
+    ],
+)
+def test_unbounded_scans_are_refused(sandbox, sql):
+    with pytest.raises(QueryRejected):
+        sandbox.execute(sql)
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "SELECT * FROM hdb_flats LIMIT 10 -- ten is plenty",
+        "SELECT * FROM hdb_flats LIMIT 10 /* ten */;",
+        "SELECT * FROM hdb_flats WHERE block != '--' LIMIT 10",
+    ],
+)
+def test_comments_around_an_outer_limit_are_allowed(sandbox, sql):
+    assert len(sandbox.execute(sql)) == 10
+
+
+def test_queries_over_the_instruction_budget_are_aborted(flats_db):
+    sandbox = SqlSandbox(db=flats_db, instruction_budget=100000, time_budget=60)
+    with pytest.raises(QueryRejected, match="too much work"):
+        sandbox.execute(TOWN_PAIRS)
+
+
+def test_queries_over_the_time_budget_are_aborted(flats_db):
+    sandbox = SqlSandbox(db=flats_db, time_budget=0)
+    with pytest.raises(QueryRejected, match="too much work"):
+        sandbox.execute(TOWN_PAIRS)
+
+
+def test_connection_is_reusable_after_an_abort(flats_db):
+    sandbox = SqlSandbox(db=flats_db, instruction_budget=100000, pool_size=1)
+    with pytest.raises(QueryRejected):
+        sandbox.execute(TOWN_PAIRS)
+    assert len(sandbox.execute("SELECT id FROM hdb_flats LIMIT 5")) == 5